@@ -46,14 +46,14 @@ from django.forms.models import model_to_dict
 from tastypie.utils.mime import build_content_type
 
 from geonode import get_version, qgis_server, geoserver
-from geonode.layers.models import Layer
+from geonode.layers.models import Layer, Attribute
 from geonode.maps.models import Map
 from geonode.documents.models import Document
 from geonode.base.models import ResourceBase
 from geonode.base.models import HierarchicalKeyword
 from geonode.groups.models import GroupProfile
 from geonode.utils import check_ogc_backend
-from geonode.security.utils import get_visible_resources
+from geonode.security.utils import get_visible_resources, get_resources_with_perm
 from .authentication import OAuthAuthentication
 from .authorization import GeoNodeAuthorization, GeonodeApiKeyAuthentication
 
@@ -615,6 +615,16 @@ class CommonModelApi(ModelResource):
 
         return formatted_objects
 
+    def get_group_profiles(self, objects):
+        """
+        Returns the GroupProfiles of the objects groups, keyed by slug,
+        so that a page is resolved with a single query.
+        """
+        slugs = set([obj.group.name for obj in objects if obj.group])
+        if not slugs:
+            return {}
+        return dict((gp.slug, gp) for gp in GroupProfile.objects.filter(slug__in=slugs))
+
     def create_response(
             self,
             request,
@@ -633,9 +643,8 @@ class CommonModelApi(ModelResource):
         filtered_objects_ids = None
         try:
             if data['objects']:
-                filtered_objects_ids = [
-                    item.id for item in data['objects'] if request.user.has_perm(
-                        'view_resourcebase', item.get_self_resource())]
+                filtered_objects_ids = get_resources_with_perm(
+                    request.user, 'view_resourcebase', data['objects'])
         except BaseException:
             pass
 
@@ -737,6 +746,10 @@ class LayerResource(CommonModelApi):
         Formats the object.
         """
         formatted_objects = []
+        group_profiles = self.get_group_profiles(objects)
+        geometry_types = dict(Attribute.objects.filter(
+            layer__in=[obj.id for obj in objects],
+            attribute='the_geom').values_list('layer_id', 'attribute_type'))
         for obj in objects:
             # convert the object to a dict using the standard values.
             # includes other values
@@ -753,10 +766,7 @@ class LayerResource(CommonModelApi):
                 formatted_obj['category__gn_description'] = obj.category.gn_description
             if obj.group:
                 formatted_obj['group'] = obj.group
-                try:
-                    formatted_obj['group_name'] = GroupProfile.objects.get(slug=obj.group.name)
-                except GroupProfile.DoesNotExist:
-                    formatted_obj['group_name'] = obj.group
+                formatted_obj['group_name'] = group_profiles.get(obj.group.name, obj.group)
 
             formatted_obj['keywords'] = [k.name for k in obj.keywords.all()] if obj.keywords else []
             formatted_obj['regions'] = [r.name for r in obj.regions.all()] if obj.regions else []
@@ -780,12 +790,18 @@ class LayerResource(CommonModelApi):
             if hasattr(obj, 'storeType'):
                 formatted_obj['store_type'] = obj.storeType
                 if obj.storeType == 'remoteStore' and hasattr(obj, 'remote_service'):
+                    # remote_service is selected along with the layer, its
+                    # status is kept up to date by the probe_services task
                     if obj.remote_service:
-                        formatted_obj['online'] = (obj.remote_service.probe == 200)
+                        formatted_obj['online'] = obj.remote_service.is_online
                     else:
                         formatted_obj['online'] = False
 
-            formatted_obj['gtype'] = self.dehydrate_gtype(bundle)
+            if obj.id in geometry_types:
+                # return attribute type without 'gml:' and 'PropertyType'
+                formatted_obj['gtype'] = geometry_types[obj.id][4:-12]
+            else:
+                formatted_obj['gtype'] = None
 
             # replace thumbnail_url with curated_thumbs
             if hasattr(obj, 'curatedthumbnail'):
@@ -808,11 +824,15 @@ class LayerResource(CommonModelApi):
             'url'
         ]
 
-        links = obj.link_set.all()
-        if link_types:
-            links = links.filter(link_type__in=link_types)
-        for l in links:
-            formatted_link = model_to_dict(l, fields=link_fields)
+        # links are computed once per object for all the links fields,
+        # and filtered in memory to take advantage of prefetched links
+        links = getattr(obj, '_api_links', None)
+        if links is None:
+            links = obj._api_links = obj.get_links().all()
+        for link in links:
+            if link_types and link.link_type not in link_types:
+                continue
+            formatted_link = model_to_dict(link, fields=link_fields)
             dehydrated.append(formatted_link)
 
         return dehydrated
@@ -914,7 +934,11 @@ class LayerResource(CommonModelApi):
 
     class Meta(CommonMetaApi):
         paginator_class = CrossSiteXHRPaginator
-        queryset = Layer.objects.distinct().order_by('-date')
+        queryset = Layer.objects.distinct().select_related(
+            'owner', 'category', 'group', 'default_style', 'remote_service'
+        ).prefetch_related(
+            'keywords', 'regions', 'link_set', 'curatedthumbnail', 'styles'
+        ).order_by('-date')
         resource_name = 'layers'
         detail_uri_name = 'id'
         include_resource_uri = True
@@ -944,6 +968,7 @@ class MapResource(CommonModelApi):
         :param objects: Map objects
         """
         formatted_objects = []
+        group_profiles = self.get_group_profiles(objects)
         for obj in objects:
             # convert the object to a dict using the standard values.
             formatted_obj = model_to_dict(obj, fields=self.VALUES)
@@ -955,10 +980,7 @@ class MapResource(CommonModelApi):
                 formatted_obj['category__gn_description'] = obj.category.gn_description
             if obj.group:
                 formatted_obj['group'] = obj.group
-                try:
-                    formatted_obj['group_name'] = GroupProfile.objects.get(slug=obj.group.name)
-                except GroupProfile.DoesNotExist:
-                    formatted_obj['group_name'] = obj.group
+                formatted_obj['group_name'] = group_profiles.get(obj.group.name, obj.group)
 
             formatted_obj['keywords'] = [k.name for k in obj.keywords.all()] if obj.keywords else []
             formatted_obj['regions'] = [r.name for r in obj.regions.all()] if obj.regions else []
@@ -971,7 +993,7 @@ class MapResource(CommonModelApi):
             formatted_obj['online'] = True
 
             # get map layers
-            map_layers = obj.layers
+            map_layers = obj.layer_set.all()
             formatted_layers = []
             map_layer_fields = [
                 'id'
@@ -1005,7 +1027,11 @@ class MapResource(CommonModelApi):
 
     class Meta(CommonMetaApi):
         paginator_class = CrossSiteXHRPaginator
-        queryset = Map.objects.distinct().order_by('-date')
+        queryset = Map.objects.distinct().select_related(
+            'owner', 'category', 'group'
+        ).prefetch_related(
+            'keywords', 'regions', 'layer_set', 'curatedthumbnail'
+        ).order_by('-date')
         resource_name = 'maps'
         authentication = MultiAuthentication(SessionAuthentication(),
                                              OAuthAuthentication(),
@@ -1024,6 +1050,7 @@ class DocumentResource(CommonModelApi):
         :param objects: Map objects
         """
         formatted_objects = []
+        group_profiles = self.get_group_profiles(objects)
         for obj in objects:
             # convert the object to a dict using the standard values.
             formatted_obj = model_to_dict(obj, fields=self.VALUES)
@@ -1035,10 +1062,7 @@ class DocumentResource(CommonModelApi):
                 formatted_obj['category__gn_description'] = obj.category.gn_description
             if obj.group:
                 formatted_obj['group'] = obj.group
-                try:
-                    formatted_obj['group_name'] = GroupProfile.objects.get(slug=obj.group.name)
-                except GroupProfile.DoesNotExist:
-                    formatted_obj['group_name'] = obj.group
+                formatted_obj['group_name'] = group_profiles.get(obj.group.name, obj.group)
 
             formatted_obj['keywords'] = [k.name for k in obj.keywords.all()] if obj.keywords else []
             formatted_obj['regions'] = [r.name for r in obj.regions.all()] if obj.regions else []
@@ -1064,7 +1088,11 @@ class DocumentResource(CommonModelApi):
         paginator_class = CrossSiteXHRPaginator
         filtering = CommonMetaApi.filtering
         filtering.update({'doc_type': ALL})
-        queryset = Document.objects.distinct().order_by('-date')
+        queryset = Document.objects.distinct().select_related(
+            'owner', 'category', 'group'
+        ).prefetch_related(
+            'keywords', 'regions', 'curatedthumbnail'
+        ).order_by('-date')
         resource_name = 'documents'
         authentication = MultiAuthentication(SessionAuthentication(),
                                              OAuthAuthentication(),
@@ -193,6 +193,46 @@ class PermissionsApiTests(ResourceTestCaseMixin, GeoNodeBaseTestSupport):
             finally:
                 _ogc_geofence_enabled['default']['GEOFENCE_SECURITY_ENABLED'] = False
 
+    def test_page_permissions_resolved_in_bulk(self):
+        """Test that the permissions of a page cost the same queries whatever its size"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from geonode.security.utils import get_resources_with_perm
+
+        bobby = get_user_model().objects.get(username='bobby')
+        layer = Layer.objects.all()[0]
+        layer.set_permissions(self.perm_spec)
+        layers = list(Layer.objects.all())
+        expected = set([_l.id for _l in layers if bobby.has_perm('view_resourcebase', _l.get_self_resource())])
+        self.assertNotIn(layer.id, expected)
+
+        # warm up the content types cache
+        get_resources_with_perm(bobby, 'view_resourcebase', layers[:1])
+        perms_per_page = {}
+        for page_size in (1, len(layers)):
+            with CaptureQueriesContext(connection) as ctx:
+                permitted = get_resources_with_perm(bobby, 'view_resourcebase', layers[:page_size])
+            perms_per_page[page_size] = len(ctx.captured_queries)
+            self.assertEqual(permitted, expected & set([_l.id for _l in layers[:page_size]]))
+        self.assertEqual(perms_per_page[1], perms_per_page[len(layers)])
+
+    def test_layers_list_queries_do_not_grow_with_limit(self):
+        """Test that the layers list costs the same queries whatever its limit"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.api_client.client.login(username='bobby', password='bob')
+        # warm up caches (content types, sessions)
+        self.api_client.get(self.list_url + '?limit=1')
+        queries = {}
+        for limit in (1, 8):
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.api_client.get(self.list_url + '?limit={}'.format(limit))
+            self.assertValidJSONResponse(resp)
+            self.assertEquals(len(self.deserialize(resp)['objects']), limit)
+            queries[limit] = len(ctx.captured_queries)
+        self.assertEqual(queries[1], queries[8])
+
 
 class OAuthApiTests(ResourceTestCaseMixin, GeoNodeBaseTestSupport):
     def setUp(self):
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2019 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+"""Search facets.
+
+Counts of layers (by store type), maps and documents (by type) matching
+the search filters are computed with a single grouped query over
+ResourceBase, and cached per user visibility and filters until resources
+or permissions change.
+"""
+
+import json
+import time
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+FACETS_VERSION_KEY = 'geonode.base.facets_version'
+
+# search filters the facets depend on
+FILTER_PARAMS = (
+    'title__icontains',
+    'extent',
+    'keywords__slug__in',
+    'category__identifier__in',
+    'regions__name__in',
+    'owner__username__in',
+    'date__gte',
+    'date__lte',
+    'date__range',
+)
+
+
+def invalidate_facets(*args, **kwargs):
+    """Discard the cached facets of all users."""
+    cache.set(FACETS_VERSION_KEY, time.time(), None)
+
+
+def get_visibility_class(user):
+    """Return the key of the users seeing the same resources as user."""
+    if user is None or not user.is_authenticated():
+        return 'anonymous'
+    if user.is_superuser:
+        return 'superuser'
+    return 'user-%s' % user.id
+
+
+def _get_filters(params):
+    filters = {}
+    for param in FILTER_PARAMS:
+        values = [value for value in params.getlist(param) if value]
+        if values:
+            filters[param] = sorted(values)
+    return filters
+
+
+def _filter_resources(user, filters, facet_type):
+    from guardian.shortcuts import get_objects_for_user
+    from geonode.base.models import HierarchicalKeyword, ResourceBase
+    from geonode.security.utils import get_visible_resources
+
+    resources = ResourceBase.objects.filter(
+        title__icontains=filters.get('title__icontains', [''])[0])
+    if 'category__identifier__in' in filters:
+        resources = resources.filter(category__identifier__in=filters['category__identifier__in'])
+    if 'regions__name__in' in filters:
+        resources = resources.filter(regions__name__in=filters['regions__name__in'])
+    if 'owner__username__in' in filters:
+        resources = resources.filter(owner__username__in=filters['owner__username__in'])
+    if 'date__gte' in filters:
+        resources = resources.filter(date__gte=filters['date__gte'][0])
+    if 'date__lte' in filters:
+        resources = resources.filter(date__lte=filters['date__lte'][0])
+    if 'date__range' in filters:
+        resources = resources.filter(date__range=filters['date__range'][0].split(','))
+
+    resources = get_visible_resources(
+        resources,
+        user,
+        admin_approval_required=settings.ADMIN_MODERATE_UPLOADS,
+        unpublished_not_visible=settings.RESOURCE_PUBLISHING,
+        private_groups_not_visibile=settings.GROUP_PRIVATE_RESOURCES)
+
+    # documents facets never took the extent into account
+    if 'extent' in filters and facet_type != 'documents':
+        bbox = filters['extent'][0].split(
+            ',')  # TODO: Why is this different when done through haystack?
+        bbox = map(str, bbox)  # 2.6 compat - float to decimal conversion
+        intersects = ~(Q(bbox_x0__gt=bbox[2]) | Q(bbox_x1__lt=bbox[0]) |
+                       Q(bbox_y0__gt=bbox[3]) | Q(bbox_y1__lt=bbox[1]))
+        resources = resources.filter(intersects)
+
+    if 'keywords__slug__in' in filters:
+        treeqs = HierarchicalKeyword.objects.none()
+        for keyword in filters['keywords__slug__in']:
+            try:
+                kws = HierarchicalKeyword.objects.filter(name__iexact=keyword)
+                for kw in kws:
+                    treeqs = treeqs | HierarchicalKeyword.get_tree(kw)
+            except BaseException:
+                # Ignore keywords not actually used?
+                pass
+        resources = resources.filter(Q(keywords__in=treeqs))
+
+    if not settings.SKIP_PERMS_FILTER:
+        try:
+            authorized = get_objects_for_user(
+                user, 'base.view_resourcebase').values('id')
+        except BaseException:
+            authorized = []
+        resources = resources.filter(id__in=authorized)
+    return resources
+
+
+def _compute_facets(user, filters, facet_type):
+    from django.contrib.auth import get_user_model
+    from django.contrib.contenttypes.models import ContentType
+    from geonode.documents.models import Document
+    from geonode.groups.models import GroupProfile
+    from geonode.layers.models import Layer
+    from geonode.maps.models import Map
+
+    layer_type = ContentType.objects.get_for_model(Layer).id
+    map_type = ContentType.objects.get_for_model(Map).id
+    document_type = ContentType.objects.get_for_model(Document).id
+    if facet_type == 'documents':
+        types = [document_type]
+    elif facet_type == 'layers':
+        types = [layer_type]
+    else:
+        types = [layer_type, map_type, document_type]
+
+    # every resource falls in a single group, joins on keywords or
+    # regions are not counted twice
+    rows = _filter_resources(user, filters, facet_type).filter(
+        polymorphic_ctype_id__in=types
+    ).order_by().values(
+        'polymorphic_ctype_id', 'layer__storeType', 'layer__has_time', 'document__doc_type'
+    ).annotate(count=Count('id', distinct=True))
+
+    if facet_type == 'documents':
+        facets = {}
+        for row in rows:
+            facets[row['document__doc_type']] = facets.get(row['document__doc_type'], 0) + row['count']
+        return facets
+
+    store_counts = {}
+    vector_time = 0
+    maps = 0
+    documents = 0
+    for row in rows:
+        if row['polymorphic_ctype_id'] == layer_type:
+            store_type = row['layer__storeType']
+            store_counts[store_type] = store_counts.get(store_type, 0) + row['count']
+            if store_type == 'dataStore' and row['layer__has_time']:
+                vector_time += row['count']
+        elif row['polymorphic_ctype_id'] == map_type:
+            maps += row['count']
+        else:
+            documents += row['count']
+
+    facets = {
+        'raster': store_counts.get('coverageStore', 0),
+        'vector': store_counts.get('dataStore', 0),
+        'vector_time': vector_time,
+        'remote': store_counts.get('remoteStore', 0),
+        'wms': store_counts.get('wmsStore', 0),
+    }
+
+    # Break early if only_layers is set.
+    if facet_type == 'layers':
+        return facets
+
+    facets['map'] = maps
+    facets['document'] = documents
+
+    if facet_type == 'home':
+        facets['user'] = get_user_model().objects.exclude(
+            username='AnonymousUser').count()
+
+        facets['group'] = GroupProfile.objects.exclude(
+            access="private").count()
+
+        facets['layer'] = facets['raster'] + \
+            facets['vector'] + facets['remote'] + facets['wms']  # + facets['vector_time']
+    return facets
+
+
+def get_facets(user, params, facet_type='all'):
+    """Return the facets counts of the resources matching the search params.
+
+    ``params`` is the QueryDict of the search request. Results are cached
+    for ``FACETS_CACHE_TTL`` seconds per visibility class and filters.
+    """
+    filters = _get_filters(params)
+    ttl = getattr(settings, 'FACETS_CACHE_TTL', 60)
+    if not ttl:
+        return _compute_facets(user, filters, facet_type)
+
+    digest = hashlib.sha1(json.dumps([facet_type, sorted(filters.items())])).hexdigest()
+    key = 'geonode.base.facets:%s:%s:%s' % (
+        cache.get(FACETS_VERSION_KEY), get_visibility_class(user), digest)
+    facets = cache.get(key)
+    if facets is None:
+        facets = _compute_facets(user, filters, facet_type)
+        cache.set(key, facets, ttl)
+    return facets
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2019 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+"""Computed resource links.
+
+Standard links (OGC endpoints, downloads, legends...) can be derived from
+the resource attributes, so they are not stored in the database anymore.
+Link providers compute them on demand and results are memoized until the
+resource changes. Only custom and remote links are persisted as Link rows.
+"""
+
+import copy
+import logging
+import threading
+
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import translation
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_LINK_TYPES = ('image', 'data', 'original')
+OWS_LINK_TYPES = ('OGC:WMS', 'OGC:WFS', 'OGC:WCS')
+
+_link_providers = []
+_links_cache = OrderedDict()
+_links_cache_lock = threading.Lock()
+
+
+class LinkProvider(object):
+    """Base class for the providers computing the default links of a resource.
+
+       Subclasses return a hashable key from ``get_key``, changing whenever
+       the computed links would change, or None when they do not handle the
+       resource. ``get_links`` returns a list of unsaved Link objects.
+    """
+
+    def get_key(self, resource):
+        return None
+
+    def get_links(self, resource):
+        return []
+
+
+def register_link_provider(provider):
+    if provider not in _link_providers:
+        _link_providers.append(provider)
+
+
+def unregister_link_provider(provider):
+    if provider in _link_providers:
+        _link_providers.remove(provider)
+    clear_links_cache()
+
+
+def clear_links_cache():
+    with _links_cache_lock:
+        _links_cache.clear()
+
+
+def get_default_links(resource):
+    """Return the links computed by the registered providers for a resource."""
+    links = []
+    if not resource or not resource.pk:
+        return links
+
+    cache_size = getattr(settings, 'RESOURCE_LINKS_CACHE_SIZE', 1000)
+    for provider in _link_providers:
+        key = provider.get_key(resource)
+        if key is None:
+            continue
+        cache_key = (id(provider), resource.pk, translation.get_language())
+        with _links_cache_lock:
+            cached = _links_cache.pop(cache_key, None)
+            if cached is not None and cached[0] == key:
+                _links_cache[cache_key] = cached
+                links.extend(copy.copy(link) for link in cached[1])
+                continue
+        try:
+            provided = provider.get_links(resource)
+        except BaseException:
+            logger.exception("Could not compute the links of resource %s" % resource.pk)
+            continue
+        with _links_cache_lock:
+            _links_cache[cache_key] = (key, provided)
+            while len(_links_cache) > cache_size:
+                _links_cache.popitem(last=False)
+        links.extend(copy.copy(link) for link in provided)
+    return links
+
+
+class ResourceLinks(object):
+    """Read-only view over both the persisted and the computed links of a resource.
+
+       Computed links take precedence over persisted ones having the same
+       type and name, which may still be around for resources created
+       before links were computed.
+    """
+
+    def __init__(self, resource):
+        self.resource = resource
+        self._links = None
+
+    def all(self):
+        if self._links is None:
+            persisted = list(self.resource.link_set.all())
+            computed = get_default_links(self.resource)
+            replaced = set((link.link_type, link.name) for link in computed)
+            self._links = [
+                link for link in persisted if (link.link_type, link.name) not in replaced
+            ] + computed
+        return list(self._links)
+
+    def filter(self, link_types=None, names=None):
+        return [
+            link for link in self.all()
+            if (link_types is None or link.link_type in link_types) and
+            (names is None or link.name in names)
+        ]
+
+    def data(self):
+        return self.filter(link_types=('data',))
+
+    def image(self):
+        return self.filter(link_types=('image',))
+
+    def download(self):
+        return self.filter(link_types=DOWNLOAD_LINK_TYPES)
+
+    def metadata(self):
+        return self.filter(link_types=('metadata',))
+
+    def original(self):
+        return self.filter(link_types=('original',))
+
+    def ows(self):
+        return self.filter(link_types=OWS_LINK_TYPES)
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def __len__(self):
+        return len(self.all())
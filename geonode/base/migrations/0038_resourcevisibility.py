@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_visibility_index(apps, schema_editor):
+    ResourceBase = apps.get_model('base', 'ResourceBase')
+    ResourceVisibility = apps.get_model('base', 'ResourceVisibility')
+    GroupProfile = apps.get_model('groups', 'GroupProfile')
+    Group = apps.get_model('auth', 'Group')
+
+    group_flags = {}
+    for group_id, access in GroupProfile.objects.values_list('group_id', 'access'):
+        group_flags[group_id] = (access != 'private', access == 'private')
+    for group_id in Group.objects.filter(name='anonymous').values_list('id', flat=True):
+        group_flags[group_id] = (True, False)
+
+    rows = []
+    for resource in ResourceBase.objects.only(
+            'id', 'owner', 'group', 'is_published', 'dirty_state').iterator():
+        public_group, private_group = group_flags.get(resource.group_id, (False, False))
+        rows.append(ResourceVisibility(
+            resource_id=resource.id,
+            owner_id=resource.owner_id,
+            group_id=resource.group_id,
+            is_published=resource.is_published,
+            dirty_state=resource.dirty_state,
+            public_group=public_group,
+            private_group=private_group))
+        if len(rows) >= 1000:
+            ResourceVisibility.objects.bulk_create(rows)
+            rows = []
+    ResourceVisibility.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auth', '0006_require_contenttypes_0002'),
+        ('groups', '0028_auto_20180606_1543'),
+        ('base', '0030_resourcebase_created'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceVisibility',
+            fields=[
+                ('resource', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='visibility', serialize=False, to='base.ResourceBase')),
+                ('is_published', models.BooleanField(default=True)),
+                ('dirty_state', models.BooleanField(default=False)),
+                ('public_group', models.BooleanField(default=False)),
+                ('private_group', models.BooleanField(default=False)),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='auth.Group')),
+                ('owner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='resourcevisibility',
+            index_together=set([('dirty_state', 'is_published', 'public_group', 'private_group')]),
+        ),
+        migrations.RunPython(build_visibility_index, migrations.RunPython.noop),
+    ]
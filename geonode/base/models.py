@@ -48,9 +48,12 @@ from mptt.models import MPTTModel, TreeForeignKey
 from polymorphic.models import PolymorphicModel
 from polymorphic.managers import PolymorphicManager
 from agon_ratings.models import OverallRating
+from guardian.models import UserObjectPermission, GroupObjectPermission
 from imagekit.models import ImageSpecField
 from imagekit.processors import ResizeToFill
 
+from geonode.base.facets import invalidate_facets
+from geonode.base.links import ResourceLinks
 from geonode.base.enumerations import ALL_LANGUAGES, \
     HIERARCHY_LEVELS, UPDATE_FREQUENCIES, \
     DEFAULT_SUPPLEMENTAL_INFORMATION, LINK_TYPES
@@ -1042,10 +1045,14 @@ class ResourceBase(PolymorphicModel, PermissionLevelMixin, ItemBase):
             except BaseException:
                 pass
 
+    def get_links(self):
+        """Return both the persisted and the computed links of the resource."""
+        return ResourceLinks(self)
+
     def download_links(self):
         """assemble download links for pycsw"""
         links = []
-        for link in self.link_set.all():
+        for link in self.get_links().all():
             if link.link_type == 'metadata':  # avoid recursion
                 continue
             if link.link_type == 'html':
@@ -1071,28 +1078,13 @@ class ResourceBase(PolymorphicModel, PermissionLevelMixin, ItemBase):
     def get_tiles_url(self):
         """Return URL for Z/Y/X mapping clients or None if it does not exist.
         """
-        try:
-            tiles_link = self.link_set.get(name='Tiles')
-        except Link.DoesNotExist:
-            return None
-        else:
-            return tiles_link.url
+        tiles_links = self.get_links().filter(names=('Tiles',))
+        return tiles_links[0].url if tiles_links else None
 
     def get_legend(self):
         """Return Link for legend or None if it does not exist.
         """
-        try:
-            legends_link = self.link_set.filter(name='Legend')
-        except Link.DoesNotExist:
-            tb = traceback.format_exc()
-            logger.debug(tb)
-            return None
-        except Link.MultipleObjectsReturned:
-            tb = traceback.format_exc()
-            logger.debug(tb)
-            return None
-        else:
-            return legends_link
+        return self.get_links().filter(names=('Legend',))
 
     def get_legend_url(self, style_name=None):
         """Return URL for legend or None if it does not exist.
@@ -1102,27 +1094,21 @@ class ResourceBase(PolymorphicModel, PermissionLevelMixin, ItemBase):
         """
         legend = self.get_legend()
 
-        if legend is None:
+        if not legend:
             return None
 
-        if legend.count() > 0:
-            if not style_name:
-                return legend[0].url
-            else:
-                for _legend in legend:
-                    if style_name in _legend.url:
-                        return _legend.url
-        return legend.url
+        if not style_name:
+            return legend[0].url
+        for _legend in legend:
+            if style_name in _legend.url:
+                return _legend.url
+        return None
 
     def get_ows_url(self):
         """Return URL for OGC WMS server None if it does not exist.
         """
-        try:
-            ows_link = self.link_set.get(name='OGC:WMS')
-        except Link.DoesNotExist:
-            return None
-        else:
-            return ows_link.url
+        ows_links = self.get_links().filter(names=('OGC:WMS',))
+        return ows_links[0].url if ows_links else None
 
     def get_thumbnail_url(self):
         """Return a thumbnail url.
@@ -1433,6 +1419,69 @@ class CuratedThumbnail(models.Model):
                                    options={'quality': 60})
 
 
+class ResourceVisibility(models.Model):
+    """
+    Precomputed visibility flags of a ResourceBase.
+
+    ``get_visible_resources`` filters on these columns instead of
+    evaluating the group subqueries for every request. Rows are kept
+    up to date by the signal handlers below.
+    """
+    resource = models.OneToOneField(
+        ResourceBase,
+        primary_key=True,
+        related_name='visibility',
+        on_delete=models.CASCADE)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        blank=True,
+        null=True,
+        related_name='+',
+        on_delete=models.SET_NULL)
+    group = models.ForeignKey(
+        Group,
+        blank=True,
+        null=True,
+        related_name='+',
+        on_delete=models.SET_NULL)
+    is_published = models.BooleanField(default=True)
+    dirty_state = models.BooleanField(default=False)
+    # the resource group is the anonymous group or a non private GroupProfile
+    public_group = models.BooleanField(default=False)
+    # the resource group is a private GroupProfile
+    private_group = models.BooleanField(default=False)
+
+    class Meta:
+        index_together = (
+            ('dirty_state', 'is_published', 'public_group', 'private_group'),
+        )
+
+    def __unicode__(self):
+        return u"{0} visibility".format(self.resource_id)
+
+
+class SearchIndexUpdate(models.Model):
+    """
+    A pending search index update.
+
+    Saves and deletes of indexed objects are queued here, one row per
+    object, and applied in batches by the ``update_search_index`` task.
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    remove = models.BooleanField(default=False)
+    last_updated = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        unique_together = (('content_type', 'object_id'),)
+
+    def __unicode__(self):
+        return u"{0}.{1} {2}".format(
+            self.content_type.model,
+            self.object_id,
+            'remove' if self.remove else 'update')
+
+
 def resourcebase_post_save(instance, *args, **kwargs):
     """
     Used to fill any additional fields after the save.
@@ -1531,4 +1580,33 @@ def rating_post_save(instance, *args, **kwargs):
         rating=instance.rating)
 
 
+def visibility_post_save(instance, *args, **kwargs):
+    """
+    Keeps the ResourceVisibility index aligned with publishing,
+    ownership, group and dirty state changes of any ResourceBase.
+    """
+    if isinstance(instance, ResourceBase):
+        from geonode.security.utils import update_visibility_index
+        try:
+            update_visibility_index([instance])
+        except BaseException:
+            tb = traceback.format_exc()
+            logger.debug(tb)
+
+
+def facets_post_change(instance, *args, **kwargs):
+    """
+    Discards cached search facets when a resource changes.
+    """
+    if isinstance(instance, ResourceBase):
+        invalidate_facets()
+
+
 signals.post_save.connect(rating_post_save, sender=OverallRating)
+signals.post_save.connect(visibility_post_save)
+signals.post_save.connect(facets_post_change)
+signals.post_delete.connect(facets_post_change)
+signals.post_save.connect(invalidate_facets, sender=UserObjectPermission)
+signals.post_delete.connect(invalidate_facets, sender=UserObjectPermission)
+signals.post_save.connect(invalidate_facets, sender=GroupObjectPermission)
+signals.post_delete.connect(invalidate_facets, sender=GroupObjectPermission)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2019 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+from django.db.models import signals
+from haystack.exceptions import NotHandled
+from haystack.signals import BaseSignalProcessor
+
+from geonode.base.utils import enqueue_search_index_update
+
+
+class QueuedSignalProcessor(BaseSignalProcessor):
+    """
+    Haystack signal processor which queues the saved and deleted objects
+    instead of updating the search index within the request.
+
+    The queue is consumed in batches by the ``update_search_index`` task.
+    """
+
+    def setup(self):
+        signals.post_save.connect(self.handle_save)
+        signals.post_delete.connect(self.handle_delete)
+
+    def teardown(self):
+        signals.post_save.disconnect(self.handle_save)
+        signals.post_delete.disconnect(self.handle_delete)
+
+    def _is_indexed(self, sender, instance):
+        for using in self.connection_router.for_write(instance=instance):
+            try:
+                self.connections[using].get_unified_index().get_index(sender)
+                return True
+            except NotHandled:
+                pass
+        return False
+
+    def handle_save(self, sender, instance, **kwargs):
+        if self._is_indexed(sender, instance):
+            enqueue_search_index_update(instance)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        if self._is_indexed(sender, instance):
+            enqueue_search_index_update(instance, remove=True)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2019 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.timezone import now
+
+from geonode.celery_app import app
+from celery.utils.log import get_task_logger
+
+from .models import SearchIndexUpdate
+
+logger = get_task_logger(__name__)
+
+
+def _apply_search_index_updates(model, update_ids, remove_ids):
+    from haystack import connection_router, connections
+    from haystack.exceptions import NotHandled
+
+    for using in connection_router.for_write():
+        try:
+            index = connections[using].get_unified_index().get_index(model)
+        except NotHandled:
+            continue
+        backend = connections[using].get_backend()
+        if update_ids:
+            objects = list(index.index_queryset(using=using).filter(pk__in=update_ids))
+            if objects:
+                backend.update(index, objects)
+            # objects which are no more indexable must leave the index
+            remove_ids = set(remove_ids) | (set(update_ids) - set([o.pk for o in objects]))
+        for pk in remove_ids:
+            backend.remove('{}.{}.{}'.format(
+                model._meta.app_label, model._meta.model_name, pk))
+
+
+@app.task(bind=True, queue='update')
+def update_search_index(self):
+    """
+    Applies the queued search index updates in batches.
+    """
+    batch_size = getattr(settings, 'HAYSTACK_QUEUE_BATCH_SIZE', 200)
+    started = now()
+    processed = 0
+    while True:
+        pending = list(SearchIndexUpdate.objects.filter(
+            last_updated__lte=started).select_related('content_type').order_by('id')[:batch_size])
+        if not pending:
+            break
+        batches = defaultdict(lambda: ([], []))
+        for entry in pending:
+            update_ids, remove_ids = batches[entry.content_type]
+            (remove_ids if entry.remove else update_ids).append(entry.object_id)
+        for content_type, (update_ids, remove_ids) in batches.items():
+            model = content_type.model_class()
+            if model is not None:
+                _apply_search_index_updates(model, update_ids, remove_ids)
+        # entries touched meanwhile are kept for the next round
+        SearchIndexUpdate.objects.filter(
+            id__in=[entry.id for entry in pending],
+            last_updated__lte=started).delete()
+        processed += len(pending)
+    logger.debug("Applied {} search index updates".format(processed))
+    # entries touched while running have no task scheduled for them
+    if SearchIndexUpdate.objects.exists():
+        self.apply_async(countdown=getattr(settings, 'HAYSTACK_QUEUE_DEBOUNCE', 10))
+    return processed
@@ -20,7 +20,7 @@
 
 from geonode.tests.base import GeoNodeBaseTestSupport
 from geonode.base.models import (
-    ResourceBase, MenuPlaceholder, Menu, MenuItem
+    ResourceBase, MenuPlaceholder, Menu, MenuItem, SearchIndexUpdate
 )
 from django.template import Template, Context
 
@@ -441,3 +441,149 @@ class RenderMenuTagTest(GeoNodeBaseTestSupport):
                 self.menu_item_1_0_1.title
             )
         )
+
+
+class SearchIndexQueueTest(GeoNodeBaseTestSupport):
+
+    def test_updates_are_coalesced_per_object(self):
+        from mock import patch
+        from django.core.cache import cache
+        from geonode.base.tasks import update_search_index
+        from geonode.base.utils import enqueue_search_index_update
+
+        rb = ResourceBase.objects.create()
+        other = ResourceBase.objects.create()
+        SearchIndexUpdate.objects.all().delete()
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}), \
+                patch.object(update_search_index, 'apply_async') as apply_async:
+            cache.clear()
+            for i in range(3):
+                enqueue_search_index_update(rb)
+            self.assertEqual(SearchIndexUpdate.objects.filter(object_id=rb.id).count(), 1)
+            self.assertFalse(SearchIndexUpdate.objects.get(object_id=rb.id).remove)
+
+            enqueue_search_index_update(rb, remove=True)
+            self.assertEqual(SearchIndexUpdate.objects.filter(object_id=rb.id).count(), 1)
+            self.assertTrue(SearchIndexUpdate.objects.get(object_id=rb.id).remove)
+
+            # a single flush is scheduled per debounce period
+            enqueue_search_index_update(other)
+            self.assertEqual(apply_async.call_count, 1)
+
+    def test_updates_are_not_rescheduled_without_cache(self):
+        from mock import patch
+        from geonode.base.tasks import update_search_index
+        from geonode.base.utils import enqueue_search_index_update
+
+        rb = ResourceBase.objects.create()
+        SearchIndexUpdate.objects.all().delete()
+        with patch.object(update_search_index, 'apply_async') as apply_async:
+            for i in range(3):
+                enqueue_search_index_update(rb)
+        self.assertEqual(apply_async.call_count, 1)
+
+
+class ResourceLinksTest(GeoNodeBaseTestSupport):
+
+    def test_computed_links_replace_persisted_ones(self):
+        from geonode.base.models import Link
+        from geonode.base.links import (
+            LinkProvider, register_link_provider, unregister_link_provider)
+
+        class CountingProvider(LinkProvider):
+            calls = 0
+
+            def get_key(self, resource):
+                return resource.last_updated
+
+            def get_links(self, resource):
+                self.calls += 1
+                return [Link(resource_id=resource.pk, link_type='OGC:WMS', name='WMS',
+                             extension='html', mime='text/html', url='http://example.org/ows')]
+
+        rb = ResourceBase.objects.create()
+        Link.objects.create(resource=rb, link_type='OGC:WMS', name='WMS',
+                            extension='html', mime='text/html', url='http://stale.org/ows')
+        Link.objects.create(resource=rb, link_type='metadata', name='ISO',
+                            extension='xml', mime='text/xml', url='http://example.org/iso')
+
+        provider = CountingProvider()
+        register_link_provider(provider)
+        try:
+            links = rb.get_links()
+            self.assertEqual([link.url for link in links.ows()], ['http://example.org/ows'])
+            self.assertEqual([link.name for link in links.metadata()], ['ISO'])
+            self.assertEqual(len(links.download()), 0)
+
+            # links are memoized until the resource changes
+            rb.get_links().ows()[0].url = 'http://changed.org'
+            self.assertEqual(rb.get_links().ows()[0].url, 'http://example.org/ows')
+            self.assertEqual(provider.calls, 1)
+            rb.save()
+            rb.get_links().all()
+            self.assertEqual(provider.calls, 2)
+        finally:
+            unregister_link_provider(provider)
+
+
+class FacetsTest(GeoNodeBaseTestSupport):
+
+    def test_facets_match_resource_counts(self):
+        from django.contrib.auth import get_user_model
+        from django.http import QueryDict
+        from geonode.base.facets import get_facets
+        from geonode.documents.models import Document
+        from geonode.layers.models import Layer
+        from geonode.maps.models import Map
+
+        admin = get_user_model().objects.filter(is_superuser=True).first()
+        facets = get_facets(admin, QueryDict(''), facet_type='home')
+        self.assertEqual(facets['map'], Map.objects.count())
+        self.assertEqual(facets['document'], Document.objects.count())
+        self.assertEqual(facets['vector'], Layer.objects.filter(storeType='dataStore').count())
+        self.assertEqual(facets['raster'], Layer.objects.filter(storeType='coverageStore').count())
+        self.assertEqual(facets['vector_time'],
+                         Layer.objects.filter(storeType='dataStore', has_time=True).count())
+        self.assertEqual(facets['layer'], Layer.objects.count())
+
+        documents = get_facets(admin, QueryDict(''), facet_type='documents')
+        self.assertEqual(sum(documents.values()), Document.objects.count())
+
+        title = Map.objects.first().title
+        facets = get_facets(admin, QueryDict('title__icontains=%s' % title), facet_type='all')
+        self.assertEqual(facets['map'], Map.objects.filter(title__icontains=title).count())
+
+    def test_facets_are_cached_until_resources_change(self):
+        from django.contrib.auth import get_user_model
+        from django.http import QueryDict
+        from geonode.base.facets import get_facets
+        from geonode.maps.models import Map
+
+        admin = get_user_model().objects.filter(is_superuser=True).first()
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            count = get_facets(admin, QueryDict(''))['map']
+            with self.assertNumQueries(0):
+                self.assertEqual(get_facets(admin, QueryDict(''))['map'], count)
+            Map.objects.first().delete()
+            self.assertEqual(get_facets(admin, QueryDict(''))['map'], count - 1)
+
+    def test_facets_are_invalidated_by_group_membership(self):
+        from django.contrib.auth import get_user_model
+        from django.core.cache import cache
+        from geonode.base.facets import FACETS_VERSION_KEY
+        from geonode.groups.models import GroupProfile
+
+        user = get_user_model().objects.create(username='facets_member')
+        group = GroupProfile.objects.create(title='Facets', slug='facets')
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            cache.set(FACETS_VERSION_KEY, 0, None)
+            group.join(user, role='member')
+            self.assertNotEqual(cache.get(FACETS_VERSION_KEY), 0)
+
+            cache.set(FACETS_VERSION_KEY, 0, None)
+            user.groups.remove(group.group)
+            self.assertNotEqual(cache.get(FACETS_VERSION_KEY), 0)
+
+            cache.set(FACETS_VERSION_KEY, 0, None)
+            group.groupmember_set.all().delete()
+            self.assertNotEqual(cache.get(FACETS_VERSION_KEY), 0)
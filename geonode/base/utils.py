@@ -27,9 +27,12 @@ import logging
 
 # Django functionality
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 
 # Geonode functionality
 from geonode.documents.models import ResourceBase
+from geonode.base.models import SearchIndexUpdate
 
 logger = logging.getLogger('geonode.base.utils')
 
@@ -51,3 +54,26 @@ def delete_orphaned_thumbs():
             except OSError:
                 print 'Could not delete file %s' % fn
                 logger.error('Could not delete file %s' % fn)
+
+
+SEARCH_INDEX_FLUSH_KEY = 'geonode.base.search_index_flush'
+
+
+def enqueue_search_index_update(instance, remove=False):
+    """
+    Queues a search index update (or removal) for the given instance.
+
+    Updates are coalesced per object and a single debounced
+    ``update_search_index`` task is scheduled to apply them in batches.
+    Objects already queued are applied by the task scheduled for them, so
+    tasks are scheduled for new entries only, at most once per debounce
+    period when the cache is shared.
+    """
+    entry, created = SearchIndexUpdate.objects.update_or_create(
+        content_type=ContentType.objects.get_for_model(instance),
+        object_id=instance.pk,
+        defaults={'remove': remove})
+    debounce = getattr(settings, 'HAYSTACK_QUEUE_DEBOUNCE', 10)
+    if created and cache.add(SEARCH_INDEX_FLUSH_KEY, True, debounce):
+        from geonode.base.tasks import update_search_index
+        update_search_index.apply_async(countdown=debounce)
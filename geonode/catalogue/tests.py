@@ -22,8 +22,11 @@ from geonode.tests.base import GeoNodeBaseTestSupport
 
 import json
 from django.core.urlresolvers import reverse
+from guardian.shortcuts import get_objects_for_user
+from guardian.utils import get_anonymous_user
 from geonode.base.models import ResourceBase
 from geonode.catalogue import get_catalogue
+from geonode.catalogue.views import _as_sql_subquery
 
 
 class CatalogueTest(GeoNodeBaseTestSupport):
@@ -63,3 +66,14 @@ class CatalogueTest(GeoNodeBaseTestSupport):
         for record in data_json:
             self.assertEquals(record_keys, record.keys(),
                               'Expected specific list of fields to output')
+
+    def test_csw_authorization_subquery(self):
+        """Test that the CSW authorization filter is rendered as a subquery"""
+
+        authorized = get_objects_for_user(
+            get_anonymous_user(), 'base.view_resourcebase').order_by().values('id')
+        authorized_filter = "id IN ({})".format(_as_sql_subquery(authorized))
+        self.assertIn("SELECT", authorized_filter)
+        self.assertEqual(
+            set(ResourceBase.objects.extra(where=[authorized_filter]).values_list('id', flat=True)),
+            set(authorized.values_list('id', flat=True)))
@@ -40,6 +40,28 @@ from django.db import connection
 from django.core.exceptions import ObjectDoesNotExist
 
 
+def _quote_sql_param(value):
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, long, float)):
+        return str(value)
+    return "'{}'".format(unicode(value).replace("'", "''"))
+
+
+def _as_sql_subquery(queryset):
+    """
+    Renders a queryset as literal SQL, to be embedded as a subquery in the
+    pycsw repository filter which doesn't accept query parameters.
+    """
+    sql, params = queryset.query.sql_with_params()
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            return cursor.cursor.mogrify(sql, params)
+    return sql % tuple(_quote_sql_param(param) for param in params)
+
+
 @csrf_exempt
 def csw_global_dispatch(request):
     """pycsw wrapper"""
@@ -75,33 +97,24 @@ def csw_global_dispatch(request):
     mdict_filter = mdict['repository']['filter']
 
     try:
-        # Filter out Layers not accessible to the User
-        authorized_ids = []
+        # Filter out Layers not accessible to the User. Permissions are
+        # pushed down to the database as a subquery, so the filter doesn't
+        # grow with the number of visible resources
+        authorized_layers_filter = "id = -9999"
         if request.user:
             profiles = Profile.objects.filter(username=str(request.user))
         else:
             profiles = Profile.objects.filter(username="AnonymousUser")
         if profiles:
-            authorized = list(
-                get_objects_for_user(
-                    profiles[0],
-                    'base.view_resourcebase').values('id'))
-            layers = ResourceBase.objects.filter(
-                id__in=[d['id'] for d in authorized])
-            if layers:
-                authorized_ids = [d['id'] for d in authorized]
-
-        if len(authorized_ids) > 0:
-            authorized_layers = "(" + (", ".join(str(e)
-                                                 for e in authorized_ids)) + ")"
-            authorized_layers_filter = "id IN " + authorized_layers
-            mdict['repository']['filter'] += " AND " + authorized_layers_filter
-            if request.user and request.user.is_authenticated():
-                mdict['repository']['filter'] = "({}) OR ({})".format(mdict['repository']['filter'],
-                                                                      authorized_layers_filter)
-        else:
-            authorized_layers_filter = "id = -9999"
-            mdict['repository']['filter'] += " AND " + authorized_layers_filter
+            authorized = get_objects_for_user(
+                profiles[0],
+                'base.view_resourcebase').order_by().values('id')
+            authorized_layers_filter = "id IN ({})".format(_as_sql_subquery(authorized))
+
+        mdict['repository']['filter'] += " AND " + authorized_layers_filter
+        if profiles and request.user and request.user.is_authenticated():
+            mdict['repository']['filter'] = "({}) OR ({})".format(mdict['repository']['filter'],
+                                                                  authorized_layers_filter)
 
         # Filter out Documents and Maps
         if 'ALTERNATES_ONLY' in settings.CATALOGUE['default'] and settings.CATALOGUE['default']['ALTERNATES_ONLY']:
@@ -130,21 +143,12 @@ def csw_global_dispatch(request):
                         groups_ids.append(group.id)
 
             public_groups = GroupProfile.objects.exclude(
-                access="private").values('group')
-            for group in public_groups:
-                if isinstance(group, dict):
-                    if 'group' in group:
-                        groups_ids.append(group['group'])
-                else:
-                    groups_ids.append(group.id)
-
+                access="private").order_by().values('group')
+            groups_filter = "group_id IS NULL OR group_id IN ({})".format(_as_sql_subquery(public_groups))
             if len(groups_ids) > 0:
-                groups = "(" + (", ".join(str(e) for e in groups_ids)) + ")"
-                groups_filter = "(group_id IS NULL OR group_id IN " + groups + ")"
-                mdict['repository']['filter'] += " AND " + groups_filter
-            else:
-                groups_filter = "group_id IS NULL"
-                mdict['repository']['filter'] += " AND " + groups_filter
+                groups = ", ".join(str(int(e)) for e in set(groups_ids))
+                groups_filter += " OR group_id IN (" + groups + ")"
+            mdict['repository']['filter'] += " AND (" + groups_filter + ")"
 
         csw = server.Csw(mdict, env, version='2.0.2')
 
@@ -235,7 +239,7 @@ def data_json(request):
             record['accessLevel'] = 'non-public'
 
         record['distribution'] = []
-        for link in resource.link_set.all():
+        for link in resource.get_links().all():
             record['distribution'].append({
                 'accessURL': link.url,
                 'format': link.mime
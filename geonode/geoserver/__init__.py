@@ -85,6 +85,10 @@ class GeoserverAppConfig(NotificationsAppConfigBase):
         # method to update links for each resource
         from django.db.models import signals
         signals.post_migrate.connect(set_resource_links, sender=self)
+        # Default OGC links of the GeoServer layers are computed on demand
+        from geonode.base.links import register_link_provider
+        from geonode.geoserver.links import GeoServerLinkProvider
+        register_link_provider(GeoServerLinkProvider())
 
 
 default_app_config = 'geonode.geoserver.GeoserverAppConfig'
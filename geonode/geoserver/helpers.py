@@ -21,7 +21,9 @@ from collections import namedtuple, defaultdict
 import datetime
 from decimal import Decimal
 import errno
+import hashlib
 from itertools import cycle, izip
+from multiprocessing.pool import ThreadPool
 import json
 import logging
 import traceback
@@ -42,6 +44,7 @@ from dialogos.models import Comment
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
 from django.db.models.signals import pre_delete
 from django.template.loader import render_to_string
 from django.utils import timezone
@@ -64,6 +67,7 @@ from geonode.layers.models import Layer, Attribute, Style
 from geonode.layers.enumerations import LAYER_ATTRIBUTE_NUMERIC_DATA_TYPES
 from geonode.security.views import _perms_info_json
 from geonode.security.utils import set_geowebcache_invalidate_cache
+from geonode.geoserver.thumbnails import compose_thumbnail
 import xml.etree.ElementTree as ET
 from django.utils.module_loading import import_string
 
@@ -547,11 +551,17 @@ def gs_slurp(
         skip_geonode_registered=False,
         remove_deleted=False,
         permissions=None,
-        execute_signals=False):
+        execute_signals=False,
+        incremental=False,
+        workers=1):
     """Configure the layers available in GeoServer in GeoNode.
 
        It returns a list of dictionaries with the name of the layer,
        the result of the operation and the errors and traceback if it failed.
+
+       With ``incremental``, the layers whose GeoServer resource did not change
+       since their last sync (see ``get_resource_fingerprint``) are skipped.
+       The resources are processed by ``workers`` concurrent threads.
     """
     if console is None:
         console = open(os.devnull, 'w')
@@ -613,7 +623,7 @@ def gs_slurp(
         resources = [k for k in resources if k.advertised in ["true", True]]
 
     # filter out layers already registered in geonode
-    layer_names = Layer.objects.all().values_list('alternate', flat=True)
+    layer_names = set(Layer.objects.all().values_list('alternate', flat=True))
     if skip_geonode_registered:
         resources = [k for k in resources
                      if not '%s:%s' % (k.workspace.name, k.name) in layer_names]
@@ -632,89 +642,68 @@ def gs_slurp(
             'updated': 0,
             'created': 0,
             'deleted': 0,
+            'unchanged': 0,
         },
         'layers': [],
         'deleted_layers': []
     }
     start = datetime.datetime.now(timezone.get_current_timezone())
-    for i, resource in enumerate(resources):
-        name = resource.name
-        the_store = resource.store
-        workspace = the_store.workspace
-        try:
-            layer, created = Layer.objects.get_or_create(name=name, workspace=workspace.name, defaults={
-                # "workspace": workspace.name,
-                "store": the_store.name,
-                "storeType": the_store.resource_type,
-                "alternate": "%s:%s" % (workspace.name.encode('utf-8'), resource.name.encode('utf-8')),
-                "title": resource.title or 'No title provided',
-                "abstract": resource.abstract or unicode(_('No abstract provided')).encode('utf-8'),
-                "owner": owner,
-                "uuid": str(uuid.uuid4()),
-                "bbox_x0": Decimal(resource.native_bbox[0]),
-                "bbox_x1": Decimal(resource.native_bbox[1]),
-                "bbox_y0": Decimal(resource.native_bbox[2]),
-                "bbox_y1": Decimal(resource.native_bbox[3]),
-                "srid": resource.projection
-            })
 
-            # sync permissions in GeoFence
-            perm_spec = json.loads(_perms_info_json(layer))
-            layer.set_permissions(perm_spec)
-
-            # recalculate the layer statistics
-            set_attributes_from_geoserver(layer, overwrite=True)
-
-            # in some cases we need to explicitily save the resource to execute the signals
-            # (for sure when running updatelayers)
-            if execute_signals:
-                layer.save()
-
-            # Fix metadata links if the ip has changed
-            if layer.link_set.metadata().count() > 0:
-                if not created and settings.SITEURL not in layer.link_set.metadata()[0].url:
-                    layer.link_set.metadata().delete()
-                    layer.save()
-                    metadata_links = []
-                    for link in layer.link_set.metadata():
-                        metadata_links.append((link.mime, link.name, link.url))
-                    resource.metadata_links = metadata_links
-                    cat.save(resource)
+    fingerprints = {}
+    if incremental:
+        from .models import LayerFingerprint
+        fingerprints = dict(
+            ((name, workspace), fingerprint) for name, workspace, fingerprint in
+            LayerFingerprint.objects.values_list('layer__name', 'layer__workspace', 'fingerprint'))
 
-        except Exception as e:
-            if ignore_errors:
-                status = 'failed'
-                exception_type, error, traceback = sys.exc_info()
-            else:
+    def _slurp(resource):
+        name = resource.name
+        info = {'name': name}
+        try:
+            fingerprint = get_resource_fingerprint(resource)
+            if incremental and fingerprints.get((name, resource.store.workspace.name)) == fingerprint:
+                info['status'] = 'unchanged'
+                return info
+            layer, created = _slurp_resource(cat, resource, owner, permissions, execute_signals)
+            if incremental:
+                from .models import LayerFingerprint
+                LayerFingerprint.objects.update_or_create(layer=layer, defaults={'fingerprint': fingerprint})
+            info['status'] = 'created' if created else 'updated'
+        except Exception:
+            info['status'] = 'failed'
+            info['exception_type'], info['error'], info['traceback'] = sys.exc_info()
+        finally:
+            if workers > 1:
+                # worker threads have their own db connections
+                connection.close()
+        return info
+
+    pool = None
+    if workers > 1 and number > 1:
+        pool = ThreadPool(min(workers, number))
+        results = pool.imap(_slurp, resources)
+    else:
+        results = (_slurp(resource) for resource in resources)
+    try:
+        for i, info in enumerate(results):
+            status = info['status']
+            if status == 'failed' and not ignore_errors:
+                if pool:
+                    pool.terminate()
                 if verbosity > 0:
                     msg = "Stopping process because --ignore-errors was not set and an error was found."
                     print >> sys.stderr, msg
                 raise Exception(
                     'Failed to process %s' %
-                    resource.name.encode('utf-8'), e), None, sys.exc_info()[2]
-        else:
-            if created:
-                if not permissions:
-                    layer.set_default_permissions()
-                else:
-                    layer.set_permissions(permissions)
-
-                status = 'created'
-                output['stats']['created'] += 1
-            else:
-                status = 'updated'
-                output['stats']['updated'] += 1
-
-        msg = "[%s] Layer %s (%d/%d)" % (status, name, i + 1, number)
-        info = {'name': name, 'status': status}
-        if status == 'failed':
-            output['stats']['failed'] += 1
-            info['traceback'] = traceback
-            info['exception_type'] = exception_type
-            info['error'] = error
-        output['layers'].append(info)
-        if verbosity > 0:
-            print >> console, msg
+                    info['name'].encode('utf-8'), info['error']), None, info['traceback']
+            output['stats'][status] += 1
+            output['layers'].append(info)
+            if verbosity > 0:
+                msg = "[%s] Layer %s (%d/%d)" % (status, info['name'], i + 1, number)
+                print >> console, msg
+    finally:
+        if pool:
+            pool.close()
 
     if remove_deleted:
         q = Layer.objects.filter()
@@ -740,6 +729,9 @@ def gs_slurp(
         # filtered per options passed to updatelayers: --workspace, --store, --skip-unadvertised
         # add any layers not found in GeoServer to deleted_layers (must match
         # workspace and store as well):
+        geoserver_layers = set(
+            (resource.name, resource.workspace.name, resource.store.name)
+            for resource in resources_for_delete_compare)
         deleted_layers = []
         for layer in q:
             logger.debug(
@@ -747,19 +739,7 @@ def gs_slurp(
                 layer.name,
                 layer.workspace,
                 layer.store)
-            layer_found_in_geoserver = False
-            for resource in resources_for_delete_compare:
-                # if layer.name matches a GeoServer resource, check also that
-                # workspace and store match, mark valid:
-                if layer.name == resource.name:
-                    if layer.workspace == resource.workspace.name and layer.store == resource.store.name:
-                        logger.debug(
-                            "Matches GeoServer layer: name: %s, workspace: %s, store: %s",
-                            resource.name,
-                            resource.workspace.name,
-                            resource.store.name)
-                        layer_found_in_geoserver = True
-            if not layer_found_in_geoserver:
+            if (layer.name, layer.workspace, layer.store) not in geoserver_layers:
                 logger.debug(
                     "----- Layer %s not matched, marked for deletion ---------------",
                     layer.name)
@@ -791,7 +771,7 @@ def gs_slurp(
                 layer.delete()
                 output['stats']['deleted'] += 1
                 status = "delete_succeeded"
-            except Exception as e:
+            except Exception:
                 status = "delete_failed"
             finally:
                 from .signals import geoserver_pre_delete
@@ -818,6 +798,69 @@ def gs_slurp(
     return output
 
 
+def get_resource_fingerprint(resource):
+    """Returns a hash of the REST representation of a GeoServer resource
+    """
+    if resource.dom is None:
+        resource.fetch()
+    fingerprint = hashlib.sha1(ET.tostring(resource.dom))
+    fingerprint.update(resource.store.name.encode('utf-8'))
+    return fingerprint.hexdigest()
+
+
+def _slurp_resource(cat, resource, owner=None, permissions=None, execute_signals=False):
+    """Creates or updates the GeoNode layer of a GeoServer resource
+    """
+    name = resource.name
+    the_store = resource.store
+    workspace = the_store.workspace
+    layer, created = Layer.objects.get_or_create(name=name, workspace=workspace.name, defaults={
+        # "workspace": workspace.name,
+        "store": the_store.name,
+        "storeType": the_store.resource_type,
+        "alternate": "%s:%s" % (workspace.name.encode('utf-8'), resource.name.encode('utf-8')),
+        "title": resource.title or 'No title provided',
+        "abstract": resource.abstract or unicode(_('No abstract provided')).encode('utf-8'),
+        "owner": owner,
+        "uuid": str(uuid.uuid4()),
+        "bbox_x0": Decimal(resource.native_bbox[0]),
+        "bbox_x1": Decimal(resource.native_bbox[1]),
+        "bbox_y0": Decimal(resource.native_bbox[2]),
+        "bbox_y1": Decimal(resource.native_bbox[3]),
+        "srid": resource.projection
+    })
+
+    # sync permissions in GeoFence
+    perm_spec = json.loads(_perms_info_json(layer))
+    layer.set_permissions(perm_spec)
+
+    # recalculate the layer statistics
+    set_attributes_from_geoserver(layer, overwrite=True)
+
+    # in some cases we need to explicitily save the resource to execute the signals
+    # (for sure when running updatelayers)
+    if execute_signals:
+        layer.save()
+
+    # Fix metadata links if the ip has changed
+    if layer.link_set.metadata().count() > 0:
+        if not created and settings.SITEURL not in layer.link_set.metadata()[0].url:
+            layer.link_set.metadata().delete()
+            layer.save()
+            metadata_links = []
+            for link in layer.link_set.metadata():
+                metadata_links.append((link.mime, link.name, link.url))
+            resource.metadata_links = metadata_links
+            cat.save(resource)
+
+    if created:
+        if not permissions:
+            layer.set_default_permissions()
+        else:
+            layer.set_permissions(permissions)
+    return layer, created
+
+
 def get_stores(store_type=None):
     cat = Catalog(ogc_server_settings.internal_rest, _user, _password)
     stores = cat.get_stores()
@@ -1999,12 +2042,6 @@ def _prepare_thumbnail_body_from_opts(request_body, request=None):
         if image is not None:
             return image
 
-        # Defaults
-        _img_src_template = """<img src='{ogc_location}'
-        style='width: {width}px; height: {height}px;
-        left: {left}px; top: {top}px;
-        opacity: 1; visibility: inherit; position: absolute;'/>\n"""
-
         def decimal_encode(bbox):
             import decimal
             _bbox = []
@@ -2127,22 +2164,21 @@ def _prepare_thumbnail_body_from_opts(request_body, request=None):
             first_row.append(tmp_tile)
             width_acc += 256
             _n_step = _n_step + 1
-        # Build Image Request Template
-        _img_request_template = "<div style='height:{height}px; width:{width}px;'>\
-            <div style='position: absolute; top:{top}px; left:{left}px; z-index: 749; \
-            transform: translate3d(0px, 0px, 0px) scale3d(1, 1, 1);'> \
-            \n".format(height=height, width=width, top=top, left=left)
+        # Tiles are fetched from the backend rather than through the public URL
+        if thumbnail_create_url and thumbnail_create_url.startswith(ogc_server_settings.public_url):
+            thumbnail_create_url = ogc_server_settings.LOCATION + \
+                thumbnail_create_url[len(ogc_server_settings.public_url):]
 
+        # Collect the tiles: background ones are cached, layer ones are not
+        tiles = []
         for row in range(0, numberOfRows):
             for col in range(0, len(first_row)):
-                box = [col * 256, row * 256]
+                box = [int(left) + col * 256, int(top) + row * 256]
                 t = first_row[col]
                 y = t.y + row
+                sources = []
                 if smurl:
-                    imgurl = smurl.format(z=t.z, x=t.x, y=y)
-                    _img_request_template += _img_src_template.format(ogc_location=imgurl,
-                                                                      height=256, width=256,
-                                                                      left=box[0], top=box[1])
+                    sources.append((smurl.format(z=t.z, x=t.x, y=y), True))
                 xy_bounds = mercantile.xy_bounds(t.x, y, t.z)
                 bbox = ",".join([str(xy_bounds.left), str(xy_bounds.bottom),
                                  str(xy_bounds.right), str(xy_bounds.top)])
@@ -2155,12 +2191,9 @@ def _prepare_thumbnail_body_from_opts(request_body, request=None):
 
                 }
                 _p = "&".join("%s=%s" % item for item in params.items())
-                _img_request_template += \
-                    _img_src_template.format(ogc_location=(thumbnail_create_url + '&' + _p),
-                                             height=256, width=256,
-                                             left=box[0], top=box[1])
-        _img_request_template += "</div></div>"
-        image = _render_thumbnail(_img_request_template, width=width, height=height)
+                sources.append((thumbnail_create_url + '&' + _p, False))
+                tiles.append((box[0], box[1], sources))
+        image = compose_thumbnail(tiles, width, height)
     except BaseException as e:
         logger.warning('Error generating thumbnail')
         logger.exception(e)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2019 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+from urlparse import urljoin
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+
+from geonode.base.links import LinkProvider
+
+from .helpers import ogc_server_settings
+from .ows import wcs_links, wfs_links, wms_links
+
+GEOSERVER_STORE_TYPES = ('dataStore', 'coverageStore')
+
+# Link types computed by the GeoServer provider, persisted rows of these
+# types are replaced by the computed ones.
+GEOSERVER_LINK_TYPES = ('data', 'image', 'original', 'html', 'OGC:WMS', 'OGC:WFS', 'OGC:WCS')
+
+
+class GeoServerLinkProvider(LinkProvider):
+    """Compute the standard OGC links of the layers published on the local GeoServer.
+
+       Links only depend on the layer attributes and styles, GeoServer is
+       never queried. Prefetch the styles when listing layers.
+    """
+
+    height = 550
+    width = 550
+
+    def get_key(self, resource):
+        if getattr(resource, 'storeType', None) not in GEOSERVER_STORE_TYPES:
+            return None
+        return (
+            resource.alternate,
+            resource.workspace,
+            resource.storeType,
+            resource.srid,
+            resource.bbox_x0, resource.bbox_y0, resource.bbox_x1, resource.bbox_y1,
+            resource.default_style_id,
+            tuple(sorted((style.id, style.name) for style in resource.styles.all())),
+            resource.last_updated,
+        )
+
+    def get_links(self, resource):
+        from geonode.base.models import Link
+
+        links = []
+
+        def _link(link_type, name, extension, mime, url):
+            links.append(Link(resource_id=resource.pk, link_type=link_type, name=name,
+                              extension=extension, mime=mime, url=url))
+
+        bbox = None
+        srid = resource.srid if resource.srid else getattr(settings, 'DEFAULT_MAP_CRS', 'EPSG:4326')
+        if resource.srid and resource.bbox_x0 is not None:
+            bbox = ','.join(str(x) for x in [resource.bbox_x0, resource.bbox_y0,
+                                             resource.bbox_x1, resource.bbox_y1])
+        alternate = resource.alternate.encode('utf-8')
+        public_url = ogc_server_settings.public_url
+
+        if settings.DISPLAY_ORIGINAL_DATASET_LINK:
+            _link('original', 'Original Dataset', 'zip', 'application/octet-stream',
+                  urljoin(settings.SITEURL, reverse('download', args=[resource.id])))
+
+        for ext, name, mime, url in wms_links(public_url + 'ows?', alternate, bbox, srid,
+                                              self.height, self.width):
+            _link('image', name, ext, mime, url)
+
+        if resource.storeType == 'dataStore':
+            # bbox filter should be set at runtime otherwise conflicting with CQL
+            for ext, name, mime, url in wfs_links(public_url + 'ows?', alternate, bbox=None, srid=srid):
+                if mime == 'SHAPE-ZIP':
+                    name = 'Zipped Shapefile'
+                _link('data', name, ext, mime, url)
+        else:
+            for ext, name, mime, url in wcs_links(public_url + 'wcs?', alternate, bbox, srid):
+                _link('data', name, ext, mime, url)
+
+        site_url = settings.SITEURL.rstrip('/') if settings.SITEURL.startswith('http') else settings.SITEURL
+        _link('html', resource.alternate, 'html', 'text/html',
+              '%s%s' % (site_url, resource.get_absolute_url()))
+
+        for style in resource.styles.all():
+            legend_url = ogc_server_settings.PUBLIC_LOCATION + \
+                'ows?service=WMS&request=GetLegendGraphic&format=image/png&WIDTH=20&HEIGHT=20&LAYER=' + \
+                resource.alternate + '&STYLE=' + style.name + \
+                '&legend_options=fontAntiAliasing:true;fontSize:12;forceLabels:on'
+            _link('image', 'Legend', 'png', 'image/png', legend_url)
+
+        ows_url = urljoin(public_url, 'ows')
+        _link('OGC:WMS', 'OGC WMS: %s Service' % resource.workspace, 'html', 'text/html', ows_url)
+        if resource.storeType == 'dataStore':
+            _link('OGC:WFS', 'OGC WFS: %s Service' % resource.workspace, 'html', 'text/html', ows_url)
+        else:
+            _link('OGC:WCS', 'OGC WCS: %s Service' % resource.workspace, 'html', 'text/html', ows_url)
+        return links
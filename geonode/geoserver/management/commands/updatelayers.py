@@ -87,6 +87,18 @@ class Command(BaseCommand):
             dest="permissions",
             default=None,
             help="Permissions to apply to each layer")
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            dest='incremental',
+            default=False,
+            help='Skip the layers whose GeoServer resource did not change since the last update.')
+        parser.add_argument(
+            '--workers',
+            dest='workers',
+            type=int,
+            default=1,
+            help='Number of layers processed concurrently.')
 
     def handle(self, **options):
         ignore_errors = options.get('ignore_errors')
@@ -121,7 +133,9 @@ class Command(BaseCommand):
             skip_geonode_registered=skip_geonode_registered,
             remove_deleted=remove_deleted,
             permissions=permissions,
-            execute_signals=True)
+            execute_signals=True,
+            incremental=options.get('incremental'),
+            workers=options.get('workers'))
 
         if verbosity > 1:
             print "\nDetailed report of failures:"
@@ -146,6 +160,8 @@ class Command(BaseCommand):
             print "%d Created layers" % output['stats']['created']
             print "%d Updated layers" % output['stats']['updated']
             print "%d Failed layers" % output['stats']['failed']
+            if options.get('incremental'):
+                print "%d Unchanged layers" % output['stats']['unchanged']
             try:
                 duration_layer = round(
                     output['stats']['duration_sec'] * 1.0 / len(output['layers']), 2)
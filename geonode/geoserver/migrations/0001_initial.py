@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('layers', '0033_auto_20180606_1543'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LayerFingerprint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('last_synced', models.DateTimeField(auto_now=True)),
+                ('layer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE,
+                                               related_name='geoserver_fingerprint', to='layers.Layer')),
+            ],
+        ),
+    ]
@@ -17,3 +17,18 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 #########################################################################
+
+from django.db import models
+
+
+class LayerFingerprint(models.Model):
+    """
+    Fingerprint of the GeoServer resource a Layer has been last synced from
+    by gs_slurp, used to skip the unchanged resources on incremental syncs.
+    """
+    layer = models.OneToOneField(
+        'layers.Layer',
+        related_name='geoserver_fingerprint',
+        on_delete=models.CASCADE)
+    fingerprint = models.CharField(max_length=64)
+    last_synced = models.DateTimeField(auto_now=True)
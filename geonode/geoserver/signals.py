@@ -402,11 +402,6 @@ def geoserver_post_save_local(instance, *args, **kwargs):
             logger.info("... Creating Thumbnail for Layer [%s]" % (instance.alternate))
             create_gs_thumbnail(instance, overwrite=True)
 
-    # Updating HAYSTACK Indexes if needed
-    if settings.HAYSTACK_SEARCH:
-        from django.core.management import call_command
-        call_command('update_index')
-
 
 @on_ogc_backend(BACKEND_PACKAGE)
 def geoserver_pre_save_maplayer(instance, sender, **kwargs):
@@ -20,7 +20,17 @@
 from geonode.tests.base import GeoNodeBaseTestSupport
 
 import os
+import shutil
 import gisdata
+import tempfile
+import threading
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO
+from mock import MagicMock, patch
+from PIL import Image
+from django.test import SimpleTestCase
+from xml.etree.ElementTree import XML
 
 from geonode import geoserver
 from geonode.decorators import on_ogc_backend
@@ -82,3 +92,128 @@ class HelperTest(GeoNodeBaseTestSupport):
         replaced = file_upload(filename, layer=vector_layer, overwrite=True, gtype='LineString')
         self.assertIsNotNone(replaced)
         self.assertTrue(replaced.is_vector())
+
+    @on_ogc_backend(geoserver.BACKEND_PACKAGE)
+    def test_gs_slurp_incremental(self):
+        """
+        Ensures an incremental gs_slurp only processes the changed resources.
+        """
+        from geonode.geoserver import helpers
+        from geonode.geoserver.models import LayerFingerprint
+
+        def _resource(layer, title):
+            resource = MagicMock(enabled=True, advertised=True)
+            resource.dom = XML('<featureType><title>%s</title></featureType>' % title)
+            resource.name = layer.name
+            resource.store.name = layer.store
+            resource.store.workspace.name = layer.workspace
+            return resource
+
+        def _slurp_resource(cat, resource, *args):
+            return Layer.objects.get(name=resource.name, workspace=resource.store.workspace.name), False
+
+        resources = [_resource(layer, 'title') for layer in Layer.objects.order_by('id')[:2]]
+        cat = MagicMock()
+        cat.get_resources.return_value = resources
+        with patch.object(helpers, 'Catalog', return_value=cat), \
+                patch.object(helpers, '_slurp_resource', side_effect=_slurp_resource) as slurp_resource:
+            output = helpers.gs_slurp(incremental=True)
+            self.assertEqual(output['stats']['updated'], 2)
+            self.assertEqual(LayerFingerprint.objects.count(), 2)
+
+            output = helpers.gs_slurp(incremental=True, workers=2)
+            self.assertEqual(output['stats']['unchanged'], 2)
+            self.assertEqual(slurp_resource.call_count, 2)
+
+            resources[0].dom = XML('<featureType><title>changed</title></featureType>')
+            output = helpers.gs_slurp(incremental=True)
+            self.assertEqual(output['stats']['updated'], 1)
+            self.assertEqual(output['stats']['unchanged'], 1)
+            self.assertEqual(slurp_resource.call_count, 3)
+
+    @on_ogc_backend(geoserver.BACKEND_PACKAGE)
+    def test_links_key_follows_styles(self):
+        """
+        Ensures the cached links of a layer are recomputed when its styles change.
+        """
+        from geonode.geoserver.links import GeoServerLinkProvider
+        from geonode.layers.models import Style
+
+        provider = GeoServerLinkProvider()
+        layer = Layer.objects.filter(storeType='dataStore').first()
+        key = provider.get_key(layer)
+        self.assertEqual(provider.get_key(layer), key)
+
+        style = Style.objects.create(name='links_key_style')
+        layer.styles.add(style)
+        self.assertNotEqual(provider.get_key(layer), key)
+        layer.styles.remove(style)
+        self.assertEqual(provider.get_key(layer), key)
+
+
+class StubTileHandler(BaseHTTPRequestHandler):
+    """Serves red opaque background tiles under /bg/ and half
+    transparent blue layer tiles anywhere else"""
+
+    requests = []
+
+    def do_GET(self):
+        StubTileHandler.requests.append(self.path)
+        if self.path.startswith('/bg/'):
+            color = (255, 0, 0, 255)
+        else:
+            color = (0, 0, 255, 128)
+        output = BytesIO()
+        Image.new('RGBA', (256, 256), color).save(output, format='PNG')
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.end_headers()
+        self.wfile.write(output.getvalue())
+
+    def log_message(self, *args):
+        pass
+
+
+class ThumbnailCompositionTest(SimpleTestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.server = HTTPServer(('localhost', 0), StubTileHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.base_url = 'http://localhost:%s' % self.server.server_port
+        StubTileHandler.requests = []
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dir)
+
+    def test_compose_thumbnail(self):
+        from geonode.geoserver.thumbnails import compose_thumbnail
+
+        tiles = []
+        for row in range(2):
+            for col in range(2):
+                tiles.append((col * 256 - 100, row * 256 - 50, [
+                    ('%s/bg/1/%s/%s.png' % (self.base_url, col, row), True),
+                    ('%s/wms?bbox=%s,%s' % (self.base_url, col, row), False),
+                ]))
+        with self.settings(THUMBNAIL_TILE_CACHE_DIR=self.cache_dir):
+            content = compose_thumbnail(tiles, 240, 200)
+            self.assertEqual(len(StubTileHandler.requests), 8)
+            image = Image.open(BytesIO(content))
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (240, 200))
+            red, green, blue = image.getpixel((120, 100))
+            self.assertTrue(red > 100 and blue > 100 and green < 50)
+
+            # background tiles are read from the disk cache
+            compose_thumbnail(tiles, 240, 200)
+            self.assertEqual(len(StubTileHandler.requests), 12)
+            self.assertFalse([path for path in StubTileHandler.requests[8:] if path.startswith('/bg/')])
+
+            # missing tiles are skipped, no tile at all gives no thumbnail
+            self.assertIsNone(compose_thumbnail(
+                [(0, 0, [('http://localhost:1/none.png', False)])], 240, 200))
@@ -1179,13 +1179,9 @@ class SignalsTests(GeoNodeBaseTestSupport):
             )
             for _lyr in _post_migrate_layers:
                 # Check original links in csw_anytext
-                _post_migrate_links_orig = Link.objects.filter(
-                    resource=_lyr.resourcebase_ptr,
-                    resource_id=_lyr.resourcebase_ptr.id,
-                    link_type='original'
-                )
+                _post_migrate_links_orig = _lyr.get_links().original()
                 self.assertTrue(
-                    _post_migrate_links_orig.count() > 0,
+                    len(_post_migrate_links_orig) > 0,
                     "No 'original' links has been found for the layer '{}'".format(
                         _lyr.alternate
                     )
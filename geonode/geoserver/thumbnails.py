@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2019 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+"""In-process thumbnail rendering.
+
+Thumbnails are composed from 256px map tiles, the background ones coming
+from a XYZ tile service and the layer ones from WMS GetMap requests. Tiles
+are fetched concurrently through a pooled HTTP session and pasted with
+Pillow, background tiles are cached on local disk.
+"""
+
+import os
+import errno
+import hashlib
+import logging
+import tempfile
+import threading
+
+from io import BytesIO
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+from django.conf import settings
+from PIL import Image
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+TILE_SIZE = 256
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_tiles_session():
+    """Return the HTTP session shared by the tile requests."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            workers = getattr(settings, 'THUMBNAIL_TILE_WORKERS', 8)
+            adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=1)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+def _get_tile_cache_path(url):
+    cache_dir = getattr(settings, 'THUMBNAIL_TILE_CACHE_DIR', None) or os.path.join(
+        tempfile.gettempdir(), 'geonode-tiles')
+    try:
+        os.makedirs(cache_dir)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    return os.path.join(cache_dir, hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+
+def fetch_tile(url, cache=False):
+    """Return the RGBA image of a tile, or None if it cannot be fetched.
+
+    Tiles fetched with cache=True are kept on disk, only valid images are stored.
+    """
+    path = _get_tile_cache_path(url) if cache else None
+    if path and os.path.exists(path):
+        try:
+            return Image.open(path).convert('RGBA')
+        except IOError:
+            logger.debug("Discarding invalid cached tile %s" % path)
+
+    try:
+        response = get_tiles_session().get(
+            url, timeout=getattr(settings, 'THUMBNAIL_TILE_TIMEOUT', 10), verify=False)
+        response.raise_for_status()
+        tile = Image.open(BytesIO(response.content)).convert('RGBA')
+    except (requests.exceptions.RequestException, IOError) as e:
+        # WMS errors come back as XML service exceptions
+        logger.warning("Could not fetch tile %s: %s" % (url, e))
+        return None
+
+    if path:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(response.content)
+        os.rename(tmp_path, path)
+    return tile
+
+
+def compose_thumbnail(tiles, width, height, format='JPEG'):
+    """Render a thumbnail of width x height pixels from map tiles.
+
+    tiles is a list of (left, top, sources) where left and top are the
+    offsets of the tile in the thumbnail and sources the list of
+    (url, cache) of the images to paste there, bottom first.
+    Returns the encoded image, or None if no tile could be fetched.
+    """
+    jobs = []
+    for left, top, sources in tiles:
+        for source in sources:
+            if source not in jobs:
+                jobs.append(source)
+    if not jobs:
+        return None
+
+    def _fetch(job):
+        return fetch_tile(*job)
+
+    pool = ThreadPool(max(1, min(getattr(settings, 'THUMBNAIL_TILE_WORKERS', 8), len(jobs))))
+    try:
+        images = dict(zip(jobs, pool.map(_fetch, jobs)))
+    finally:
+        pool.close()
+    if not any(images.values()):
+        return None
+
+    canvas = Image.new('RGBA', (width, height), (255, 255, 255, 255))
+    for left, top, sources in tiles:
+        for source in sources:
+            tile = images[source]
+            if tile is None:
+                continue
+            if tile.size != (TILE_SIZE, TILE_SIZE):
+                tile = tile.resize((TILE_SIZE, TILE_SIZE), Image.ANTIALIAS)
+            canvas.paste(tile, (int(left), int(top)), tile)
+
+    output = BytesIO()
+    canvas.convert('RGB').save(output, format=format)
+    return output.getvalue()
@@ -33,6 +33,8 @@ from django.utils.timezone import now
 from taggit.managers import TaggableManager
 from guardian.shortcuts import get_objects_for_group
 
+from geonode.base.facets import invalidate_facets
+
 logger = logging.getLogger(__name__)
 
 
@@ -229,4 +231,14 @@ def group_pre_delete(instance, sender, **kwargs):
          not permitted as will break the geonode permissions system')
 
 
+def groupprofile_visibility_update(instance, sender, **kwargs):
+    """Refresh the visibility index of the resources of the group"""
+    from geonode.security.utils import update_group_visibility_index
+    update_group_visibility_index(instance.group_id)
+
+
 signals.pre_delete.connect(group_pre_delete, sender=Group)
+signals.post_save.connect(groupprofile_visibility_update, sender=GroupProfile)
+signals.post_delete.connect(groupprofile_visibility_update, sender=GroupProfile)
+signals.post_save.connect(invalidate_facets, sender=GroupMember)
+signals.post_delete.connect(invalidate_facets, sender=GroupMember)
@@ -153,6 +153,24 @@ class Command(BaseCommand):
             default='UTF-8',
             help=("Specify the charset of the data"))
 
+        parser.add_argument(
+            '-w',
+            '--workers',
+            dest='workers',
+            type=int,
+            default=None,
+            help=("Plan the whole import first, then extract and upload the"
+                  " data files with this number of concurrent workers"))
+
+        parser.add_argument(
+            '-b',
+            '--batch',
+            dest='batch',
+            default=False,
+            action="store_true",
+            help=("Plan the whole import first and report the time spent by"
+                  " each stage (one worker unless --workers is set)"))
+
     def handle(self, *args, **options):
         verbosity = int(options.get('verbosity'))
         # ignore_errors = options.get('ignore_errors')
@@ -169,6 +187,10 @@ class Command(BaseCommand):
         metadata_uploaded_preserve = options.get('metadata_uploaded_preserve',
                                                  False)
         charset = options.get('charset', 'UTF-8')
+        workers = options.get('workers')
+        if options.get('batch') and not workers:
+            workers = 1
+        timings = {}
 
         if verbosity > 0:
             console = self.stdout
@@ -211,7 +233,9 @@ class Command(BaseCommand):
                 regions=regions,
                 private=private,
                 metadata_uploaded_preserve=metadata_uploaded_preserve,
-                charset=charset)
+                charset=charset,
+                workers=workers,
+                timings=timings)
 
             output.extend(out)
 
@@ -248,3 +272,10 @@ class Command(BaseCommand):
 
             if len(output) > 0:
                 print "%f seconds per layer" % (duration * 1.0 / len(output))
+
+            if timings:
+                print "\nTime spent by stage (summed over %d workers):" % workers
+                for stage in ('plan', 'extract', 'upload', 'permissions'):
+                    if stage in timings:
+                        print "%-12s %6d runs %10.2f seconds" % (
+                            stage, timings[stage]['count'], timings[stage]['time'])
@@ -322,11 +322,11 @@ class LayersTest(GeoNodeBaseTestSupport):
             for ll in links:
                 self.assertEquals(ll.link_type, "metadata")
 
-            links = Link.objects.filter(resource=lyr.resourcebase_ptr, link_type="data")
+            links = lyr.get_links().data()
             self.assertIsNotNone(links)
             self.assertEquals(len(links), 6)
 
-            links = Link.objects.filter(resource=lyr.resourcebase_ptr, link_type="image")
+            links = lyr.get_links().image()
             self.assertIsNotNone(links)
             self.assertEquals(len(links), 5)
 
@@ -354,11 +354,11 @@ class LayersTest(GeoNodeBaseTestSupport):
             for ll in links:
                 self.assertEquals(ll.link_type, "metadata")
 
-            links = Link.objects.filter(resource=lyr.resourcebase_ptr, link_type="data")
+            links = lyr.get_links().data()
             self.assertIsNotNone(links)
             self.assertEquals(len(links), 2)
 
-            links = Link.objects.filter(resource=lyr.resourcebase_ptr, link_type="image")
+            links = lyr.get_links().image()
             self.assertIsNotNone(links)
             self.assertEquals(len(links), 8)
 
@@ -534,6 +534,36 @@ class LayersTest(GeoNodeBaseTestSupport):
         # basically anything else should produce a GeoNodeException
         self.assertRaises(GeoNodeException, lambda: layer_type('foo.gml'))
 
+    def test_plan_upload(self):
+        d = None
+        try:
+            d = tempfile.mkdtemp()
+            for f in ("foo.shp", "foo.shx", "foo.dbf", "bar.shp", "bar.shx", "CA.tif"):
+                open(os.path.join(d, f), 'w').close()
+            # same layer name as foo.shp
+            os.mkdir(os.path.join(d, 'sub'))
+            open(os.path.join(d, 'sub', 'Foo.tif'), 'w').close()
+
+            timings = {}
+            plan = utils.plan_upload(d, timings=timings)
+            self.assertEquals(
+                dict((entry['basename'], entry['status']) for entry in plan),
+                {'CA': 'skipped', 'bar': 'failed', 'foo': None})
+            self.assertEquals(
+                [entry['file'] for entry in plan if entry['basename'] == 'foo'],
+                [os.path.join(d, 'foo.shp')])
+            self.assertTrue(isinstance(plan[1]['error'], GeoNodeException))
+            self.assertEquals(timings['plan']['count'], 1)
+
+            plan = utils.plan_upload(d, skip=False)
+            self.assertEquals(
+                [entry['existed'] for entry in plan if entry['status'] is None],
+                [True, False])
+            self.assertRaises(Exception, lambda: utils.plan_upload(d, name='foo'))
+        finally:
+            if d is not None:
+                shutil.rmtree(d)
+
     def test_get_files(self):
 
         # Check that a well-formed Shapefile has its components all picked up
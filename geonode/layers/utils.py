@@ -28,10 +28,14 @@ import glob
 import string
 import sys
 import json
+import time
 import logging
 import tarfile
+import threading
 
 from itertools import islice
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 from datetime import datetime
 from urlparse import urlparse
 from osgeo import gdal, osr, ogr
@@ -41,7 +45,7 @@ from random import choice
 # Django functionality
 from django.conf import settings
 from django.db.models import Q
-from django.db import transaction
+from django.db import connection, transaction
 from django.core.files import File
 from django.contrib.auth.models import Group
 from django.contrib.auth import get_user_model
@@ -100,6 +104,8 @@ logger = logging.getLogger('geonode.layers.utils')
 
 _separator = '\n' + ('-' * 100) + '\n'
 
+_timings_lock = threading.Lock()
+
 
 def _clean_string(
         str,
@@ -792,27 +798,9 @@ def file_upload(filename,
     return layer
 
 
-def upload(incoming, user=None, overwrite=False,
-           name=None, title=None, abstract=None, date=None,
-           license=None,
-           category=None, keywords=None, regions=None,
-           skip=True, ignore_errors=True,
-           verbosity=1, console=None,
-           private=False, metadata_uploaded_preserve=False,
-           charset='UTF-8'):
-    """Upload a directory of spatial data files to GeoNode
-
-       This function also verifies that each layer is in GeoServer.
-
-       Supported extensions are: .shp, .tif, .tar, .tar.gz, and .zip (of a shapefile).
-       It catches GeoNodeExceptions and gives a report per file
+def _get_upload_candidates(incoming):
+    """Returns the (basename, filename) of the data files of a file or directory
     """
-    if verbosity > 1:
-        print >> console, "Verifying that GeoNode is running ..."
-
-    if console is None:
-        console = open(os.devnull, 'w')
-
     potential_files = []
     if os.path.isfile(incoming):
         ___, short_filename = os.path.split(incoming)
@@ -832,13 +820,206 @@ def upload(incoming, user=None, overwrite=False,
     else:
         datadir = incoming
         for root, dirs, files in os.walk(datadir):
-            for short_filename in files:
+            for short_filename in sorted(files):
                 basename, extension = os.path.splitext(short_filename)
                 filename = os.path.join(root, short_filename)
                 if extension in ['.tif', '.shp', '.tar', '.zip']:
                     potential_files.append((basename, filename))
                 elif short_filename.endswith('.tar.gz'):
                     potential_files.append((basename, filename))
+    return potential_files
+
+
+@contextmanager
+def _timed(timings, stage):
+    started = time.time()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            elapsed = time.time() - started
+            with _timings_lock:
+                timing = timings.setdefault(stage, {'count': 0, 'time': 0.0})
+                timing['count'] += 1
+                timing['time'] += elapsed
+
+
+def plan_upload(incoming, name=None, skip=True, timings=None):
+    """Plans the upload of a file or a directory of spatial data files
+
+       In one pass, the data files are discovered, the ones resolving to an
+       already planned layer name are dropped, the existing layers are looked
+       up with a single query and the helper files of the shapefiles are
+       validated.
+
+       Returns one dict per file, with the 'file', its layer 'basename',
+       whether the layer 'existed' and its 'status': None when the file has to
+       be uploaded, 'skipped' or 'failed' (along with the 'error') otherwise.
+    """
+    with _timed(timings, 'plan'):
+        potential_files = _get_upload_candidates(incoming)
+        if (len(potential_files) > 1) and (name is not None):
+            msg = 'Failed to process.  Cannot specify name with multiple imports.'
+            raise Exception(msg)
+
+        plan = []
+        planned_names = set()
+        for basename, filename in potential_files:
+            layer_name = name or slugify(basename.title()).replace('-', '_')
+            if layer_name in planned_names:
+                logger.warning("Skipping '%s': layer '%s' is already planned", filename, layer_name)
+                continue
+            planned_names.add(layer_name)
+            plan.append({'file': filename, 'basename': basename, 'existed': False, 'status': None})
+
+        existing_names = set(Layer.objects.filter(
+            name__in=[entry['basename'] for entry in plan]).values_list('name', flat=True))
+        for entry in plan:
+            entry['existed'] = entry['basename'] in existing_names
+            if entry['existed'] and skip:
+                entry['status'] = 'skipped'
+            elif os.path.splitext(entry['file'])[1].lower() == '.shp':
+                try:
+                    get_files(entry['file'])
+                except GeoNodeException:
+                    entry['status'] = 'failed'
+                    entry['exception_type'], entry['error'], entry['traceback'] = sys.exc_info()
+    return plan
+
+
+def _upload_planned_file(entry, timings, user=None, overwrite=False,
+                         private=False, **kwargs):
+    """Extracts and uploads a planned file, returns its report
+    """
+    filename = entry['file']
+    info = {'file': filename}
+    # file_upload extends them in place
+    kwargs['keywords'] = list(kwargs.get('keywords') or [])
+    kwargs['regions'] = list(kwargs.get('regions') or [])
+    try:
+        with _timed(timings, 'extract'):
+            if is_zipfile(filename):
+                filename = unzip_file(filename)
+
+            if tarfile.is_tarfile(filename):
+                filename = extract_tarfile(filename)
+
+        # GeoServer publishes the layer while it is being registered
+        with _timed(timings, 'upload'):
+            layer = file_upload(filename, user=user, overwrite=overwrite, **kwargs)
+        info['status'] = 'updated' if entry['existed'] else 'created'
+        info['name'] = layer.name
+
+        if private and user:
+            with _timed(timings, 'permissions'):
+                perm_spec = {
+                    "users": {
+                        "AnonymousUser": [],
+                        user.username: [
+                            "change_resourcebase_metadata",
+                            "change_layer_data",
+                            "change_layer_style",
+                            "change_resourcebase",
+                            "delete_resourcebase",
+                            "change_resourcebase_permissions",
+                            "publish_resourcebase"]},
+                    "groups": {}}
+                layer.set_permissions(perm_spec)
+    except Exception:
+        info['status'] = 'failed'
+        info['exception_type'], info['error'], info['traceback'] = sys.exc_info()
+    finally:
+        # each worker thread has its own db connection
+        connection.close()
+    return info
+
+
+def _upload_planned(incoming, workers, timings, user=None, overwrite=False,
+                    name=None, skip=True, ignore_errors=True,
+                    verbosity=1, console=None, private=False, **kwargs):
+    """Uploads the planned files with at most ``workers`` concurrent workers
+    """
+    plan = plan_upload(incoming, name=name, skip=skip, timings=timings)
+    number = len(plan)
+    if verbosity > 1:
+        print >> console, "Found %d potential layers." % number
+
+    output = []
+
+    def _report(info):
+        output.append(info)
+        if verbosity > 0:
+            msg = "[%s] Layer for '%s' (%d/%d)" % (info['status'], info['file'], len(output), number)
+            print >> console, msg
+
+    pending = []
+    for entry in plan:
+        if entry['status'] is None:
+            pending.append(entry)
+            continue
+        if entry['status'] == 'failed' and not ignore_errors:
+            msg = 'Failed to process %s' % entry['file']
+            raise Exception(msg, entry['error']), None, entry['traceback']
+        info = {'file': entry['file'], 'status': entry['status']}
+        if entry['status'] == 'failed':
+            info.update((key, entry[key]) for key in ('exception_type', 'error', 'traceback'))
+        else:
+            info['name'] = entry['basename']
+        _report(info)
+
+    def _upload(entry):
+        return _upload_planned_file(
+            entry, timings, user=user, overwrite=overwrite, private=private, name=name, **kwargs)
+
+    pool = ThreadPool(max(1, min(workers, len(pending))))
+    try:
+        for info in pool.imap(_upload, pending):
+            _report(info)
+            if info['status'] == 'failed' and not ignore_errors:
+                pool.terminate()
+                msg = 'Failed to process %s' % info['file']
+                raise Exception(msg, info['error']), None, info['traceback']
+    finally:
+        pool.close()
+    return output
+
+
+def upload(incoming, user=None, overwrite=False,
+           name=None, title=None, abstract=None, date=None,
+           license=None,
+           category=None, keywords=None, regions=None,
+           skip=True, ignore_errors=True,
+           verbosity=1, console=None,
+           private=False, metadata_uploaded_preserve=False,
+           charset='UTF-8', workers=None, timings=None):
+    """Upload a directory of spatial data files to GeoNode
+
+       This function also verifies that each layer is in GeoServer.
+
+       Supported extensions are: .shp, .tif, .tar, .tar.gz, and .zip (of a shapefile).
+       It catches GeoNodeExceptions and gives a report per file
+
+       With ``workers`` the whole import is planned first (see ``plan_upload``)
+       and the files are then extracted and uploaded by that many concurrent
+       workers; the time spent by each stage is added up in ``timings``.
+    """
+    if verbosity > 1:
+        print >> console, "Verifying that GeoNode is running ..."
+
+    if console is None:
+        console = open(os.devnull, 'w')
+
+    if workers:
+        return _upload_planned(
+            incoming, workers, timings, user=user, overwrite=overwrite,
+            name=name, title=title, abstract=abstract, date=date,
+            license=license, category=category, keywords=keywords,
+            regions=regions, skip=skip, ignore_errors=ignore_errors,
+            verbosity=verbosity, console=console, private=private,
+            metadata_uploaded_preserve=metadata_uploaded_preserve,
+            charset=charset)
+
+    potential_files = _get_upload_candidates(incoming)
 
     # After gathering the list of potential files,
     # let's process them one by one.
@@ -27,7 +27,6 @@ import traceback
 from types import TracebackType
 import decimal
 import cPickle as pickle
-from django.db.models import Q
 from celery.exceptions import TimeoutError
 
 from django.contrib.gis.geos import GEOSGeometry
@@ -691,13 +690,11 @@ def layer_detail(request, layername, template='layers/layer_detail.html'):
             pass
 
     if layer.storeType == 'dataStore':
-        links = layer.link_set.download().filter(
-            Q(name__in=settings.DOWNLOAD_FORMATS_VECTOR) |
-            Q(link_type='original'))
+        download_formats = settings.DOWNLOAD_FORMATS_VECTOR
     else:
-        links = layer.link_set.download().filter(
-            Q(name__in=settings.DOWNLOAD_FORMATS_RASTER) |
-            Q(link_type='original'))
+        download_formats = settings.DOWNLOAD_FORMATS_RASTER
+    links = [link for link in layer.get_links().download() if
+             link.name in download_formats or link.link_type == 'original']
     links_view = [item for idx, item in enumerate(links) if
                   item.link_type == 'image']
     links_download = [item for idx, item in enumerate(
@@ -716,12 +713,6 @@ def layer_detail(request, layername, template='layers/layer_detail.html'):
     if request.user.has_perm(
         'download_resourcebase',
             layer.get_self_resource()):
-        if layer.storeType == 'dataStore':
-            links = layer.link_set.download().filter(
-                name__in=settings.DOWNLOAD_FORMATS_VECTOR)
-        else:
-            links = layer.link_set.download().filter(
-                name__in=settings.DOWNLOAD_FORMATS_RASTER)
         context_dict["links_download"] = links_download
 
     if settings.SOCIAL_ORIGINS:
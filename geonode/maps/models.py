@@ -18,6 +18,7 @@
 #
 #########################################################################
 
+import time
 import logging
 import uuid
 
@@ -35,9 +36,10 @@ from django.core.urlresolvers import reverse
 from django.template.defaultfilters import slugify
 from django.core.cache import cache
 
-from geonode.layers.models import Layer
+from geonode.layers.models import Layer, Attribute, Style
 from geonode.base.models import ResourceBase, resourcebase_post_save
 from geonode.maps.signals import map_changed_signal
+from geonode.services.models import Service
 from geonode.security.utils import remove_object_permissions
 from geonode.client.hooks import hookset
 from geonode.utils import (GXPMapBase,
@@ -54,6 +56,8 @@ from agon_ratings.models import OverallRating
 
 logger = logging.getLogger("geonode.maps.models")
 
+VIEWER_JSON_VERSION_KEY = 'geonode.maps.viewer_json_version'
+
 
 class Map(ResourceBase, GXPMapBase):
 
@@ -109,6 +113,15 @@ class Map(ResourceBase, GXPMapBase):
         layers = MapLayer.objects.filter(map=self.id)
         return [layer for layer in layers]
 
+    def viewer_json_cache_key(self):
+        return get_viewer_json_cache_key(self.id)
+
+    def layers_config(self, layers):
+        maplayers_config = iter(get_maplayers_config(
+            [layer for layer in layers if isinstance(layer, MapLayer)]))
+        return [next(maplayers_config) if isinstance(layer, MapLayer) else (layer.layer_config(), None)
+                for layer in layers]
+
     @property
     def local_layers(self):
         layer_names = MapLayer.objects.filter(map__id=self.id).values('name')
@@ -487,48 +500,12 @@ class MapLayer(models.Model, GXPLayerBase):
     # True if this layer is served by the local geoserver
 
     def layer_config(self, user=None):
-        # Try to use existing user-specific cache of layer config
-        if self.id:
-            cfg = cache.get("layer_config" +
-                            str(self.id) +
-                            "_" +
-                            str(0 if user is None else user.id))
-            if cfg is not None:
-                return cfg
-
-        cfg = GXPLayerBase.layer_config(self, user=user)
-        # if this is a local layer, get the attribute configuration that
-        # determines display order & attribute labels
-        if Layer.objects.filter(alternate=self.name).exists():
-            try:
-                if self.local:
-                    layer = Layer.objects.get(store=self.store, alternate=self.name)
-                else:
-                    layer = Layer.objects.get(
-                        alternate=self.name,
-                        remote_service__base_url=self.ows_url)
-                attribute_cfg = layer.attribute_config()
-                if "getFeatureInfo" in attribute_cfg:
-                    cfg["getFeatureInfo"] = attribute_cfg["getFeatureInfo"]
-                if not user.has_perm(
-                        'base.view_resourcebase',
-                        obj=layer.resourcebase_ptr):
-                    cfg['disabled'] = True
-                    cfg['visibility'] = False
-            except BaseException:
-                # shows maplayer with pink tiles,
-                # and signals that there is problem
-                # TODO: clear orphaned MapLayers
-                layer = None
-
-        if self.id:
-            # Create temporary cache of maplayer config, should not last too long in case
-            # local layer permissions or configuration values change (default
-            # is 5 minutes)
-            cache.set("layer_config" +
-                      str(self.id) +
-                      "_" +
-                      str(0 if user is None else user.id), cfg)
+        [(cfg, resource)] = get_maplayers_config([self])
+        if user is not None and resource is not None and not user.has_perm(
+                'base.view_resourcebase',
+                obj=ResourceBase.objects.get(id=resource)):
+            cfg['disabled'] = True
+            cfg['visibility'] = False
         return cfg
 
     @property
@@ -556,6 +533,89 @@ class MapLayer(models.Model, GXPLayerBase):
         return '%s?layers=%s' % (self.ows_url, self.name)
 
 
+def get_maplayers_config(maplayers):
+    """
+    Return the configuration of each maplayer and the id of the layer it
+    shows, if any. Layers and their attributes are fetched at once for
+    all maplayers.
+    """
+    names = set(maplayer.name for maplayer in maplayers if maplayer.name)
+    local_layers = {}
+    remote_layers = {}
+    if names:
+        for layer_id, alternate, store, base_url in Layer.objects.filter(
+                alternate__in=names).values_list('id', 'alternate', 'store', 'remote_service__base_url'):
+            local_layers.setdefault((store, alternate), []).append(layer_id)
+            remote_layers.setdefault((alternate, base_url), []).append(layer_id)
+
+    resources = []
+    for maplayer in maplayers:
+        if maplayer.local:
+            matches = local_layers.get((maplayer.store, maplayer.name), [])
+        else:
+            matches = remote_layers.get((maplayer.name, maplayer.ows_url), [])
+        # maplayers matching no single layer are shown with pink tiles,
+        # signaling that there is a problem
+        # TODO: clear orphaned MapLayers
+        resources.append(matches[0] if len(matches) == 1 else None)
+
+    # attribute configuration determining display order & attribute labels
+    feature_info = {}
+    attributes = Attribute.objects.filter(
+        layer_id__in=set(resource for resource in resources if resource),
+        visible=True).order_by('display_order')
+    for layer_id, attribute, attribute_label in attributes.values_list('layer_id', 'attribute', 'attribute_label'):
+        cfg = feature_info.setdefault(layer_id, {"fields": [], "propertyNames": {}})
+        cfg["fields"].append(attribute)
+        cfg["propertyNames"][attribute] = attribute_label
+
+    out = []
+    for maplayer, resource in zip(maplayers, resources):
+        cfg = GXPLayerBase.layer_config(maplayer)
+        if resource in feature_info:
+            cfg["getFeatureInfo"] = feature_info[resource]
+        out.append((cfg, resource,))
+    return out
+
+
+def get_viewer_json_cache_key(map_id):
+    # the version changes when the configuration of all maps is invalidated
+    cache.add(VIEWER_JSON_VERSION_KEY, time.time(), None)
+    return 'geonode.maps.viewer_json:%s:%s' % (cache.get(VIEWER_JSON_VERSION_KEY), map_id)
+
+
+def invalidate_viewer_json(map_ids=None):
+    """
+    Discard the cached viewer configuration of the maps in map_ids, or of
+    all maps if map_ids is None.
+    """
+    if map_ids is None:
+        cache.set(VIEWER_JSON_VERSION_KEY, time.time(), None)
+    else:
+        cache.delete_many([get_viewer_json_cache_key(map_id) for map_id in set(map_ids)])
+
+
+def viewer_json_post_change(instance, sender, **kwargs):
+    if isinstance(instance, Map):
+        map_ids = [instance.id]
+    elif isinstance(instance, MapLayer):
+        map_ids = [instance.map_id]
+    else:
+        if isinstance(instance, Layer):
+            alternates = [instance.alternate]
+        elif isinstance(instance, Attribute):
+            alternates = Layer.objects.filter(id=instance.layer_id).values('alternate')
+        elif isinstance(instance, Style):
+            alternates = Layer.objects.filter(
+                models.Q(default_style=instance) | models.Q(styles=instance)).values('alternate')
+        else:
+            # remote services are listed in the sources of every map
+            invalidate_viewer_json()
+            return
+        map_ids = MapLayer.objects.filter(name__in=alternates).values_list('map_id', flat=True)
+    invalidate_viewer_json(map_ids)
+
+
 def pre_delete_map(instance, sender, **kwrargs):
     ct = ContentType.objects.get_for_model(instance)
     OverallRating.objects.filter(
@@ -596,3 +656,6 @@ class MapSnapshot(models.Model):
 
 signals.pre_delete.connect(pre_delete_map, sender=Map)
 signals.post_save.connect(resourcebase_post_save, sender=Map)
+for model in (Map, MapLayer, Layer, Attribute, Style, Service):
+    signals.post_save.connect(viewer_json_post_change, sender=model)
+    signals.post_delete.connect(viewer_json_post_change, sender=model)
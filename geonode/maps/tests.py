@@ -34,9 +34,11 @@ except ImportError:
 from django.contrib.contenttypes.models import ContentType
 from agon_ratings.models import OverallRating
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory
 from django.conf import settings
 from geonode.decorators import on_ogc_backend, dump_func_name
-from geonode.layers.models import Layer
+from geonode.layers.models import Layer, Attribute
 from geonode.maps.models import Map
 from geonode.maps.utils import fix_baselayers
 from geonode import geoserver, qgis_server
@@ -754,6 +756,51 @@ community."
 
         self.assertEquals(map_obj.layer_set.all().count(), n_baselayers + n_locallayers)
 
+    @dump_func_name
+    def test_viewer_json_cache(self):
+        """Test that the viewer configuration is compiled once per map,
+        invalidated when its layers change, and that the layers a user cannot
+        view are disabled on each request
+        """
+        map_obj = Map.objects.all().first()
+        layer = Layer.objects.all().first()
+        map_obj.layer_set.create(
+            name=layer.alternate,
+            store=layer.store,
+            local=True,
+            stack_order=10,
+            layer_params='{}',
+            source_params='{}')
+
+        def get_layer_config(cfg):
+            return [lyr for lyr in cfg['map']['layers'] if lyr.get('name') == layer.alternate][0]
+
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            cfg = map_obj.viewer_json(None)
+            with self.assertNumQueries(0):
+                self.assertEquals(map_obj.viewer_json(None), cfg)
+
+            Attribute.objects.create(
+                layer=layer,
+                attribute='viewer_json_cache',
+                attribute_label='Viewer JSON cache',
+                visible=True,
+                display_order=1)
+            layer_cfg = get_layer_config(map_obj.viewer_json(None))
+            self.assertIn('viewer_json_cache', layer_cfg['getFeatureInfo']['fields'])
+            self.assertEquals(
+                layer_cfg['getFeatureInfo']['propertyNames']['viewer_json_cache'],
+                'Viewer JSON cache')
+            self.assertTrue(layer_cfg['visibility'])
+
+            layer.set_permissions({'users': {'AnonymousUser': []}})
+            request = RequestFactory().get('/')
+            request.user = AnonymousUser()
+            layer_cfg = get_layer_config(map_obj.viewer_json(request))
+            self.assertTrue(layer_cfg['disabled'])
+            self.assertFalse(layer_cfg['visibility'])
+            self.assertNotIn('disabled', get_layer_config(map_obj.viewer_json(None)))
+
     @dump_func_name
     def test_batch_edit(self):
         Model = Map
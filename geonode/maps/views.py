@@ -144,7 +144,7 @@ def map_detail(request, mapid, snapshot=None, template='maps/map_detail.html'):
 
     config = json.dumps(config)
     layers = MapLayer.objects.filter(map=map_obj.id)
-    links = map_obj.link_set.download()
+    links = map_obj.get_links().download()
 
     group = None
     if map_obj.group:
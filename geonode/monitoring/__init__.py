@@ -50,6 +50,11 @@ class MonitoringAppConfig(NotificationsAppConfigBase):
     def ready(self):
         super(MonitoringAppConfig, self).ready()
         post_migrate.connect(run_setup_hooks, sender=self)
+        # cached monitored resource ids must not outlive their rows
+        from django.db.models.signals import post_delete
+        from geonode.monitoring.models import MonitoredResource
+        post_migrate.connect(MonitoredResource.clear_cache, sender=self)
+        post_delete.connect(MonitoredResource.clear_cache, sender=MonitoredResource)
 
 
 default_app_config = 'geonode.monitoring.MonitoringAppConfig'
@@ -12,6 +12,7 @@ from geonode.monitoring.models import (
     ExceptionEvent,
     MetricLabel,
     MetricValue,
+    MetricValueRollup,
     MonitoredResource,
     NotificationCheck,
     MetricNotificationCheck,
@@ -80,6 +81,13 @@ class MetricValueAdmin(admin.ModelAdmin):
     list_filter = ('service_metric', 'service', 'event_type')
 
 
+@admin.register(MetricValueRollup)
+class MetricValueRollupAdmin(admin.ModelAdmin):
+    list_display = ('service_metric', 'service', 'resolution', 'valid_from', 'event_type', 'resource', 'label',
+                    'metric_count', 'samples_count', 'value_sum', 'value_min', 'value_max')
+    list_filter = ('resolution', 'service_metric', 'service', 'event_type')
+
+
 @admin.register(MonitoredResource)
 class MonitoredResourceAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'type',)
@@ -20,17 +20,22 @@
 
 from datetime import datetime, timedelta, time
 from decimal import Decimal
+from collections import Counter, OrderedDict, defaultdict
+from itertools import chain
 import logging
 
 import pytz
 
 from django.conf import settings
+from django.db import connection, transaction
 from django.db.models import Sum, F
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
+from django.utils.encoding import force_text
 
-from geonode.monitoring.utils import generate_periods
-from geonode.monitoring.models import (Metric, MetricValue, ServiceTypeMetric,
-                                       MonitoredResource, MetricLabel, EventType,)
+from geonode.monitoring.utils import generate_periods, align_period_start, align_period_end
+from geonode.monitoring.models import (Metric, MetricValue, MetricValueRollup, ServiceTypeMetric,
+                                       MonitoredResource, MetricLabel, EventType,
+                                       RequestEvent, ExceptionEvent,)
 
 
 log = logging.getLogger(__name__)
@@ -137,6 +142,241 @@ def extract_special_event_types(requests):
     return out
 
 
+# request metrics calculated from RequestEvent columns
+REQUEST_METRICS = (('request.ip', 'client_ip',),
+                   ('request.users', 'user_identifier',),
+                   ('request.country', 'client_country'),
+                   ('request.city', 'client_city',),
+                   ('request.region', 'client_region'),
+                   ('request.ua', 'user_agent',),
+                   ('request.ua.family', 'user_agent_family',),
+                   ('response.time', 'response_time',),
+                   ('response.size', 'response_size',),
+                   ('response.status', 'response_status',),
+                   ('request.method', 'request_method',),
+                   )
+
+
+class RequestsAggregator(object):
+    """
+    Calculates request metrics for a batch of RequestEvents in one pass.
+
+    Requests are read once with a streamed cursor, along with their resource
+    links and exceptions. Each request is accounted in every group it
+    belongs to: all events, its own event type and OWS:ALL/other special
+    type, both in general and for each affected resource. Results are
+    returned as unsaved MetricValue instances, ready for bulk insert.
+    """
+
+    # max number of labels stored for count and value metrics
+    MAX_LABELS = 100
+
+    def __init__(self, service, valid_from, valid_to):
+        self.service = service
+        self.valid_from = valid_from
+        self.valid_to = valid_to
+        self.groups = OrderedDict()
+        self.usernames = {}
+        self.requests_count = 0
+        self.error_requests = set()
+        self.error_types = Counter()
+
+        event_types = dict(EventType.objects.values_list('name', 'id'))
+        self.event_names = dict((v, k) for k, v in event_types.items())
+        self.event_all = event_types.get(EventType.EVENT_ALL)
+        self.event_ows = event_types.get(EventType.EVENT_OWS)
+        self.event_other = event_types.get(EventType.EVENT_OTHER)
+
+    def get_group(self, resource_id, event_type_id):
+        key = (resource_id, event_type_id,)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = {'count': 0,
+                                        'paths': Counter(),
+                                        'columns': dict((c, Counter()) for m, c in REQUEST_METRICS)}
+        return group
+
+    def get_special_event_type(self, event_type_id):
+        event_name = self.event_names.get(event_type_id)
+        if not event_name:
+            return
+        if event_name.startswith('OWS:'):
+            if event_name != EventType.EVENT_OWS:
+                return self.event_ows
+        elif event_name != EventType.EVENT_OTHER:
+            return self.event_other
+
+    def process(self, requests):
+        """
+        Accumulates requests from queryset. Returns number of requests processed.
+        """
+        request_ids = requests.values('id')
+        links = defaultdict(set)
+        for request_id, resource_id in RequestEvent.resources.through.objects\
+                .filter(requestevent_id__in=request_ids)\
+                .values_list('requestevent_id', 'monitoredresource_id')\
+                .iterator():
+            links[request_id].add(resource_id)
+
+        # exceptions are recorded after their request, which lets partitions be pruned
+        for request_id, error_type in ExceptionEvent.objects\
+                .filter(request_id__in=request_ids, created__gte=self.valid_from)\
+                .values_list('request_id', 'error_type')\
+                .iterator():
+            self.error_requests.add(request_id)
+            self.error_types[error_type] += 1
+
+        # special event types are reported even if there are no matching requests
+        for resource_id in [None] + sorted(set(chain.from_iterable(links.values()))):
+            self.get_group(resource_id, self.event_all)
+            for event_type_id in (self.event_ows, self.event_other,):
+                if event_type_id:
+                    self.get_group(resource_id, event_type_id)
+
+        columns = [c for m, c in REQUEST_METRICS]
+        fields = ['id', 'event_type_id', 'request_path', 'user_username'] + columns
+        for row in requests.values_list(*fields).iterator():
+            request_id, event_type_id, path, username = row[:4]
+            values = zip(columns, row[4:])
+            special_event_type_id = self.get_special_event_type(event_type_id)
+            self.requests_count += 1
+
+            for resource_id in [None] + list(links.get(request_id, ())):
+                for group_event_type_id in (self.event_all, event_type_id, special_event_type_id,):
+                    if not group_event_type_id:
+                        continue
+                    group = self.get_group(resource_id, group_event_type_id)
+                    group['count'] += 1
+                    group['paths'][path] += 1
+                    for column, value in values:
+                        group['columns'][column][value] += 1
+
+            user_identifier = row[4 + columns.index('user_identifier')]
+            if user_identifier is not None:
+                self.usernames.setdefault(user_identifier, username)
+        return self.requests_count
+
+    def get_rows(self, metric, column_name, group):
+        """
+        Returns list of (label, value, samples count) for metric in group
+        """
+        values = group['columns'][column_name]
+        if metric.is_rate:
+            samples = sum(cnt for v, cnt in values.items() if v is not None)
+            total = sum(v * cnt for v, cnt in values.items() if v is not None)
+            avg = float(total) / samples if samples else None
+            return [(Metric.TYPE_RATE, avg, group['count'],)]
+
+        elif metric.is_value_numeric:
+            present = [v for v in values if v is not None]
+            return [(Metric.TYPE_VALUE_NUMERIC,
+                     max(present) if present else None,
+                     sum(values[v] for v in present),)]
+
+        elif metric.is_count:
+            rows = [(v, v * cnt if v is not None else None, cnt if v is not None else 0,)
+                    for v, cnt in values.items()]
+
+        elif metric.is_value:
+            is_user_metric = column_name == 'user_identifier'
+            rows = []
+            for v, cnt in values.items():
+                cnt = cnt if v is not None else 0
+                label = (v, self.usernames.get(v),) if is_user_metric else v
+                rows.append((label, cnt, cnt,))
+
+        else:
+            raise ValueError("Unsupported metric type: {}".format(metric.type))
+        rows.sort(key=lambda r: r[1], reverse=True)
+        return rows[:self.MAX_LABELS]
+
+    def get_metric_values(self):
+        """
+        Returns list of unsaved MetricValue instances for accumulated requests
+        """
+        service_metrics = dict(
+            (stm.metric.name, stm,) for stm in
+            ServiceTypeMetric.objects.filter(service_type=self.service.service_type).select_related('metric'))
+        values = []
+
+        def get_service_metric(metric_name):
+            try:
+                return service_metrics[metric_name]
+            except KeyError:
+                raise ServiceTypeMetric.DoesNotExist(
+                    "No {} metric for {}".format(metric_name, self.service.service_type))
+
+        def add(metric_name, label, value, samples_count, resource_id=None, event_type_id=None):
+            values.append((get_service_metric(metric_name), label, resource_id, event_type_id,
+                           {'value': value or 0,
+                            'value_raw': value or 0,
+                            'value_num': value if isinstance(value, (int, float, long, Decimal,)) else None,
+                            'samples_count': samples_count or 0}))
+
+        for (resource_id, event_type_id), group in self.groups.items():
+            kwargs = {'resource_id': resource_id, 'event_type_id': event_type_id}
+            count = group['count']
+            add('request.count', 'Count', count, count, **kwargs)
+            for path, count in group['paths'].items():
+                add('request.path', path, count, count, **kwargs)
+            for metric_name, column_name in REQUEST_METRICS:
+                metric = get_service_metric(metric_name).metric
+                for label, value, samples_count in self.get_rows(metric, column_name, group):
+                    add(metric_name, label, value, samples_count, **kwargs)
+
+        if self.error_requests:
+            cnt = len(self.error_requests)
+            add('response.error.count', 'count', cnt, self.requests_count)
+            for error_type, cnt in self.error_types.items():
+                add('response.error.types', error_type, cnt, cnt)
+
+        labels = get_metric_labels(label for service_metric, label, resource_id, event_type_id, data in values)
+        out = OrderedDict()
+        for service_metric, label, resource_id, event_type_id, data in values:
+            label_id = labels[get_metric_label_name(label)]
+            key = (service_metric.id, label_id, resource_id, event_type_id,)
+            out[key] = MetricValue(valid_from=self.valid_from,
+                                   valid_to=self.valid_to,
+                                   service=self.service,
+                                   service_metric=service_metric,
+                                   label_id=label_id,
+                                   resource_id=resource_id,
+                                   event_type_id=event_type_id,
+                                   data={},
+                                   **data)
+        return list(out.values())
+
+
+def get_metric_label_name(label):
+    if label and isinstance(label, tuple):
+        label = label[0]
+    return force_text(label or 'count')
+
+
+def get_metric_labels(labels):
+    """
+    Returns name -> id mapping of MetricLabels, creating missing ones.
+    Labels can be passed as names or (name, user) pairs.
+    """
+    users = {}
+    for label in labels:
+        name = get_metric_label_name(label)
+        user = label[1] if label and isinstance(label, tuple) else None
+        if user or name not in users:
+            users[name] = user
+
+    out = {}
+    names = list(users.keys())
+    for name, label_id in MetricLabel.objects.filter(name__in=names).order_by('-id').values_list('name', 'id'):
+        out[name] = label_id
+    missing = [name for name in names if name not in out]
+    if missing:
+        MetricLabel.objects.bulk_create([MetricLabel(name=name, user=users[name]) for name in missing])
+        for name, label_id in MetricLabel.objects.filter(name__in=missing).order_by('-id').values_list('name', 'id'):
+            out[name] = label_id
+    return out
+
+
 def calculate_rate(metric_name, metric_label,
                    current_value, valid_to):
     """
@@ -236,6 +476,7 @@ def aggregate_period(period_start, period_end, metric_data_q, cleanup=True):
     counter = 0
     to_remove_data = {'remove_at': period_start.strftime("%Y%m%d%H%M%S")}
     source_metric_data = metric_data_q.filter(valid_from__gte=period_start,
+                                              valid_from__lt=period_end,
                                               valid_to__lte=period_end)\
                                       .exclude(valid_from=period_start,
                                                valid_to=period_end,
@@ -300,3 +541,95 @@ def aggregate_period(period_start, period_end, metric_data_q, cleanup=True):
     if cleanup:
         source_metric_data.filter(data=to_remove_data).delete()
     return counter
+
+
+# default rollup resolutions: 1 minute, 1 hour, 1 day
+ROLLUP_RESOLUTIONS = (timedelta(minutes=1), timedelta(hours=1), timedelta(days=1),)
+
+ROLLUP_DIMENSIONS = ('service_id', 'service_metric_id', 'resource_id', 'event_type_id', 'label_id',)
+ROLLUP_VALUES = ('metric_count', 'samples_count', 'value_sum', 'value_weighted_sum', 'value_min', 'value_max',)
+
+# rollup values calculated from metric values, and from rollups of finer resolution
+ROLLUP_FROM_METRIC_VALUES = ('count(1)', 'sum(samples_count)', 'sum(value_num)',
+                             'sum(value_num * samples_count)', 'min(value_num)', 'max(value_num)',)
+ROLLUP_FROM_ROLLUPS = ('sum(metric_count)', 'sum(samples_count)', 'sum(value_sum)',
+                       'sum(value_weighted_sum)', 'min(value_min)', 'max(value_max)',)
+
+ROLLUP_QUERY = ('insert into {table} (resolution, valid_from, valid_to, {dimensions}, {values}) '
+                'select %(resolution)s, '
+                'to_timestamp(floor(extract(epoch from valid_from) / %(resolution)s) * %(resolution)s), '
+                'to_timestamp((floor(extract(epoch from valid_from) / %(resolution)s) + 1) * %(resolution)s), '
+                '{dimensions}, {aggregates} '
+                'from {source} '
+                'where valid_from >= %(valid_from)s and valid_from < %(valid_to)s {where} '
+                'group by 2, 3, {dimensions}')
+
+
+def get_rollup_resolutions():
+    """
+    Returns sorted list of configured rollup resolutions, in seconds
+    """
+    resolutions = getattr(settings, 'MONITORING_DATA_ROLLUPS', ROLLUP_RESOLUTIONS)
+    return sorted(int(r.total_seconds()) if isinstance(r, timedelta) else int(r)
+                  for r in resolutions)
+
+
+def get_rollup_resolution(interval):
+    """
+    Returns the coarsest rollup resolution (in seconds) that can answer
+    queries for periods of given interval, or None if there is none.
+    """
+    if not isinstance(interval, timedelta):
+        interval = timedelta(seconds=interval)
+    interval_s = int(interval.total_seconds())
+    for resolution in reversed(get_rollup_resolutions()):
+        if resolution <= interval_s and not interval_s % resolution:
+            return resolution
+
+
+def update_rollups(valid_from, valid_to, service=None):
+    """
+    Recalculates rollup buckets for metric values starting within [valid_from, valid_to).
+
+    Buckets of the finest resolution are calculated from metric values, each
+    coarser resolution from the previous one, so only a bounded number of
+    rows is read for each bucket. Returns number of rollups written.
+    """
+    counter = 0
+    source = MetricValue._meta.db_table
+    aggregates = ROLLUP_FROM_METRIC_VALUES
+    params = {}
+    service_where = []
+    if service:
+        service_where.append('and service_id = %(service_id)s')
+        params['service_id'] = service.id
+    where = service_where
+
+    for resolution in get_rollup_resolutions():
+        interval = timedelta(seconds=resolution)
+        params.update({'resolution': resolution,
+                       'valid_from': align_period_start(valid_from, interval),
+                       'valid_to': align_period_end(valid_to, interval)})
+        q = ROLLUP_QUERY.format(table=MetricValueRollup._meta.db_table,
+                                source=source,
+                                dimensions=', '.join(ROLLUP_DIMENSIONS),
+                                values=', '.join(ROLLUP_VALUES),
+                                aggregates=', '.join(aggregates),
+                                where=' '.join(where))
+        with transaction.atomic():
+            stale = MetricValueRollup.objects.filter(resolution=resolution,
+                                                     valid_from__gte=params['valid_from'],
+                                                     valid_from__lt=params['valid_to'])
+            if service:
+                stale = stale.filter(service=service)
+            stale.delete()
+            with connection.cursor() as cursor:
+                cursor.execute(q, params)
+                counter += cursor.rowcount
+
+        # next resolution is calculated from this one
+        source = MetricValueRollup._meta.db_table
+        aggregates = ROLLUP_FROM_ROLLUPS
+        where = service_where + ['and resolution = %(source_resolution)s']
+        params['source_resolution'] = resolution
+    return counter
@@ -19,39 +19,49 @@
 #########################################################################
 import logging
 import re
+import time
 import pytz
 from datetime import datetime, timedelta
 from decimal import Decimal
 from itertools import chain
 
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.utils.html import strip_tags
 from django.template.loader import get_template
 from django.core.mail import EmailMultiAlternatives as EmailMessage
 from django.utils.translation import ugettext_noop as _
-from django.db.models import Max
+from django.db.models import Max, Min
 from django.urls import resolve, Resolver404
 
 
 from geonode.utils import raw_sql
 from geonode.notifications_helper import send_notification
 from geonode.monitoring import MonitoringAppConfig as AppConf
-from geonode.monitoring.models import (Metric, MetricValue, RequestEvent, MonitoredResource,
+from geonode.monitoring.models import (Metric, MetricValue, MetricValueRollup, RequestEvent, MonitoredResource,
                                        ExceptionEvent, EventType, NotificationCheck, BuiltIns)
 
 from geonode.monitoring.utils import generate_periods, align_period_start, align_period_end
+from geonode.monitoring.partitions import maintain_partitions
 from geonode.monitoring.aggregation import (aggregate_past_periods, calculate_rate, calculate_percent,
                                             extract_resources, extract_event_type,
                                             extract_event_types, extract_special_event_types,
                                             get_resources_for_metric, get_labels_for_metric,
-                                            get_metric_names)
+                                            get_metric_names, get_rollup_resolution, update_rollups,
+                                            RequestsAggregator)
 from geonode.base.models import ResourceBase
 from geonode.utils import parse_datetime
 
 
 log = logging.getLogger(__name__)
 
+# metric value expressions used by get_metrics_data and their rollup counterparts
+ROLLUP_EXPRESSIONS = (('from monitoring_metricvalue mv', 'from monitoring_metricvaluerollup mv'),
+                      ('count(1) as metric_count', 'sum(mv.metric_count) as metric_count'),
+                      ('sum(mv.value_num)', 'sum(mv.value_sum)'),
+                      ('min(mv.value_num)', 'min(mv.value_min)'),
+                      ('max(mv.value_num)', 'max(mv.value_max)'),)
+
 
 class CollectorAPI(object):
 
@@ -460,14 +470,16 @@ class CollectorAPI(object):
 
     def process(self, service, data, valid_from, valid_to, *args, **kwargs):
         if service.is_hostgeonode:
-            return self.process_host_geonode(
+            out = self.process_host_geonode(
                 service, data, valid_from, valid_to, *args, **kwargs)
         elif service.is_hostgeoserver:
-            return self.process_host_geoserver(
+            out = self.process_host_geoserver(
                 service, data, valid_from, valid_to, *args, **kwargs)
         else:
-            return self.process_requests(
+            out = self.process_requests(
                 service, data, valid_from, valid_to, *args, **kwargs)
+        self.update_rollups(valid_from, valid_to, service=service)
+        return out
 
     def process_requests(self, service, requests, valid_from, valid_to):
         """
@@ -513,88 +525,22 @@ class CollectorAPI(object):
         """
         Processes requests information into metric values
         """
-        log.debug("Processing batch of %s requests from %s to %s", requests.count(), valid_from, valid_to)
-        if not requests.count():
-            return
-        event_all = EventType.objects.get(name=EventType.EVENT_ALL)
-        metric_defaults = {'valid_from': valid_from,
-                           'valid_to': valid_to,
-                           'event_type': event_all,
-                           'resource': None,
-                           'service': service}
-        MetricValue.objects.filter(
-            valid_from__gte=valid_from,
-            valid_to__lte=valid_to,
-            service=service).delete()
+        started = time.time()
         requests = requests.filter(service=service)
-        resources = self.extract_resources(requests)
-
-        def push_metric_values(srequests, **mdefaults):
-
-            count = srequests.count()
-            count_mdefaults = mdefaults.copy()
-            count_mdefaults['value'] = count
-            count_mdefaults['label'] = 'Count'
-            count_mdefaults['value_num'] = count
-            count_mdefaults['value_raw'] = count
-            count_mdefaults['samples_count'] = count
-
-            log.debug(MetricValue.add('request.count', **count_mdefaults))
-
-            paths = srequests.distinct('request_path') \
-                .values_list('request_path', flat=True)
-            for path in paths:
-                count = srequests.filter(request_path=path).count()
-                count_mdefaults['value'] = count
-                count_mdefaults['label'] = path
-                count_mdefaults['value_num'] = count
-                count_mdefaults['value_raw'] = count
-                count_mdefaults['samples_count'] = count
-
-                log.debug(MetricValue.add('request.path', **count_mdefaults))
-
-            for mname, cname in (('request.ip', 'client_ip',),
-                                 ('request.users', 'user_identifier',),
-                                 ('request.country', 'client_country'),
-                                 ('request.city', 'client_city',),
-                                 ('request.region', 'client_region'),
-                                 ('request.ua', 'user_agent',),
-                                 ('request.ua.family', 'user_agent_family',),
-                                 ('response.time', 'response_time',),
-                                 ('response.size', 'response_size',),
-                                 ('response.status', 'response_status',),
-                                 ('request.method', 'request_method',),
-                                 ):
-                # calculate overall stats
-                self.set_metric_values(mname, cname, srequests, **mdefaults)
-
-            self.set_error_values(
-                srequests,
-                valid_from,
-                valid_to,
-                service=service,
-                resource=None)
-
-        push_metric_values(requests, **metric_defaults)
-
-        # for each resource we should calculate another set of stats
-        for resource, _requests in [(None, requests,)] + resources:
-
-            metric_defaults['resource'] = resource
-            metric_defaults['event_type'] = event_all
-            push_metric_values(_requests, **metric_defaults)
-
-            # for each event type we need separate metrics set
-            event_types = self.extract_event_types(_requests)
-            for event_type in event_types:
-                event_type_requests = _requests.filter(event_type=event_type)
-                metric_defaults['event_type'] = event_type
-                push_metric_values(event_type_requests, **metric_defaults)
-
-            # combined event types: ows and non-ows
-            for evt, rq in self.extract_special_event_types(_requests):
-                metric_defaults['event_type'] = evt
-                push_metric_values(rq, **metric_defaults)
+        aggregator = RequestsAggregator(service, valid_from, valid_to)
+        if not aggregator.process(requests):
+            return
+        metric_values = aggregator.get_metric_values()
+        with transaction.atomic():
+            # valid_from upper bound limits the scan to matching partitions
+            MetricValue.objects.filter(
+                valid_from__gte=valid_from,
+                valid_from__lt=valid_to,
+                valid_to__lte=valid_to,
+                service=service).delete()
+            MetricValue.objects.bulk_create(metric_values, batch_size=500)
+        log.debug("Processed batch of %s requests from %s to %s into %s metric values in %.3fs",
+                  aggregator.requests_count, valid_from, valid_to, len(metric_values), time.time() - started)
 
     def get_metrics_for(self, metric_name,
                         valid_from=None,
@@ -607,7 +553,8 @@ class CollectorAPI(object):
                         event_type=None,
                         service_type=None,
                         group_by=None,
-                        resource_type=None):
+                        resource_type=None,
+                        use_rollups=True):
         """
         Returns metric data for given metric. Returned dataset contains list of periods and values in that periods
         """
@@ -648,7 +595,8 @@ class CollectorAPI(object):
                                           service_type=service_type,
                                           resource=resource,
                                           resource_type=resource_type,
-                                          group_by=group_by)
+                                          group_by=group_by,
+                                          use_rollups=use_rollups)
             out['data'].append({
                 'valid_from': pstart.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
                 'valid_to': pend.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
@@ -656,7 +604,7 @@ class CollectorAPI(object):
             })
         return out
 
-    def get_aggregate_function(self, column_name, metric_name, service=None):
+    def get_aggregate_function(self, column_name, metric_name, service=None, rollup=False):
         """
         Returns string with metric value column name surrounded by aggregate function
         based on metric type (which tells how to interpret value - is it a counter,
@@ -665,6 +613,8 @@ class CollectorAPI(object):
         metric = Metric.get_for(metric_name, service=service)
         if not metric:
             raise ValueError("Invalid metric {}".format(metric_name))
+        if rollup:
+            return MetricValueRollup.get_aggregate_name(metric)
         f = metric.get_aggregate_name()
         return f or column_name
 
@@ -679,14 +629,29 @@ class CollectorAPI(object):
                          resource_type=None,
                          event_type=None,
                          service_type=None,
-                         group_by=None):
+                         group_by=None,
+                         use_rollups=True):
         """
         Returns metric values for metric within given time span
+
+        If interval is a multiple of one of rollup resolutions and time span
+        is aligned to its buckets, values are read from the coarsest matching
+        rollup. Other time spans hold partial buckets, which are only found
+        in raw values.
         """
         utc = pytz.utc
         params = {}
         col = 'mv.value_num'
-        agg_f = self.get_aggregate_function(col, metric_name, service)
+        resolution = None
+        if use_rollups and metric_name != 'uptime':
+            resolution = get_rollup_resolution(interval)
+        if resolution:
+            rollup_interval = timedelta(seconds=resolution)
+            for edge in (valid_from, valid_to,):
+                if align_period_start(edge, rollup_interval) != edge.replace(tzinfo=utc):
+                    resolution = None
+                    break
+        agg_f = self.get_aggregate_function(col, metric_name, service, rollup=bool(resolution))
         has_agg = agg_f != col
         group_by_map = {'resource': {'select': ['mr.id', 'mr.type', 'mr.name', 'mr.resource_id'],
                                      'from': ['join monitoring_monitoredresource mr on (mv.resource_id = mr.id)'],
@@ -827,6 +792,12 @@ class CollectorAPI(object):
                    'and m.name = %(metric_name)s']
         if metric_name == 'uptime':
             q_where = ['where', 'm.name = %(metric_name)s']
+        elif resolution:
+            q_where = ['where', 'mv.resolution = %(resolution)s',
+                       "and mv.valid_from >= TIMESTAMP %(valid_from)s AT TIME ZONE 'UTC' ",
+                       "and mv.valid_from < TIMESTAMP %(valid_to)s AT TIME ZONE 'UTC' ",
+                       'and m.name = %(metric_name)s']
+            params['resolution'] = resolution
         q_group = ['ml.name']
 
         params.update({'metric_name': metric_name,
@@ -923,6 +894,25 @@ class CollectorAPI(object):
             q_order_by = 'order by {}'.format(','.join(q_order_by))
 
         q = ' '.join(chain(q_select, q_from, q_where, q_group, [q_order_by]))
+        if resolution:
+            for expression, rollup_expression in ROLLUP_EXPRESSIONS:
+                q = q.replace(expression, rollup_expression)
+
+        rows = list(raw_sql(q, params))
+        detail_urls = {}
+        if grouper and 'resource_id' in grouper:
+            detail_urls = self.get_detail_urls(row.get('resource_id') for row in rows
+                                               if row.get('type') != MonitoredResource.TYPE_URL)
+        resolved_urls = {}
+
+        def resolve_url(url):
+            if url not in resolved_urls:
+                try:
+                    resolve(url)
+                    resolved_urls[url] = url
+                except Resolver404:
+                    resolved_urls[url] = ""
+            return resolved_urls[url]
 
         def postproc(row):
             if grouper:
@@ -933,23 +923,24 @@ class CollectorAPI(object):
                         if scol in row:
                             r_id = row.pop(scol)
                             if 'type' in t and t['type'] != MonitoredResource.TYPE_URL:
-                                try:
-                                    rb = ResourceBase.objects.get(id=r_id)
-                                    t['href'] = rb.detail_url
-                                except BaseException:
-                                    t['href'] = ""
+                                t['href'] = detail_urls.get(r_id) or ""
                     else:
                         t[scol] = row.pop(scol)
                         if scol == 'type' and scol in t and t[scol] == MonitoredResource.TYPE_URL:
-                            try:
-                                resolve(t['name'])
-                                t['href'] = t['name']
-                            except Resolver404:
-                                t['href'] = ""
+                            t['href'] = resolve_url(t['name'])
                 row[tcol] = t
             return row
 
-        return [postproc(row) for row in raw_sql(q, params)]
+        return [postproc(row) for row in rows]
+
+    def get_detail_urls(self, resource_ids):
+        """
+        Returns resource id -> detail url mapping for ResourceBase ids, in one query
+        """
+        resource_ids = set(r_id for r_id in resource_ids if r_id is not None)
+        if not resource_ids:
+            return {}
+        return dict(ResourceBase.objects.filter(id__in=resource_ids).values_list('id', 'detail_url'))
 
     def aggregate_past_periods(self, metric_data_q=None, periods=None, **kwargs):
         """
@@ -958,6 +949,16 @@ class CollectorAPI(object):
         """
         return aggregate_past_periods(metric_data_q, periods, **kwargs)
 
+    def update_rollups(self, valid_from, valid_to, service=None):
+        """
+        Recalculate metric rollups for given time span
+        """
+        started = time.time()
+        counter = update_rollups(valid_from, valid_to, service=service)
+        log.debug("Updated %s metric rollups from %s to %s in %.3fs",
+                  counter, valid_from, valid_to, time.time() - started)
+        return counter
+
     def clear_old_data(self):
         utc = pytz.utc
         threshold = settings.MONITORING_DATA_TTL
@@ -965,9 +966,25 @@ class CollectorAPI(object):
             raise TypeError("MONITORING_DATA_TTL should be an instance of "
                             "datatime.timedelta, not {}".format(threshold.__class__))
         cutoff = datetime.utcnow().replace(tzinfo=utc) - threshold
-        ExceptionEvent.objects.filter(created__lte=cutoff).delete()
-        RequestEvent.objects.filter(created__lte=cutoff).delete()
-        MetricValue.objects.filter(valid_to__lte=cutoff).delete()
+        # partitioned tables expire whole days of data at once
+        partitioned = maintain_partitions(cutoff)
+        if ExceptionEvent not in partitioned:
+            ExceptionEvent.objects.filter(created__lte=cutoff).delete()
+        if RequestEvent not in partitioned:
+            RequestEvent.objects.filter(created__lte=cutoff).delete()
+        else:
+            # dropped partitions leave links and exceptions of expired requests behind
+            oldest = RequestEvent.objects.aggregate(oldest=Min('id'))['oldest']
+            links = RequestEvent.resources.through.objects.all()
+            exceptions = ExceptionEvent.objects.all()
+            if oldest:
+                links = links.filter(requestevent_id__lt=oldest)
+                exceptions = exceptions.filter(request_id__lt=oldest)
+            links.delete()
+            exceptions.delete()
+        if MetricValue not in partitioned:
+            MetricValue.objects.filter(valid_to__lte=cutoff).delete()
+        MetricValueRollup.objects.filter(valid_to__lte=cutoff).delete()
 
     def compose_notifications(self, ndata, when=None):
         utc = pytz.utc
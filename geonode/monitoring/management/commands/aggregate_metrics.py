@@ -19,9 +19,14 @@
 #########################################################################
 
 from __future__ import print_function
+import pytz
 import logging
 
+from datetime import datetime
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.utils.translation import ugettext_noop as _
 
 from geonode.monitoring.collector import CollectorAPI
 
@@ -30,6 +35,15 @@ log = logging.getLogger(__name__)
 
 class Command(BaseCommand):
 
+    def add_arguments(self, parser):
+        parser.add_argument('-r', '--rollups', dest='rollups', action='store_true', default=False,
+                            help=_("Rebuild metric rollups from metric values stored "
+                                   "within settings.MONITORING_DATA_TTL"))
+
     def handle(self, *args, **kwargs):
         c = CollectorAPI()
+        if kwargs['rollups']:
+            now = datetime.utcnow().replace(tzinfo=pytz.utc)
+            c.update_rollups(now - settings.MONITORING_DATA_TTL, now)
+            return
         c.aggregate_past_periods()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2019 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+from __future__ import print_function
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import ugettext_noop as _
+
+from geonode.monitoring.partitions import (PARTITIONED_MODELS, partitioning_supported,
+                                           is_partitioned, get_partitions, partition_table)
+
+
+class Command(BaseCommand):
+    """
+    Convert monitoring tables into tables partitioned by day
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('-l', '--list', dest='list_partitions', action='store_true', default=False,
+                            help=_("Show partitions of monitoring tables"))
+
+    def handle(self, *args, **options):
+        if not partitioning_supported():
+            raise CommandError("Table partitioning requires PostgreSQL 11 or newer")
+        for model, field_name in PARTITIONED_MODELS:
+            table = model._meta.db_table
+            if options['list_partitions']:
+                if not is_partitioned(model):
+                    print(table, 'not partitioned')
+                    continue
+                print(table, 'partitioned by', field_name)
+                for name, start, end in get_partitions(model):
+                    print('  ', name, start, '-', end)
+                continue
+            if partition_table(model):
+                print(table, 'partitioned by', field_name)
+            else:
+                print(table, 'already partitioned')
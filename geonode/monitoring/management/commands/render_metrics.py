@@ -20,6 +20,7 @@
 from __future__ import print_function
 
 import pytz
+import time
 import types
 import logging
 import argparse
@@ -75,6 +76,10 @@ class Command(BaseCommand):
         parser.add_argument('-ll', '--label', dest='label', type=TypeChecks.label_type,
                             help=_("Show data for specific label"))
 
+        parser.add_argument('-b', '--benchmark', dest='benchmark', default=0, type=int,
+                            help=_("Compare query times of metric values and metric rollups "
+                                   "over given number of runs"))
+
 
     @timeout_decorator.timeout(LOCAL_TIMEOUT)
     def handle(self, *args, **options):
@@ -98,6 +103,10 @@ class Command(BaseCommand):
                 self.list_labels(m)
             elif options['list_resources']:
                 self.list_resources(m)
+            elif options['benchmark']:
+                self.benchmark_metrics(m, options['since'], options['until'], interval,
+                                       resource=resource, label=label, service=service,
+                                       runs=options['benchmark'])
             else:
                 self.show_metrics(m, options['since'], options['until'], interval, resource=resource, label=label)
 
@@ -147,6 +156,33 @@ class Command(BaseCommand):
             print(' ', row['valid_to'].strftime(TIMESTAMP_OUTPUT), '->', '' if not val else val)
 
 
+    @timeout_decorator.timeout(LOCAL_TIMEOUT)
+    def benchmark_metrics(self, metric, since, until, interval, resource=None, label=None, service=None, runs=1):
+        utc = pytz.utc
+        since = since.replace(tzinfo=utc) if since else None
+        until = until.replace(tzinfo=utc) if until else None
+
+        print('Query times for {} ({} s interval)'.format(metric, int(interval.total_seconds())))
+        best = {}
+        for use_rollups in (False, True):
+            timings = []
+            for i in range(runs):
+                started = time.time()
+                self.collector.get_metrics_for(metric,
+                                               valid_from=since,
+                                               valid_to=until,
+                                               interval=interval,
+                                               resource=resource,
+                                               label=label,
+                                               service=service,
+                                               use_rollups=use_rollups)
+                timings.append(time.time() - started)
+            best[use_rollups] = min(timings)
+            print('  {:<14} best: {:.3f}s avg: {:.3f}s'.format('rollups' if use_rollups else 'metric values',
+                                                              min(timings), sum(timings) / len(timings)))
+        if best[True]:
+            print('  speedup: {:.1f}x'.format(best[False] / best[True]))
+
     @timeout_decorator.timeout(LOCAL_TIMEOUT)
     def list_metrics(self):
         _metrics = self.collector.get_metric_names()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0028_auto_20190830_1018'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricValueRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.PositiveIntegerField(help_text=b'Bucket size in seconds')),
+                ('valid_from', models.DateTimeField()),
+                ('valid_to', models.DateTimeField()),
+                ('metric_count', models.PositiveIntegerField(default=0)),
+                ('samples_count', models.PositiveIntegerField(default=0)),
+                ('value_sum', models.DecimalField(decimal_places=4, default=None, max_digits=30, null=True)),
+                ('value_weighted_sum', models.DecimalField(decimal_places=4, default=None, max_digits=30,
+                                                           null=True)),
+                ('value_min', models.DecimalField(decimal_places=4, default=None, max_digits=20, null=True)),
+                ('value_max', models.DecimalField(decimal_places=4, default=None, max_digits=20, null=True)),
+                ('event_type', models.ForeignKey(blank=True, null=True,
+                                                 on_delete=django.db.models.deletion.CASCADE,
+                                                 related_name='metric_rollups', to='monitoring.EventType')),
+                ('label', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                            related_name='metric_rollups', to='monitoring.MetricLabel')),
+                ('resource', models.ForeignKey(blank=True, null=True,
+                                               on_delete=django.db.models.deletion.CASCADE,
+                                               related_name='metric_rollups', to='monitoring.MonitoredResource')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                              related_name='metric_rollups', to='monitoring.Service')),
+                ('service_metric', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                                     related_name='metric_rollups',
+                                                     to='monitoring.ServiceTypeMetric')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='metricvaluerollup',
+            index_together=set([('resolution', 'valid_from', 'service_metric')]),
+        ),
+    ]
@@ -20,6 +20,7 @@
 from __future__ import print_function
 
 import logging
+import threading
 import types
 import pytz
 from urlparse import urlparse
@@ -27,9 +28,10 @@ from urlparse import urlparse
 from socket import gethostbyname
 from datetime import datetime, timedelta
 from decimal import Decimal
+from collections import OrderedDict
 
 from django import forms
-from django.db import models
+from django.db import models, connection, router, transaction, IntegrityError
 from django.conf import settings
 from django.http import Http404
 from jsonfield import JSONField
@@ -191,9 +193,55 @@ class MonitoredResource(models.Model):
     class Meta:
         unique_together = (('name', 'type',),)
 
+    # (type, name) -> (id, resource_id) of recently used resources, see get_cached
+    _cache = OrderedDict()
+    _cache_lock = threading.Lock()
+
     def __str__(self):
         return 'Monitored Resource: {} {}'.format(self.name, self.type)
 
+    @classmethod
+    def get_cached(cls, resource_type, resource_name, resource_id=None):
+        """
+        Returns monitored resource for type and name, creating it if needed.
+
+        Ids are kept in a bounded in-process LRU, so resources already seen
+        don't need a query on the ingest path. Returned instance holds only
+        id, type, name and resource_id.
+
+        Resources deleted by another process may still be cached here, see
+        :py:meth:`RequestEvent.bulk_from_geonode` for how writes recover.
+        """
+        key = (resource_type, resource_name,)
+        with cls._cache_lock:
+            cached = cls._cache.pop(key, None)
+            if cached is not None:
+                cls._cache[key] = cached
+        if cached is not None and resource_id and cached[1] != resource_id:
+            if cls.objects.filter(id=cached[0]).update(resource_id=resource_id):
+                cached = (cached[0], resource_id,)
+            else:
+                # deleted since it was cached
+                with cls._cache_lock:
+                    cls._cache.pop(key, None)
+                cached = None
+        if cached is None:
+            res, _ = cls.objects.get_or_create(type=resource_type, name=resource_name)
+            if resource_id and res.resource_id != resource_id:
+                cls.objects.filter(id=res.id).update(resource_id=resource_id)
+            cached = (res.id, resource_id or res.resource_id,)
+        with cls._cache_lock:
+            cls._cache[key] = cached
+            while len(cls._cache) > getattr(settings, 'MONITORING_RESOURCES_CACHE_SIZE', 1000):
+                cls._cache.popitem(last=False)
+        return cls.from_db(router.db_for_write(cls), ['id', 'name', 'type', 'resource_id'],
+                           (cached[0], resource_name, resource_type, cached[1],))
+
+    @classmethod
+    def clear_cache(cls, *args, **kwargs):
+        with cls._cache_lock:
+            cls._cache.clear()
+
     @classmethod
     def get(cls, resource_type, resource_name, or_create=False):
         if or_create:
@@ -494,22 +542,12 @@ class RequestEvent(models.Model):
         for r in resources_list:
             if r is None:
                 continue
-            rinst, _ = MonitoredResource.objects.get_or_create(
-                name=r, type=type_name)
-            out.append(rinst)
+            out.append(MonitoredResource.get_cached(type_name, r))
         return out
 
     @classmethod
     def _get_or_create_resources(cls, res_name, res_type, res_id):
-        out = []
-        r, _ = MonitoredResource.objects.get_or_create(
-            name=res_name, type=res_type
-        )
-        if r and res_id:
-            r.resource_id = res_id
-            r.save()
-        out.append(r)
-        return out
+        return [MonitoredResource.get_cached(res_type, res_name, res_id)]
 
     @classmethod
     def _get_geonode_resources(cls, request):
@@ -529,19 +567,26 @@ class RequestEvent(models.Model):
         return resources
 
     @classmethod
-    def _get_event_type(cls, request, default_event_type='view'):
+    def _get_event_type_name(cls, events, default_event_type='view'):
         """
-        Returns event type based on events
+        Returns event type name based on registered events
         """
-        rqmeta = getattr(request, '_monitoring', {})
-        events = set(e[0] for e in rqmeta['events'])
+        events = set(e[0] for e in events)
         event_name = default_event_type
         if len(events) == 1:
             event_name = events.pop()
         elif len(events) == 2 and default_event_type in events:
             events.remove(default_event_type)
             event_name = events.pop()
-        return EventType.get(event_name)
+        return event_name
+
+    @classmethod
+    def _get_event_type(cls, request, default_event_type='view'):
+        """
+        Returns event type based on events
+        """
+        rqmeta = getattr(request, '_monitoring', {})
+        return EventType.get(cls._get_event_type_name(rqmeta['events'], default_event_type))
 
     @staticmethod
     def _get_ua_family(ua):
@@ -593,29 +638,6 @@ class RequestEvent(models.Model):
                             'client_city': city})
         return out
 
-    @classmethod
-    def _get_user_data_gn(cls, request):
-        out = {}
-        # check consent
-        if not cls._get_user_consent(request):
-            return out
-
-        rqmeta = getattr(request, '_monitoring', {})
-        if rqmeta.get('user_identifier'):
-            out['user_identifier'] = rqmeta.get('user_identifier')
-        if rqmeta.get('user_username'):
-            out['user_username'] = rqmeta.get('user_username')
-
-        ua = request.META.get('HTTP_USER_AGENT') or ''
-        ua_data = cls._get_user_agent(ua)
-        out.update(ua_data)
-
-        request_ip, is_routable = get_client_ip(request)
-        if request_ip and is_routable:
-            location_data = cls._get_user_location(request_ip)
-            out.update(location_data)
-        return out
-
     @classmethod
     def _get_user_data_gs(cls, request):
         out = {}
@@ -635,7 +657,15 @@ class RequestEvent(models.Model):
         return out
 
     @classmethod
-    def from_geonode(cls, service, request, response):
+    def capture_geonode(cls, request, response):
+        """
+        Collects data needed to write RequestEvent for GeoNode request.
+
+        This doesn't touch database nor GeoIP, so it's cheap enough to be
+        called within request/response cycle. Captured data is plain
+        python structure, which can be written later with
+        :py:meth:`RequestEvent.bulk_from_geonode`.
+        """
         from geonode.utils import parse_datetime
 
         received = datetime.utcnow().replace(tzinfo=pytz.utc)
@@ -649,66 +679,105 @@ class RequestEvent(models.Model):
                 tzinfo=pytz.utc))
         duration = (_ended - created).microseconds / 1000.0
 
-        sensitive_data = cls._get_user_data_gn(request)
-        event_type = cls._get_event_type(request)
-
-        # ua = request.META.get('HTTP_USER_AGENT') or ''
-        # ua_family = cls._get_ua_family(ua)
-        #
-        # ip, is_routable = get_client_ip(request)
-        # lat = lon = None
-        # country = region = city = None
-        # if ip and is_routable:
-        #     ip = ip.split(':')[0]
-        #     if settings.TEST and ip == 'testserver':
-        #         ip = '127.0.0.1'
-        #     try:
-        #         ip = gethostbyname(ip)
-        #     except Exception as err:
-        #         pass
-        #
-        #     geoip = get_geoip()
-        #     try:
-        #         client_loc = geoip.city(ip)
-        #     except Exception as err:
-        #         log.warning("Cannot resolve %s: %s", ip, err)
-        #         client_loc = None
-        #
-        #     if client_loc:
-        #         lat, lon = client_loc['latitude'], client_loc['longitude'],
-        #         country = client_loc.get(
-        #             'country_code3') or client_loc['country_code']
-        #         if len(country) == 2:
-        #             _c = pycountry.countries.get(alpha_2=country)
-        #             country = _c.alpha_3
-        #
-        #         region = client_loc['region']
-        #         city = client_loc['city']
-
         data = {'received': received,
                 'created': created,
                 'host': request.get_host(),
-                'service': service,
                 'user_identifier': None,
                 'user_username': None,
-                'event_type': event_type,
                 'request_path': request.get_full_path(),
                 'request_method': request.method,
                 'response_status': response.status_code,
                 'response_size':
-                    response.get('Content-length') or len(response.getvalue()),
+                    response.get('Content-length') or (0 if response.streaming else len(response.getvalue())),
                 'response_type': response.get('Content-type'),
                 'response_time': duration}
 
-        data.update(sensitive_data)
+        client_ip = None
+        # check consent
+        if cls._get_user_consent(request):
+            if rqmeta.get('user_identifier'):
+                data['user_identifier'] = rqmeta.get('user_identifier')
+            if rqmeta.get('user_username'):
+                data['user_username'] = rqmeta.get('user_username')
+            data['user_agent'] = request.META.get('HTTP_USER_AGENT') or ''
+
+            request_ip, is_routable = get_client_ip(request)
+            if request_ip and is_routable:
+                client_ip = request_ip
+
+        events = rqmeta.get('events') or []
+        return {'data': data,
+                'event_type': cls._get_event_type_name(events),
+                'resources': [(res_type, res_name, res_id,)
+                              for evt_type, res_type, res_name, res_id in events],
+                'client_ip': client_ip,
+                'exceptions': []}
+
+    @classmethod
+    def bulk_from_geonode(cls, service, events):
+        """
+        Writes RequestEvents, with affected resources and exceptions,
+        for a list of GeoNode requests captured with
+        :py:meth:`RequestEvent.capture_geonode`.
+
+        Events are inserted with one bulk query, and resources are linked
+        with another one. If a cached resource was deleted meanwhile, the
+        resources cache is cleared and the write retried once. Returns list
+        of created RequestEvents.
+        """
+        event_types = {}
+        instances = []
+        for event in events:
+            data = dict(event['data'], service=service)
+            event_name = event['event_type']
+            if event_name not in event_types:
+                event_types[event_name] = EventType.get(event_name)
+            data['event_type'] = event_types[event_name]
+            if data.get('user_agent') is not None:
+                data.update(cls._get_user_agent(data['user_agent']))
+            if event['client_ip']:
+                data.update(cls._get_user_location(event['client_ip']))
+            instances.append(cls(**data))
 
         try:
-            inst = cls.objects.create(**data)
-            resources = cls._get_geonode_resources(request)
-            if resources:
-                inst.resources.add(*resources)
-                inst.save()
-            return inst
+            cls._bulk_save(service, instances, events)
+        except IntegrityError:
+            # a cached monitored resource was deleted by another process
+            MonitoredResource.clear_cache()
+            for inst in instances:
+                inst.pk = None
+            cls._bulk_save(service, instances, events)
+        return instances
+
+    @classmethod
+    def _bulk_save(cls, service, instances, events):
+        with transaction.atomic():
+            if connection.features.can_return_ids_from_bulk_insert:
+                cls.objects.bulk_create(instances)
+            else:
+                for inst in instances:
+                    inst.save()
+
+            through = cls.resources.through
+            links = []
+            for inst, event in zip(instances, events):
+                linked = set()
+                for res_type, res_name, res_id in event['resources']:
+                    r = MonitoredResource.get_cached(res_type, res_name, res_id)
+                    if r.id not in linked:
+                        linked.add(r.id)
+                        links.append(through(requestevent_id=inst.id,
+                                             monitoredresource_id=r.id))
+                for error_type, message, stack_trace in event['exceptions']:
+                    ExceptionEvent.add_error(service, error_type, stack_trace, request=inst, message=message)
+            if links:
+                through.objects.bulk_create(links)
+
+    @classmethod
+    def from_geonode(cls, service, request, response):
+        try:
+            event = cls.capture_geonode(request, response)
+            return cls.bulk_from_geonode(service, [event])[0]
         except BaseException:
             return None
 
@@ -842,7 +911,7 @@ class ExceptionEvent(models.Model):
                                   service=from_service,
                                   error_type=error_type,
                                   error_data=stack_trace,
-                                  error_message=message or '',
+                                  error_message=(message or '')[:255],
                                   request=request)
 
     @property
@@ -1061,6 +1130,58 @@ class MetricValue(models.Model):
         return q
 
 
+class MetricValueRollup(models.Model):
+    """
+    Metric values pre-aggregated into fixed size buckets.
+
+    Each row summarizes metric values of one service, metric, resource,
+    label and event type starting within [valid_from, valid_to), so long
+    intervals can be read without scanning raw values. Rollups are kept
+    up to date by the collector, see aggregation.update_rollups.
+    """
+    # aggregate expressions matching Metric.AGGREGATE_MAP on rollup columns
+    AGGREGATE_MAP = {Metric.TYPE_RATE: ('(case when sum(samples_count)> 0 '
+                                        'then sum(value_weighted_sum)'
+                                        '/sum(samples_count) else 0 end)'),
+                     Metric.TYPE_VALUE: 'sum(value_sum)',
+                     Metric.TYPE_VALUE_NUMERIC: 'max(value_max)',
+                     Metric.TYPE_COUNT: 'sum(value_sum)'}
+
+    resolution = models.PositiveIntegerField(null=False, help_text=_("Bucket size in seconds"))
+    valid_from = models.DateTimeField(null=False)
+    valid_to = models.DateTimeField(null=False)
+    service_metric = models.ForeignKey(ServiceTypeMetric, related_name='metric_rollups')
+    service = models.ForeignKey(Service, related_name='metric_rollups')
+    event_type = models.ForeignKey(
+        EventType,
+        null=True,
+        blank=True,
+        related_name='metric_rollups')
+    resource = models.ForeignKey(
+        MonitoredResource,
+        null=True,
+        blank=True,
+        related_name='metric_rollups')
+    label = models.ForeignKey(MetricLabel, related_name='metric_rollups')
+    metric_count = models.PositiveIntegerField(null=False, default=0)
+    samples_count = models.PositiveIntegerField(null=False, default=0)
+    value_sum = models.DecimalField(max_digits=30, decimal_places=4, null=True, default=None)
+    value_weighted_sum = models.DecimalField(max_digits=30, decimal_places=4, null=True, default=None)
+    value_min = models.DecimalField(max_digits=20, decimal_places=4, null=True, default=None)
+    value_max = models.DecimalField(max_digits=20, decimal_places=4, null=True, default=None)
+
+    class Meta:
+        index_together = (('resolution', 'valid_from', 'service_metric',),)
+
+    def __str__(self):
+        return 'Metric Rollup: {} [{}s] (since {} until {})'.format(
+            self.service_metric.metric.name, self.resolution, self.valid_from, self.valid_to)
+
+    @classmethod
+    def get_aggregate_name(cls, metric):
+        return cls.AGGREGATE_MAP[metric.type]
+
+
 class NotificationCheck(models.Model):
 
     GRACE_PERIOD_1M = timedelta(seconds=60)
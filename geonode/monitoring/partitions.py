@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2019 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+"""
+Daily partitions for monitoring tables.
+
+On PostgreSQL 11+ request events, exception events and metric values can be
+stored in tables partitioned by day, so expired data is removed by dropping
+whole partitions instead of deleting rows. Tables are converted with the
+partition_monitoring_data command, other databases keep plain tables.
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+import pytz
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from geonode.monitoring.models import RequestEvent, ExceptionEvent, MetricValue
+
+
+log = logging.getLogger(__name__)
+
+# partitioned models and their partition key
+PARTITIONED_MODELS = ((RequestEvent, 'created',),
+                      (ExceptionEvent, 'created',),
+                      (MetricValue, 'valid_from',),)
+
+PARTITION_INTERVAL = timedelta(days=1)
+PARTITION_SUFFIX = '_p'
+PARTITION_SUFFIX_FORMAT = '%Y%m%d'
+DEFAULT_PARTITION_SUFFIX = '_default'
+
+
+def partitioning_supported():
+    return connection.vendor == 'postgresql' and connection.pg_version >= 110000
+
+
+def get_partition_column(model):
+    for partitioned_model, field_name in PARTITIONED_MODELS:
+        if partitioned_model is model:
+            return model._meta.get_field(field_name).column
+    raise ValueError("{} is not partitioned by day".format(model.__name__))
+
+
+def get_partition_name(model, day):
+    return '{}{}{}'.format(model._meta.db_table, PARTITION_SUFFIX, day.strftime(PARTITION_SUFFIX_FORMAT))
+
+
+def get_day_start(value):
+    return datetime(*value.astimezone(pytz.utc).date().timetuple()[:3]).replace(tzinfo=pytz.utc)
+
+
+def is_partitioned(model):
+    if not partitioning_supported():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('select 1 from pg_partitioned_table pt '
+                       'join pg_class c on (c.oid = pt.partrelid) '
+                       'where c.relname = %s', [model._meta.db_table])
+        return cursor.fetchone() is not None
+
+
+def get_partitions(model):
+    """
+    Returns list of (name, start, end) daily partitions of model table, oldest first
+    """
+    table = model._meta.db_table
+    prefix = table + PARTITION_SUFFIX
+    with connection.cursor() as cursor:
+        cursor.execute('select c.relname from pg_inherits i '
+                       'join pg_class c on (c.oid = i.inhrelid) '
+                       'join pg_class p on (p.oid = i.inhparent) '
+                       'where p.relname = %s', [table])
+        names = [row[0] for row in cursor.fetchall()]
+    out = []
+    for name in names:
+        if not name.startswith(prefix):
+            continue
+        try:
+            start = datetime.strptime(name[len(prefix):], PARTITION_SUFFIX_FORMAT).replace(tzinfo=pytz.utc)
+        except ValueError:
+            continue
+        out.append((name, start, start + PARTITION_INTERVAL,))
+    out.sort(key=lambda p: p[1])
+    return out
+
+
+def create_partitions(model, since, until):
+    """
+    Creates missing daily partitions covering [since, until).
+
+    Rows already stored in the default partition for a new day are moved
+    to it. Returns number of partitions created.
+    """
+    qn = connection.ops.quote_name
+    table = model._meta.db_table
+    column = get_partition_column(model)
+    existing = set(name for name, start, end in get_partitions(model))
+    counter = 0
+    day = get_day_start(since)
+    while day < until:
+        name = get_partition_name(model, day)
+        if name not in existing:
+            params = [day, day + PARTITION_INTERVAL]
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute('create table {} (like {} including defaults including constraints)'
+                               .format(qn(name), qn(table)))
+                cursor.execute('with moved as (delete from {} where {col} >= %s and {col} < %s returning *) '
+                               'insert into {} select * from moved'
+                               .format(qn(table + DEFAULT_PARTITION_SUFFIX), qn(name), col=qn(column)), params)
+                cursor.execute('alter table {} attach partition {} for values from (%s) to (%s)'
+                               .format(qn(table), qn(name)), params)
+            counter += 1
+        day += PARTITION_INTERVAL
+    return counter
+
+
+def drop_partitions(model, cutoff):
+    """
+    Drops daily partitions holding only rows older than cutoff, and removes
+    expired rows from the default partition. Returns number of partitions dropped.
+    """
+    qn = connection.ops.quote_name
+    table = model._meta.db_table
+    counter = 0
+    with connection.cursor() as cursor:
+        for name, start, end in get_partitions(model):
+            if end > cutoff:
+                break
+            cursor.execute('drop table {}'.format(qn(name)))
+            counter += 1
+        cursor.execute('delete from {} where {} < %s'.format(qn(table + DEFAULT_PARTITION_SUFFIX),
+                                                             qn(get_partition_column(model))), [cutoff])
+    return counter
+
+
+def maintain_partitions(cutoff, now=None):
+    """
+    Creates partitions ahead of time and drops expired ones for partitioned
+    monitoring tables. Returns list of models which are partitioned.
+    """
+    now = now or datetime.utcnow().replace(tzinfo=pytz.utc)
+    ahead = timedelta(days=getattr(settings, 'MONITORING_PARTITIONS_AHEAD', 3))
+    out = []
+    for model, field_name in PARTITIONED_MODELS:
+        if not is_partitioned(model):
+            continue
+        created = create_partitions(model, now, now + ahead)
+        dropped = drop_partitions(model, cutoff)
+        log.debug("Partitions of %s: %s created, %s dropped", model._meta.db_table, created, dropped)
+        out.append(model)
+    return out
+
+
+def partition_table(model, ahead=None):
+    """
+    Converts model table into a table partitioned by day, copying existing rows.
+
+    Foreign keys referencing the table are dropped, as PostgreSQL cannot
+    reference partitioned tables; indexes are recreated on the new table,
+    except unique ones not containing the partition key.
+    """
+    if not partitioning_supported():
+        raise ValueError("Table partitioning requires PostgreSQL 11 or newer")
+    if is_partitioned(model):
+        return False
+    qn = connection.ops.quote_name
+    table = model._meta.db_table
+    legacy = table + '_legacy'
+    column = get_partition_column(model)
+    pk = model._meta.pk.column
+    now = datetime.utcnow().replace(tzinfo=pytz.utc)
+    if ahead is None:
+        ahead = timedelta(days=getattr(settings, 'MONITORING_PARTITIONS_AHEAD', 3))
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("select conrelid::regclass::text, conname from pg_constraint "
+                       "where contype = 'f' and confrelid = %s::regclass", [table])
+        for relation, constraint in cursor.fetchall():
+            cursor.execute('alter table {} drop constraint {}'.format(relation, qn(constraint)))
+
+        cursor.execute('select i.indexname, i.indexdef, x.indisprimary, x.indisunique from pg_indexes i '
+                       'join pg_class c on (c.relname = i.indexname) '
+                       'join pg_index x on (x.indexrelid = c.oid) '
+                       'where i.tablename = %s', [table])
+        indexes = cursor.fetchall()
+        cursor.execute('select pg_get_serial_sequence(%s, %s)', [table, pk])
+        sequence = cursor.fetchone()[0]
+        cursor.execute('select min({}) from {}'.format(qn(column), qn(table)))
+        oldest = cursor.fetchone()[0]
+
+        cursor.execute('alter table {} rename to {}'.format(qn(table), qn(legacy)))
+        cursor.execute('create table {} (like {} including defaults including constraints) '
+                       'partition by range ({})'.format(qn(table), qn(legacy), qn(column)))
+        if sequence:
+            cursor.execute('alter sequence {} owned by {}.{}'.format(sequence, qn(table), qn(pk)))
+        cursor.execute('create table {} partition of {} default'.format(qn(table + DEFAULT_PARTITION_SUFFIX),
+                                                                        qn(table)))
+        create_partitions(model, oldest or now, now + ahead)
+        cursor.execute('insert into {} select * from {}'.format(qn(table), qn(legacy)))
+        cursor.execute('drop table {}'.format(qn(legacy)))
+
+        # primary key must contain the partition key
+        cursor.execute('alter table {} add primary key ({}, {})'.format(qn(table), qn(pk), qn(column)))
+        for name, definition, is_primary, is_unique in indexes:
+            if is_primary:
+                continue
+            if is_unique and column not in definition:
+                log.warning("Skipping unique index %s without partition key: %s", name, definition)
+                continue
+            cursor.execute(definition)
+    return True
@@ -41,20 +41,20 @@ from django.core import mail
 from django.conf import settings
 from django.db import connections
 from django.core.urlresolvers import reverse
-from django.test.utils import override_settings
+from django.test.utils import override_settings, CaptureQueriesContext
 from django.core.management import call_command
 from django.contrib.auth import get_user, get_user_model
 
 from geonode.monitoring.models import (
     RequestEvent, Host, Service, ServiceType,
     populate, ExceptionEvent, MetricNotificationCheck,
-    MetricValue, NotificationCheck, Metric, EventType,
+    MetricValue, MetricValueRollup, NotificationCheck, Metric, EventType,
     MonitoredResource, MetricLabel,
     NotificationMetricDefinition,)
 from geonode.monitoring.models import do_autoconfigure
 
 from geonode.monitoring.collector import CollectorAPI
-from geonode.monitoring.utils import generate_periods, align_period_start
+from geonode.monitoring.utils import generate_periods, align_period_start, RequestToMonitoringThread
 
 from geonode.maps.models import Map
 from geonode.layers.models import Layer
@@ -65,7 +65,8 @@ from geonode.monitoring.models import *  # noqa
 from geonode.tests.utils import Client
 from geonode.geoserver.helpers import ogc_server_settings
 
-from django.test.client import FakePayload, Client as DjangoTestClient
+from django.http import HttpResponse
+from django.test.client import FakePayload, RequestFactory, Client as DjangoTestClient
 
 import gisdata
 from geoserver.catalog import Catalog
@@ -336,6 +337,210 @@ class RequestsTestCase(MonitoringTestBase):
         eq = ExceptionEvent.objects.get()
         self.assertEqual('django.http.response.Http404', eq.error_type)
 
+    def test_gn_request_writer(self):
+        """
+        Test if buffered writer stores geonode requests in batches
+        """
+        started = datetime.utcnow().replace(tzinfo=pytz.utc)
+        events = []
+        for idx in range(3):
+            request = RequestFactory().get('/layers/', HTTP_USER_AGENT=self.ua)
+            request._monitoring = {'started': started,
+                                   'finished': started + timedelta(milliseconds=10),
+                                   'resources': {},
+                                   'events': [('view', 'layer', 'geonode:layer{}'.format(idx % 2), None,)]}
+            events.append(RequestEvent.capture_geonode(request, HttpResponse('test')))
+
+        writer = RequestToMonitoringThread(self.service, queue_size=2, flush_size=10, flush_interval=10)
+        self.assertEqual([writer.add(e) for e in events], [True, True, False])
+        # nothing is written until the writer flushes
+        self.assertEqual(RequestEvent.objects.count(), 0)
+
+        writer.flush(writer.get_batch())
+        stats = writer.stats
+        self.assertEqual(stats['queued'], 2)
+        self.assertEqual(stats['dropped'], 1)
+        self.assertEqual(stats['written'], 2)
+        self.assertEqual(stats['pending'], 0)
+        self.assertEqual(RequestEvent.objects.count(), 2)
+        self.assertEqual(
+            sorted(RequestEvent.objects.values_list('resources__name', flat=True)),
+            ['geonode:layer0', 'geonode:layer1'])
+
+        # exceptions keep their message, pending events are written on exit
+        events[2]['exceptions'].append(('exceptions.ValueError', 'invalid layer', ['Traceback']))
+        self.assertTrue(writer.add(events[2]))
+        writer.flush_pending()
+        self.assertEqual(RequestEvent.objects.count(), 3)
+        error = ExceptionEvent.objects.get(error_type='exceptions.ValueError')
+        self.assertEqual(error.error_message, 'invalid layer')
+
+    def test_requests_batch_aggregation(self):
+        """
+        Test if requests batch is aggregated with constant number of queries
+        """
+        c = CollectorAPI()
+        valid_from = datetime.utcnow().replace(tzinfo=pytz.utc, second=0, microsecond=0)
+        queries = []
+        for batch, size in enumerate((5, 20,)):
+            valid_from = valid_from + timedelta(minutes=1)
+            valid_to = valid_from + timedelta(minutes=1)
+            events = []
+            for idx in range(size):
+                request = RequestFactory().get('/layers/{}/{}/'.format(batch, idx % 3), HTTP_USER_AGENT=self.ua)
+                request._monitoring = {'started': valid_from + timedelta(seconds=idx),
+                                       'finished': valid_from + timedelta(seconds=idx, milliseconds=10),
+                                       'resources': {},
+                                       'events': [('view', 'layer', 'geonode:layer{}'.format(idx % 2), None,)]}
+                events.append(RequestEvent.capture_geonode(request, HttpResponse('test')))
+            RequestEvent.bulk_from_geonode(self.service, events)
+            requests = RequestEvent.objects.filter(created__gte=valid_from, created__lt=valid_to)
+
+            with CaptureQueriesContext(connections['default']) as ctx:
+                c.process_requests_batch(self.service, requests, valid_from, valid_to)
+            queries.append(len(ctx.captured_queries))
+
+            values = MetricValue.objects.filter(valid_from=valid_from, valid_to=valid_to,
+                                                service_metric__metric__name='request.count')
+            self.assertEqual(values.get(resource=None, event_type__name=EventType.EVENT_ALL).value_num, size)
+            self.assertEqual(values.get(resource__name='geonode:layer0',
+                                        event_type__name=EventType.EVENT_VIEW).value_num, (size + 1) // 2)
+            self.assertEqual(values.get(resource=None, event_type__name=EventType.EVENT_OWS).value_num, 0)
+            paths = MetricValue.objects.filter(valid_from=valid_from, valid_to=valid_to, resource=None,
+                                               event_type__name=EventType.EVENT_ALL,
+                                               service_metric__metric__name='request.path')
+            self.assertEqual(sorted(paths.values_list('label__name', 'value_num')),
+                             [('/layers/{}/{}/'.format(batch, idx), len(range(idx, size, 3)),) for idx in range(3)])
+        # number of queries doesn't depend on number of requests in batch
+        self.assertEqual(queries[0], queries[1])
+
+    def test_metric_rollups(self):
+        """
+        Test if rollups are maintained and give the same results as metric values
+        """
+        c = CollectorAPI()
+        hour_start = datetime.utcnow().replace(tzinfo=pytz.utc, minute=0, second=0, microsecond=0) - \
+            timedelta(hours=1)
+        sizes = (3, 5, 2,)
+        for minute, size in enumerate(sizes, start=1):
+            valid_from = hour_start + timedelta(minutes=minute)
+            valid_to = valid_from + timedelta(minutes=1)
+            events = []
+            for idx in range(size):
+                request = RequestFactory().get('/layers/{}/'.format(idx), HTTP_USER_AGENT=self.ua)
+                request._monitoring = {'started': valid_from + timedelta(seconds=idx),
+                                       'finished': valid_from + timedelta(seconds=idx, milliseconds=10),
+                                       'resources': {},
+                                       'events': [('view', 'layer', 'geonode:layer0', None,)]}
+                events.append(RequestEvent.capture_geonode(request, HttpResponse('test')))
+            RequestEvent.bulk_from_geonode(self.service, events)
+            requests = RequestEvent.objects.filter(created__gte=valid_from, created__lt=valid_to)
+            c.process_requests_batch(self.service, requests, valid_from, valid_to)
+        c.update_rollups(hour_start, hour_start + timedelta(hours=1), service=self.service)
+
+        rollups = MetricValueRollup.objects.filter(service_metric__metric__name='request.count',
+                                                   resource=None, event_type__name=EventType.EVENT_ALL)
+        self.assertEqual(list(rollups.filter(resolution=60).order_by('valid_from')
+                                     .values_list('value_sum', flat=True)), list(sizes))
+        hourly = rollups.get(resolution=3600)
+        self.assertEqual(hourly.valid_from, hour_start)
+        self.assertEqual(hourly.value_sum, sum(sizes))
+        self.assertEqual(hourly.metric_count, len(sizes))
+        self.assertEqual(rollups.get(resolution=86400).value_sum, sum(sizes))
+
+        # rollups are rebuilt, not accumulated
+        c.update_rollups(hour_start, hour_start + timedelta(hours=1), service=self.service)
+        self.assertEqual(rollups.get(resolution=3600).value_sum, sum(sizes))
+
+        for metric_name in ('request.count', 'response.time', 'request.ua',):
+            data = [c.get_metrics_data(metric_name, hour_start, hour_start + timedelta(hours=1),
+                                       interval=timedelta(hours=1), service=self.service,
+                                       use_rollups=use_rollups)
+                    for use_rollups in (False, True,)]
+            self.assertTrue(data[1])
+            self.assertEqual(sorted((row['label'], row['val'], row['samples_count'],) for row in data[0]),
+                             sorted((row['label'], row['val'], row['samples_count'],) for row in data[1]))
+
+        # time spans not aligned to rollup buckets are read from raw values
+        valid_from = hour_start + timedelta(minutes=2)
+        data = [c.get_metrics_data('request.count', valid_from, valid_from + timedelta(hours=1),
+                                   interval=timedelta(hours=1), service=self.service,
+                                   use_rollups=use_rollups)
+                for use_rollups in (False, True,)]
+        self.assertTrue(data[1])
+        self.assertEqual(sorted((row['label'], row['val'], row['samples_count'],) for row in data[0]),
+                         sorted((row['label'], row['val'], row['samples_count'],) for row in data[1]))
+
+    def test_monitored_resources_cache(self):
+        """
+        Test if monitored resources are resolved from in-process cache
+        """
+        MonitoredResource.clear_cache()
+        res = MonitoredResource.get_cached(MonitoredResource.TYPE_LAYER, 'geonode:cached')
+        self.assertTrue(MonitoredResource.objects.filter(id=res.id).exists())
+        with CaptureQueriesContext(connections['default']) as ctx:
+            cached = MonitoredResource.get_cached(MonitoredResource.TYPE_LAYER, 'geonode:cached')
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(cached.id, res.id)
+
+        # resource id changes are written through
+        MonitoredResource.get_cached(MonitoredResource.TYPE_LAYER, 'geonode:cached', 10)
+        self.assertEqual(MonitoredResource.objects.get(id=res.id).resource_id, 10)
+        with CaptureQueriesContext(connections['default']) as ctx:
+            MonitoredResource.get_cached(MonitoredResource.TYPE_LAYER, 'geonode:cached', 10)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        # deleted resources are evicted
+        MonitoredResource.objects.filter(id=res.id).delete()
+        self.assertNotEqual(MonitoredResource.get_cached(MonitoredResource.TYPE_LAYER, 'geonode:cached').id,
+                            res.id)
+
+        # resources deleted by other processes are recreated
+        res = MonitoredResource.get_cached(MonitoredResource.TYPE_LAYER, 'geonode:cached')
+        MonitoredResource._cache[(MonitoredResource.TYPE_LAYER, 'geonode:cached',)] = (res.id + 1000, None,)
+        stale = MonitoredResource.get_cached(MonitoredResource.TYPE_LAYER, 'geonode:cached', 10)
+        self.assertEqual(stale.id, res.id)
+        self.assertEqual(MonitoredResource.objects.get(id=res.id).resource_id, 10)
+
+        with self.settings(MONITORING_RESOURCES_CACHE_SIZE=2):
+            for idx in range(3):
+                MonitoredResource.get_cached(MonitoredResource.TYPE_LAYER, 'geonode:cached{}'.format(idx))
+            self.assertEqual(list(MonitoredResource._cache.keys()),
+                             [(MonitoredResource.TYPE_LAYER, 'geonode:cached1',),
+                              (MonitoredResource.TYPE_LAYER, 'geonode:cached2',)])
+
+    def test_partitioned_metric_values(self):
+        """
+        Test if metric values can be stored in daily partitions and expired by dropping them
+        """
+        from geonode.monitoring import partitions
+        if not partitions.partitioning_supported():
+            self.skipTest("Table partitioning requires PostgreSQL 11 or newer")
+
+        today = partitions.get_day_start(datetime.utcnow().replace(tzinfo=pytz.utc))
+        for days in (3, 2, 0,):
+            valid_from = today - timedelta(days=days) + timedelta(hours=1)
+            MetricValue.add('request.count', valid_from, valid_from + timedelta(minutes=1),
+                            self.service, 'Count', value=1, value_raw=1, value_num=1, samples_count=1)
+
+        self.assertTrue(partitions.partition_table(MetricValue, ahead=timedelta(days=1)))
+        self.assertTrue(partitions.is_partitioned(MetricValue))
+        self.assertFalse(partitions.partition_table(MetricValue))
+        days = [start for name, start, end in partitions.get_partitions(MetricValue)]
+        self.assertEqual(days, [today - timedelta(days=d) for d in (3, 2, 1, 0, -1,)])
+        self.assertEqual(MetricValue.objects.count(), 3)
+
+        # new values are routed to partitions, missing ones are created ahead
+        valid_from = today + timedelta(days=2)
+        MetricValue.add('request.count', valid_from, valid_from + timedelta(minutes=1),
+                        self.service, 'Count', value=1, value_raw=1, value_num=1, samples_count=1)
+        self.assertEqual(partitions.create_partitions(MetricValue, today, today + timedelta(days=3)), 1)
+        self.assertEqual(MetricValue.objects.filter(valid_from=valid_from).count(), 1)
+
+        self.assertEqual(partitions.maintain_partitions(today - timedelta(days=1)), [MetricValue])
+        self.assertEqual(partitions.get_partitions(MetricValue)[0][1], today - timedelta(days=1))
+        self.assertEqual(MetricValue.objects.count(), 2)
+
     def test_service_handlers(self):
         """
         Test if we can calculate metrics
@@ -19,6 +19,8 @@
 #########################################################################
 
 import os
+import time
+import atexit
 import pytz
 import Queue
 import logging
@@ -35,6 +37,7 @@ from datetime import datetime, timedelta
 from defusedxml import lxml as dlxml
 
 from django.conf import settings
+from django.db import connection
 from django.db.models.fields.related import RelatedField
 
 from geonode.settings import DATETIME_INPUT_FORMATS
@@ -50,46 +53,169 @@ class MonitoringHandler(logging.Handler):
     def __init__(self, service, *args, **kwargs):
         super(MonitoringHandler, self).__init__(*args, **kwargs)
         self.service = service
+        self.async_writes = bool(service) and getattr(settings, 'MONITORING_ASYNC_WRITES', False)
 
     def emit(self, record):
-        from geonode.monitoring.models import RequestEvent, ExceptionEvent
+        from geonode.monitoring.models import RequestEvent
 
         exc_info = record.exc_info
         req = record.request
         resp = record.response
-        if not req._monitoring.get('processed'):
+        if req._monitoring.get('processed'):
+            return
+        try:
+            event = RequestEvent.capture_geonode(req, resp)
+        except BaseException:
+            req._monitoring['processed'] = None
+            return
+        if exc_info:
+            tb = traceback.format_exception(*exc_info)
+            _cls = exc_info[1].__class__
             try:
-                re = RequestEvent.from_geonode(self.service, req, resp)
-                req._monitoring['processed'] = re
+                message = unicode(exc_info[1])
             except BaseException:
-                req._monitoring['processed'] = None
-        re = req._monitoring.get('processed')
-
-        if re and exc_info:
-            tb = traceback.format_exception(*exc_info)
-            ExceptionEvent.add_error(self.service, exc_info[1], tb, request=re)
+                message = repr(exc_info[1])
+            event['exceptions'].append(('{}.{}'.format(_cls.__module__, _cls.__name__), message, tb,))
+        req._monitoring['processed'] = True
+
+        if self.async_writes:
+            # the writer is looked up on each event, as the handler may have
+            # been created before the process forked and its thread is gone
+            RequestToMonitoringThread.get_instance(self.service).add(event)
+            return
+        try:
+            RequestToMonitoringThread.write(self.service, [event])
+        except BaseException as err:
+            log.error("Cannot write monitoring event: %s", err, exc_info=True)
 
 
 class RequestToMonitoringThread(threading.Thread):
-    q = Queue.Queue()
+    """
+    Background writer for RequestEvents captured by MonitoringMiddleware.
 
-    def __init__(self, service, *args, **kwargs):
+    Captured events are put into bounded in-process queue, and written by
+    this thread with bulk inserts every ``flush_size`` events or every
+    ``flush_interval`` milliseconds, whichever comes first. When the queue
+    is full, new events are dropped (and counted) instead of blocking the
+    request.
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, service, queue_size=None, flush_size=None, flush_interval=None,
+                 *args, **kwargs):
         super(RequestToMonitoringThread, self).__init__(*args, **kwargs)
+        self.daemon = True
         self.service = service
+        self.q = Queue.Queue(
+            queue_size or getattr(settings, 'MONITORING_QUEUE_SIZE', 10000))
+        self.flush_size = flush_size or getattr(settings, 'MONITORING_FLUSH_SIZE', 100)
+        self.flush_interval = (
+            flush_interval or getattr(settings, 'MONITORING_FLUSH_INTERVAL', 500)) / 1000.0
+        self._stats_lock = threading.Lock()
+        self._stats = {'queued': 0,
+                       'written': 0,
+                       'dropped': 0,
+                       'failed': 0,
+                       'flushes': 0}
 
-    def add(self, req, resp):
-        item = (req, resp,)
-        RequestToMonitoringThread.q.put(item)
+    @classmethod
+    def get_instance(cls, service):
+        """
+        Returns running writer for given service, one per process
+        """
+        with cls._instances_lock:
+            writer = cls._instances.get(service.id)
+            if writer is None or not writer.is_alive():
+                writer = cls(service)
+                writer.start()
+                cls._instances[service.id] = writer
+            return writer
 
-    def run(self):
+    @staticmethod
+    def write(service, events):
         from geonode.monitoring.models import RequestEvent
+        return RequestEvent.bulk_from_geonode(service, events)
 
-        q = RequestToMonitoringThread.q
+    def _incr(self, name, value=1):
+        with self._stats_lock:
+            self._stats[name] += value
+
+    @property
+    def stats(self):
+        """
+        Returns counters of queued, written, dropped and failed events,
+        number of flushes and current queue size
+        """
+        with self._stats_lock:
+            out = dict(self._stats)
+        out['pending'] = self.q.qsize()
+        return out
+
+    def add(self, event):
+        try:
+            self.q.put_nowait(event)
+        except Queue.Full:
+            self._incr('dropped')
+            return False
+        self._incr('queued')
+        return True
+
+    def get_batch(self):
+        """
+        Waits for events and returns them as soon as there's ``flush_size``
+        of them or ``flush_interval`` passed since first one arrived
+        """
+        batch = [self.q.get()]
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.flush_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.q.get(timeout=timeout))
+            except Queue.Empty:
+                break
+        return batch
+
+    def flush(self, batch):
+        try:
+            self.write(self.service, batch)
+            self._incr('written', len(batch))
+        except BaseException as err:
+            log.error("Cannot write %s monitoring events: %s", len(batch), err, exc_info=True)
+            self._incr('failed', len(batch))
+        finally:
+            self._incr('flushes')
+
+    def flush_pending(self):
+        """
+        Writes events still in the queue, in the calling thread
+        """
+        batch = []
+        while True:
+            try:
+                batch.append(self.q.get_nowait())
+            except Queue.Empty:
+                break
+        if batch:
+            self.flush(batch)
+
+    @classmethod
+    def flush_all(cls):
+        with cls._instances_lock:
+            writers = list(cls._instances.values())
+        for writer in writers:
+            writer.flush_pending()
+
+    def run(self):
         while True:
-            if not q.empty():
-                item = q.get()
-                req, resp = item
-                RequestEvent.from_geonode(self.service, req, resp)
+            self.flush(self.get_batch())
+            # don't keep this thread's connection open between batches
+            connection.close()
+
+
+atexit.register(RequestToMonitoringThread.flush_all)
 
 
 class GeoServerMonitorClient(object):
@@ -35,6 +35,7 @@ from django.contrib.auth.signals import user_logged_in, user_logged_out
 from taggit.managers import TaggableManager
 
 from geonode.base.enumerations import COUNTRIES
+from geonode.base.facets import invalidate_facets
 from geonode.groups.models import GroupProfile
 # from geonode.notifications_helper import send_notification
 
@@ -239,3 +240,7 @@ signals.post_save.connect(
     profile_post_save,
     sender=Profile
 )
+signals.m2m_changed.connect(
+    invalidate_facets,
+    sender=Profile.groups.through
+)
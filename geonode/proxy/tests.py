@@ -24,7 +24,13 @@ unittest). These will both pass when you run "manage.py test".
 
 Replace these with more appropriate tests for your application.
 """
+import os
 import json
+import shutil
+import tempfile
+
+from zipfile import ZipFile
+from StringIO import StringIO
 
 from geonode.base.models import Link
 from geonode.tests.base import GeoNodeBaseTestSupport
@@ -32,8 +38,9 @@ from geonode.base.populate_test_data import create_models
 
 from django.contrib.auth import get_user_model
 from django.test.utils import override_settings
+from django.utils.timezone import now
 
-from mock import MagicMock
+from mock import MagicMock, patch
 
 
 TEST_DOMAIN = '.github.com'
@@ -96,6 +103,47 @@ class ProxyTest(GeoNodeBaseTestSupport):
         # 200 - FOUND
         self.assertTrue(response.status_code in (200, 301))
 
+    @override_settings(DEBUG=False, PROXY_ALLOWED_HOSTS=('localhost', '.example.org',))
+    def test_allowed_hosts_cache(self):
+        """The compiled allow-list should be cached and follow Remote Services changes."""
+        from geonode.proxy.utils import get_allowed_hosts
+        from geonode.services.models import Service
+        from geonode.services.enumerations import WMS, INDEXED
+
+        allowed_hosts = get_allowed_hosts()
+        self.assertIs(get_allowed_hosts(), allowed_hosts)
+        self.assertIn('localhost', allowed_hosts)
+        self.assertIn('example.org', allowed_hosts)
+        self.assertIn('maps.EXAMPLE.org', allowed_hosts)
+        self.assertNotIn('example.org.evil.com', allowed_hosts)
+        self.assertNotIn('bogus.pocus.com', allowed_hosts)
+
+        service, _ = Service.objects.get_or_create(
+            type=WMS,
+            name='Bogus',
+            title='Pocus',
+            owner=self.admin,
+            method=INDEXED,
+            base_url='http://bogus.pocus.com/ows')
+        self.assertIn('bogus.pocus.com', get_allowed_hosts())
+        service.delete()
+        self.assertNotIn('bogus.pocus.com', get_allowed_hosts())
+
+        # changes made by other processes are seen through the database
+        service, _ = Service.objects.get_or_create(
+            type=WMS,
+            name='Hocus',
+            title='Pocus',
+            owner=self.admin,
+            method=INDEXED,
+            base_url='http://bogus.pocus.com/ows')
+        self.assertNotIn('hocus.pocus.com', get_allowed_hosts())
+        Service.objects.filter(id=service.id).update(base_url='http://hocus.pocus.com/ows', last_updated=now())
+        self.assertNotIn('hocus.pocus.com', get_allowed_hosts())
+        with self.settings(PROXY_ALLOWED_HOSTS_CHECK_INTERVAL=0):
+            self.assertIn('hocus.pocus.com', get_allowed_hosts())
+        service.delete()
+
     @override_settings(DEBUG=False, PROXY_ALLOWED_HOSTS=('.example.org',))
     def test_relative_urls(self):
         """Proxying to a URL with a relative path element should normalise the path into
@@ -117,6 +165,137 @@ class ProxyTest(GeoNodeBaseTestSupport):
         assert request_mock.assert_called_once
         assert request_mock.call_args[0][0] == 'http://example.org/index.html'
 
+    @override_settings(DEBUG=False, PROXY_ALLOWED_HOSTS=('.example.org',),
+                       PROXY_STREAMING=True, PROXY_MAX_BUFFERED_SIZE=10, PROXY_STREAMING_CHUNK_SIZE=4)
+    def test_streaming_response(self):
+        """Large upstream responses should be streamed to the client in chunks."""
+        import geonode.proxy.views
+
+        chunks = ['<wfs:', 'FeatureCollection', '/>']
+
+        class Raw(object):
+
+            def stream(self, chunk_size, decode_content=None):
+                for chunk in chunks:
+                    yield chunk[:chunk_size]
+                    yield chunk[chunk_size:]
+
+        class Response(object):
+            status_code = 200
+            raw = Raw()
+            closed = False
+            headers = {'Content-Type': 'text/xml', 'Content-Disposition': 'attachment', 'Set-Cookie': 'a=b'}
+
+            @property
+            def content(self):
+                raise AssertionError("Streamed response should not be read in memory")
+
+            def close(self):
+                self.closed = True
+
+        upstream = Response()
+        request_mock = MagicMock(return_value=(upstream, upstream.raw))
+        with patch.object(geonode.proxy.views.http_client, 'request', request_mock):
+            response = self.client.get('%s?url=%s' % (self.proxy_url, 'http://example.org/wfs'))
+
+        self.assertTrue(request_mock.call_args[1]['stream'])
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/xml')
+        self.assertEqual(response['Content-Disposition'], 'attachment')
+        self.assertFalse(response.has_header('Set-Cookie'))
+        self.assertEqual(''.join(response.streaming_content), ''.join(chunks))
+        self.assertTrue(upstream.closed)
+
+        # small responses are still read in memory
+        class SmallResponse(Response):
+            content = 'ok'
+            headers = {'Content-Type': 'text/xml', 'Content-Length': '2'}
+
+        upstream = SmallResponse()
+        request_mock.return_value = (upstream, upstream.raw)
+        with patch.object(geonode.proxy.views.http_client, 'request', request_mock):
+            response = self.client.get('%s?url=%s' % (self.proxy_url, 'http://example.org/wfs'))
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.content, 'ok')
+
+
+class DownloadArchiveTestCase(GeoNodeBaseTestSupport):
+
+    def setUp(self):
+        super(DownloadArchiveTestCase, self).setUp()
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        super(DownloadArchiveTestCase, self).tearDown()
+
+    def test_archive_streamed_and_cached(self):
+        from geonode.utils import stream_zip
+        from geonode.proxy.utils import cache_download_archive
+
+        stale_path = os.path.join(self.cache_dir, '1-stale.zip')
+        open(stale_path, 'wb').close()
+        path = os.path.join(self.cache_dir, '1-current.zip')
+        entries = [('layer.shp', StringIO('x' * 1000)), ('layer.sld', '<sld/>')]
+        chunks = list(cache_download_archive(stream_zip(entries, chunk_size=100), path))
+        self.assertTrue(len(chunks) > 2)
+
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), ''.join(chunks))
+        archive = ZipFile(path)
+        self.assertEqual(archive.namelist(), ['layer.shp', 'layer.sld'])
+        self.assertEqual(archive.read('layer.shp'), 'x' * 1000)
+        self.assertFalse(os.path.exists(stale_path))
+
+        # interrupted downloads are not cached
+        os.remove(path)
+        chunks = cache_download_archive(stream_zip([('layer.shp', StringIO('x' * 1000))], chunk_size=100), path)
+        next(chunks)
+        chunks.close()
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+        # incomplete archives are sent but not cached
+        errors = ['layer_remote.sld']
+        entries = [('layer.sld', u'<sld title="\xe9"/>')]
+        chunks = list(cache_download_archive(stream_zip(entries), path, is_complete=lambda: not errors))
+        self.assertEqual(os.listdir(self.cache_dir), [])
+        archive = ZipFile(StringIO(''.join(chunks)))
+        self.assertEqual(archive.read('layer.sld').decode('utf-8'), u'<sld title="\xe9"/>')
+
+    def test_archive_path_follows_embedded_content(self):
+        from geonode.layers.models import Layer, Style
+        from geonode.proxy.utils import get_download_archive_path
+
+        create_models(type='layer')
+        layer = Layer.objects.first()
+        paths = []
+
+        def _path():
+            instance = Layer.objects.get(pk=layer.pk)
+            with self.settings(DOWNLOAD_ARCHIVE_CACHE_DIR=self.cache_dir):
+                path = get_download_archive_path(instance, None, [])
+            self.assertTrue(path.startswith(self.cache_dir))
+            self.assertNotIn(path, paths)
+            paths.append(path)
+
+        _path()
+        style = Style.objects.create(name='download_archive_style', sld_body='<sld/>')
+        layer.styles.add(style)
+        _path()
+        Style.objects.filter(pk=style.pk).update(sld_body='<sld version="1.1.0"/>')
+        _path()
+        Layer.objects.filter(pk=layer.pk).update(metadata_xml='<gmd:MD_Metadata/>')
+        _path()
+        Link.objects.create(resource=layer, link_type='metadata', name='Archive metadata',
+                            extension='xml', mime='text/xml', url='http://example.org/metadata.xml')
+        _path()
+
+        # the same content gives the same archive
+        with self.settings(DOWNLOAD_ARCHIVE_CACHE_DIR=self.cache_dir):
+            self.assertEqual(get_download_archive_path(Layer.objects.get(pk=layer.pk), None, []), paths[-1])
+        with self.settings(DOWNLOAD_ARCHIVE_CACHE_DIR=''):
+            self.assertIsNone(get_download_archive_path(layer, None, []))
+
 
 class OWSApiTestCase(GeoNodeBaseTestSupport):
 
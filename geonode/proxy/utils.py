@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2019 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import os
+import glob
+import json
+import time
+import uuid
+import hashlib
+import logging
+import tempfile
+import traceback
+
+from urlparse import urlsplit
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Max
+
+from geonode import geoserver
+from geonode.utils import check_ogc_backend, http_client
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_HOSTS_VERSION_KEY = 'proxy_allowed_hosts_version'
+
+# (cache version, services version, check time, compiled allow-list),
+# by (PROXY_ALLOWED_HOSTS, SITEURL)
+_allowed_hosts = {}
+
+
+class AllowedHosts(object):
+    """
+    Compiled proxy allow-list: exact host names, plus '.domain' patterns
+    matching the domain and all its subdomains (as in ALLOWED_HOSTS)
+    """
+
+    def __init__(self, entries):
+        self.allow_all = False
+        self.hosts = set()
+        self.domains = set()
+        for entry in entries:
+            if not entry:
+                continue
+            entry = entry.lower().rstrip('.')
+            if entry == '*':
+                self.allow_all = True
+            elif entry.startswith('.'):
+                self.domains.add(entry)
+            else:
+                self.hosts.add(entry)
+
+    def __contains__(self, host):
+        if not host:
+            return False
+        if self.allow_all:
+            return True
+        host = host.lower().rstrip('.')
+        if host in self.hosts:
+            return True
+        labels = host.split('.')
+        return any('.' + '.'.join(labels[i:]) in self.domains for i in range(len(labels)))
+
+
+def _get_allowed_hosts_entries():
+    from geonode.services.models import Service
+
+    entries = list(getattr(settings, 'PROXY_ALLOWED_HOSTS', ()))
+    # current SITEURL
+    entries.append(urlsplit(settings.SITEURL).hostname)
+    # current GeoServer
+    if check_ogc_backend(geoserver.BACKEND_PACKAGE):
+        from geonode.geoserver.helpers import ogc_server_settings
+        if ogc_server_settings:
+            entries.append(ogc_server_settings.hostname)
+    # Remote Services base_urls
+    for base_url in Service.objects.values_list('base_url', flat=True).iterator():
+        entries.append(urlsplit(base_url).hostname)
+    return entries
+
+
+def _get_services_version():
+    from geonode.services.models import Service
+
+    return tuple(sorted(Service.objects.aggregate(
+        Count('id'), Max('id'), Max('last_updated')).items()))
+
+
+def get_allowed_hosts():
+    """
+    Returns compiled proxy allow-list, built once and kept in memory
+    until remote services change. Changes made in this process are seen
+    at once, other processes are told through the cache and, since the
+    cache may not be shared (e.g. DummyCache), by checking the services
+    table every PROXY_ALLOWED_HOSTS_CHECK_INTERVAL seconds.
+    """
+    key = (tuple(getattr(settings, 'PROXY_ALLOWED_HOSTS', ())), settings.SITEURL,)
+    version = cache.get(ALLOWED_HOSTS_VERSION_KEY)
+    cached = _allowed_hosts.get(key)
+    now = time.time()
+    if cached is not None and cached[0] == version:
+        if now - cached[2] < getattr(settings, 'PROXY_ALLOWED_HOSTS_CHECK_INTERVAL', 5):
+            return cached[3]
+        if _get_services_version() == cached[1]:
+            _allowed_hosts[key] = (version, cached[1], now, cached[3],)
+            return cached[3]
+    services_version = _get_services_version()
+    allowed_hosts = AllowedHosts(_get_allowed_hosts_entries())
+    _allowed_hosts[key] = (version, services_version, now, allowed_hosts,)
+    return allowed_hosts
+
+
+def invalidate_allowed_hosts():
+    """
+    Drops compiled allow-lists in this process, and tells other
+    processes to rebuild theirs
+    """
+    _allowed_hosts.clear()
+    cache.set(ALLOWED_HOSTS_VERSION_KEY, time.time(), None)
+
+
+def get_download_archive_path(instance, upload_session, layer_files):
+    """
+    Returns path of the cached download archive for the layer, which changes
+    along with whatever the archive embeds: layer files, styles, links and
+    metadata
+    """
+    cache_dir = getattr(settings, 'DOWNLOAD_ARCHIVE_CACHE_DIR', None)
+    if cache_dir is None:
+        cache_dir = os.path.join(tempfile.gettempdir(), 'geonode-download-archives')
+    elif not cache_dir:
+        return None
+    fingerprint = [
+        upload_session.pk if upload_session else None,
+        instance.last_updated.isoformat() if instance.last_updated else '',
+        instance.metadata_xml,
+        sorted(f.file.name for f in layer_files),
+        list(instance.styles.order_by('id').values_list('id', 'name', 'sld_body', 'sld_url')),
+        sorted((link.link_type, link.name, link.extension, link.url) for link in instance.get_links().all()),
+    ]
+    digest = hashlib.sha1(json.dumps(fingerprint, default=str)).hexdigest()
+    return os.path.join(cache_dir, '{}-{}.zip'.format(instance.pk, digest))
+
+
+def is_download_archive_cached(path):
+    if not path or not os.path.isfile(path):
+        return False
+    ttl = getattr(settings, 'DOWNLOAD_ARCHIVE_CACHE_TTL', None)
+    return not ttl or time.time() - os.path.getmtime(path) < ttl
+
+
+def cache_download_archive(chunks, path, is_complete=None):
+    """
+    Passes archive chunks through, and stores them at path once the whole
+    archive is sent, unless is_complete returns False then (i.e. some entries
+    are missing). Other archives of the same layer are removed then.
+    """
+    archive_file = tmp_path = None
+    if path:
+        tmp_path = '{}.{}.part'.format(path, uuid.uuid4().hex)
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            archive_file = open(tmp_path, 'wb')
+        except (IOError, OSError) as e:
+            logger.warning("Cannot cache download archive %s: %s", path, e)
+
+    if archive_file is None:
+        for chunk in chunks:
+            yield chunk
+        return
+
+    complete = False
+    try:
+        with archive_file:
+            for chunk in chunks:
+                archive_file.write(chunk)
+                yield chunk
+        complete = is_complete is None or is_complete()
+    finally:
+        if complete:
+            os.rename(tmp_path, path)
+            prefix = os.path.basename(path).split('-')[0]
+            for stale in glob.glob(os.path.join(os.path.dirname(path), '{}-*.zip'.format(prefix))):
+                if stale != path:
+                    try:
+                        os.remove(stale)
+                    except OSError:
+                        pass
+        elif os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def fetch_urls(requests, user=None, timeout=None):
+    """
+    Starts fetching (url, headers) requests concurrently, with at most
+    DOWNLOAD_ARCHIVE_WORKERS requests at a time. Returns AsyncResult with
+    the list of responses (None for failed requests), in the same order.
+    """
+    def _fetch(request):
+        url, headers = request
+        try:
+            response, content = http_client.get(url, headers=headers, timeout=timeout, user=user)
+            if response.status_code == 200:
+                return response
+        except BaseException:
+            logger.debug(traceback.format_exc())
+        finally:
+            # worker threads have their own db connections
+            connection.close()
+
+    workers = max(1, min(getattr(settings, 'DOWNLOAD_ARCHIVE_WORKERS', 4), len(requests)))
+    pool = ThreadPool(workers)
+    try:
+        return pool.map_async(_fetch, requests)
+    finally:
+        pool.close()
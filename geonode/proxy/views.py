@@ -20,9 +20,8 @@
 
 import os
 import re
-import shutil
+import zlib
 import logging
-import tempfile
 import traceback
 
 from hyperlink import URL
@@ -30,8 +29,7 @@ from slugify import slugify
 from urlparse import urlparse, urlsplit, urljoin
 
 from django.conf import settings
-from django.http import HttpResponse
-from django.http.request import validate_host
+from django.http import HttpResponse, StreamingHttpResponse, FileResponse
 from django.views.generic import View
 from django.views.decorators.csrf import requires_csrf_token
 from django.template import loader
@@ -39,16 +37,18 @@ from distutils.version import StrictVersion
 from django.utils.translation import ugettext as _
 from django.core.files.storage import default_storage as storage
 
-from geonode.base.models import Link
 from geonode.layers.models import Layer, LayerFile
 from geonode.utils import (resolve_object,
-                           check_ogc_backend,
-                           get_dir_time_suffix,
-                           zip_dir,
                            get_headers,
                            http_client,
-                           json_response)
+                           json_response,
+                           stream_zip)
 from geonode.base.enumerations import LINK_TYPES as _LT
+from geonode.proxy.utils import (get_allowed_hosts,
+                                 get_download_archive_path,
+                                 is_download_archive_cached,
+                                 cache_download_archive,
+                                 fetch_urls)
 
 from geonode import geoserver, qgis_server  # noqa
 from geonode.monitoring import register_event
@@ -59,6 +59,10 @@ LINK_TYPES = [L for L in _LT if L.startswith("OGC:")]
 
 logger = logging.getLogger(__name__)
 
+# upstream headers sent back to the client by the streaming proxy
+PROXY_PASSTHROUGH_HEADERS = ('Cache-Control', 'Content-Disposition', 'Content-Language',
+                             'ETag', 'Expires', 'Last-Modified',)
+
 ows_regexp = re.compile(
     r"^(?i)(version)=(\d\.\d\.\d)(?i)&(?i)request=(?i)(GetCapabilities)&(?i)service=(?i)(\w\w\w)$")
 
@@ -71,9 +75,6 @@ def proxy(request, url=None, response_callback=None,
     if not timeout:
         timeout = TIMEOUT
 
-    # Security rules and settings
-    PROXY_ALLOWED_HOSTS = getattr(settings, 'PROXY_ALLOWED_HOSTS', ())
-
     # Sanity url checks
     if 'url' not in request.GET and not url:
         return HttpResponse("The proxy service requires a URL-encoded URL as a parameter.",
@@ -96,38 +97,18 @@ def proxy(request, url=None, response_callback=None,
     # White-Black Listing Hosts
     site_url = urlsplit(settings.SITEURL)
     if sec_chk_hosts and not settings.DEBUG:
-
-        # Attach current SITEURL
-        if site_url.hostname not in PROXY_ALLOWED_HOSTS:
-            PROXY_ALLOWED_HOSTS += (site_url.hostname, )
-
-        # Attach current hostname
-        if check_ogc_backend(geoserver.BACKEND_PACKAGE):
-            from geonode.geoserver.helpers import ogc_server_settings
-            hostname = (
-                ogc_server_settings.hostname,
-            ) if ogc_server_settings else ()
-            if hostname not in PROXY_ALLOWED_HOSTS:
-                PROXY_ALLOWED_HOSTS += hostname
+        host_allowed = url.hostname in get_allowed_hosts()
 
         # Check OWS regexp
-        if url.query and ows_regexp.match(url.query):
+        if not host_allowed and url.query and ows_regexp.match(url.query):
             ows_tokens = ows_regexp.match(url.query).groups()
             if len(ows_tokens) == 4 and 'version' == ows_tokens[0] and StrictVersion(
                     ows_tokens[1]) >= StrictVersion("1.0.0") and StrictVersion(
                         ows_tokens[1]) <= StrictVersion("3.0.0") and ows_tokens[2].lower() in (
                             'getcapabilities') and ows_tokens[3].upper() in ('OWS', 'WCS', 'WFS', 'WMS', 'WPS', 'CSW'):
-                if url.hostname not in PROXY_ALLOWED_HOSTS:
-                    PROXY_ALLOWED_HOSTS += (url.hostname, )
-
-        # Check Remote Services base_urls
-        from geonode.services.models import Service
-        for _s in Service.objects.all():
-            _remote_host = urlsplit(_s.base_url).hostname
-            PROXY_ALLOWED_HOSTS += (_remote_host, )
+                host_allowed = True
 
-        if not validate_host(
-                url.hostname, PROXY_ALLOWED_HOSTS):
+        if not host_allowed:
             return HttpResponse("DEBUG is set to False but the host of the path provided to the proxy service"
                                 " is not in the PROXY_ALLOWED_HOSTS setting.",
                                 status=403,
@@ -162,12 +143,18 @@ def proxy(request, url=None, response_callback=None,
         _url = ('%s%saccess_token=%s' %
                 (_url, query_separator, access_token))
 
+    # callbacks need the whole content, everything else can be streamed
+    stream = getattr(settings, 'PROXY_STREAMING', False) and not response_callback
     response, content = http_client.request(_url,
                                             method=request.method,
                                             data=request.body,
                                             headers=headers,
                                             timeout=timeout,
+                                            stream=stream,
                                             user=request.user)
+    if stream and _should_stream(response):
+        return _get_streaming_response(response)
+
     content = response.content or response.reason
     status = response.status_code
     content_type = response.headers.get('Content-Type')
@@ -216,6 +203,139 @@ def proxy(request, url=None, response_callback=None,
                 content_type=content_type)
 
 
+def _should_stream(response):
+    """
+    Large (or of unknown size) successful upstream responses are streamed,
+    everything else is read in memory
+    """
+    if getattr(response, 'raw', None) is None or not 200 <= response.status_code < 300:
+        return False
+    try:
+        content_length = int(response.headers.get('Content-Length'))
+    except (TypeError, ValueError):
+        return True
+    return content_length > getattr(settings, 'PROXY_MAX_BUFFERED_SIZE', 1024 * 1024)
+
+
+def _iter_upstream(response, chunk_size, decompress):
+    """
+    Yields upstream body read straight from the socket, in chunks
+    of at most chunk_size bytes
+    """
+    gunzip = None
+    if decompress and response.headers.get('Content-Type') == 'gzip':
+        gunzip = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        for chunk in response.raw.stream(chunk_size, decode_content=decompress):
+            if gunzip:
+                while chunk:
+                    data = gunzip.decompress(chunk, chunk_size)
+                    chunk = gunzip.unconsumed_tail
+                    if data:
+                        yield data
+            elif chunk:
+                yield chunk
+        if gunzip:
+            data = gunzip.flush()
+            if data:
+                yield data
+    finally:
+        response.close()
+
+
+def _get_streaming_response(response):
+    decompress = getattr(settings, 'PROXY_STREAMING_DECOMPRESS', True)
+    chunk_size = getattr(settings, 'PROXY_STREAMING_CHUNK_SIZE', 64 * 1024)
+    content_type = response.headers.get('Content-Type')
+
+    _response = StreamingHttpResponse(
+        _iter_upstream(response, chunk_size, decompress),
+        status=response.status_code,
+        content_type=content_type)
+    headers = list(PROXY_PASSTHROUGH_HEADERS)
+    if not decompress:
+        headers += ['Content-Encoding', 'Content-Length']
+    elif not response.headers.get('Content-Encoding') and content_type != 'gzip':
+        headers += ['Content-Length']
+    for header in headers:
+        if header in response.headers:
+            _response[header] = response.headers[header]
+    return _response
+
+
+def _get_layer_archive_entries(request, instance, layer_files, errors):
+    """
+    Returns generator of (archive name, content) pairs for the layer
+    download archive. Remote styles and metadata are fetched concurrently
+    while layer files are being read. Names of the entries which could not
+    be produced are appended to errors.
+    """
+    entries = []
+    remote = []
+
+    # Let's check for associated SLD files (if any)
+    for s in instance.styles.all():
+        sld_name = "".join([s.name, ".sld"])
+        try:
+            entries.append((sld_name, (s.sld_body or '').strip().encode('utf-8'),))
+            if s.sld_url:
+                remote.append(("".join([s.name, "_remote.sld"]), s.sld_url, True,))
+        except BaseException:
+            traceback.print_exc()
+            tb = traceback.format_exc()
+            logger.debug(tb)
+            errors.append(sld_name)
+
+    # Let's dump metadata
+    for link in instance.get_links().all():
+        try:
+            link_name = "/".join([".metadata", "".join([slugify(link.name), ".%s" % link.extension])])
+            if link.link_type in ('data'):
+                # Skipping 'data' download links
+                continue
+            elif link.link_type in ('metadata', 'image'):
+                # Dumping metadata files and images
+                remote.append((link_name, link.url, False,))
+            elif link.link_type.startswith('OGC'):
+                # Dumping OGC/OWS links
+                entries.append((link_name, link.url.strip().encode('utf-8'),))
+        except BaseException:
+            traceback.print_exc()
+            tb = traceback.format_exc()
+            logger.debug(tb)
+            errors.append(link.name)
+
+    fetched = None
+    if remote:
+        # Collecting headers and cookies
+        fetched = fetch_urls(
+            [(url, get_headers(request, urlsplit(url), url)[0]) for name, url, is_text in remote],
+            user=request.user,
+            timeout=TIMEOUT)
+
+    def _entries():
+        for layer_file in layer_files:
+            yield os.path.basename(layer_file.file.name), storage.open(layer_file.file.name, 'rb')
+        for entry in entries:
+            yield entry
+        if fetched is not None:
+            for (name, url, is_text), response in zip(remote, fetched.get()):
+                if response is None:
+                    errors.append(name)
+                    continue
+                try:
+                    content = response.text.strip().encode('utf-8') if is_text else response.content
+                except BaseException:
+                    traceback.print_exc()
+                    tb = traceback.format_exc()
+                    logger.debug(tb)
+                    errors.append(name)
+                    continue
+                yield name, content
+
+    return _entries()
+
+
 def download(request, resourceid, sender=Layer):
 
     _not_authorized = _("You are not authorized to download this resource.")
@@ -229,36 +349,21 @@ def download(request, resourceid, sender=Layer):
                               permission_msg=_not_permitted)
 
     if isinstance(instance, Layer):
-        # Create Target Folder
-        dirpath = tempfile.mkdtemp()
-        dir_time_suffix = get_dir_time_suffix()
-        target_folder = os.path.join(dirpath, dir_time_suffix)
-        if not os.path.exists(target_folder):
-            os.makedirs(target_folder)
-
         layer_files = []
         try:
             upload_session = instance.get_upload_session()
             if upload_session:
-                layer_files = [
-                    item for idx, item in enumerate(LayerFile.objects.filter(upload_session=upload_session))]
-
-                if layer_files:
-                    # Copy all Layer related files into a temporary folder
-                    for l in layer_files:
-                        if storage.exists(l.file):
-                            geonode_layer_path = storage.path(l.file)
-                            base_filename, original_ext = os.path.splitext(geonode_layer_path)
-                            shutil.copy2(geonode_layer_path, target_folder)
-                        else:
-                            return HttpResponse(
-                                loader.render_to_string(
-                                    '401.html',
-                                    context={
-                                        'error_title': _("No files found."),
-                                        'error_message': _no_files_found
-                                    },
-                                    request=request), status=404)
+                layer_files = list(LayerFile.objects.filter(upload_session=upload_session))
+                for l in layer_files:
+                    if not storage.exists(l.file):
+                        return HttpResponse(
+                            loader.render_to_string(
+                                '401.html',
+                                context={
+                                    'error_title': _("No files found."),
+                                    'error_message': _no_files_found
+                                },
+                                request=request), status=404)
 
             # Check we can access the original files
             if not layer_files:
@@ -271,92 +376,22 @@ def download(request, resourceid, sender=Layer):
                         },
                         request=request), status=404)
 
-            # Let's check for associated SLD files (if any)
-            try:
-                for s in instance.styles.all():
-                    sld_file_path = os.path.join(target_folder, "".join([s.name, ".sld"]))
-                    sld_file = open(sld_file_path, "w")
-                    sld_file.write(s.sld_body.strip())
-                    sld_file.close()
-
-                    try:
-                        sld_file = open(sld_file_path, "r")
-
-                        # Collecting headers and cookies
-                        headers, access_token = get_headers(request, urlsplit(s.sld_url), s.sld_url)
-
-                        response, content = http_client.get(
-                            s.sld_url,
-                            headers=headers,
-                            timeout=TIMEOUT,
-                            user=request.user)
-                        sld_remote_content = response.text
-                        sld_file_path = os.path.join(target_folder, "".join([s.name, "_remote.sld"]))
-                        sld_file = open(sld_file_path, "w")
-                        sld_file.write(sld_remote_content.strip())
-                        sld_file.close()
-                    except BaseException:
-                        traceback.print_exc()
-                        tb = traceback.format_exc()
-                        logger.debug(tb)
-            except BaseException:
-                traceback.print_exc()
-                tb = traceback.format_exc()
-                logger.debug(tb)
-
-            # Let's dump metadata
-            target_md_folder = os.path.join(target_folder, ".metadata")
-            if not os.path.exists(target_md_folder):
-                os.makedirs(target_md_folder)
-
-            try:
-                links = Link.objects.filter(resource=instance.resourcebase_ptr)
-                for link in links:
-                    link_name = slugify(link.name)
-                    link_file = os.path.join(target_md_folder, "".join([link_name, ".%s" % link.extension]))
-                    if link.link_type in ('data'):
-                        # Skipping 'data' download links
-                        continue
-                    elif link.link_type in ('metadata', 'image'):
-                        # Dumping metadata files and images
-                        link_file = open(link_file, "wb")
-                        try:
-                            # Collecting headers and cookies
-                            headers, access_token = get_headers(request, urlsplit(link.url), link.url)
-
-                            response, raw = http_client.get(
-                                link.url,
-                                stream=True,
-                                headers=headers,
-                                timeout=TIMEOUT,
-                                user=request.user)
-                            raw.decode_content = True
-                            shutil.copyfileobj(raw, link_file)
-                        except BaseException:
-                            traceback.print_exc()
-                            tb = traceback.format_exc()
-                            logger.debug(tb)
-                        finally:
-                            link_file.close()
-                    elif link.link_type.startswith('OGC'):
-                        # Dumping OGC/OWS links
-                        link_file = open(link_file, "w")
-                        link_file.write(link.url.strip())
-                        link_file.close()
-            except BaseException:
-                traceback.print_exc()
-                tb = traceback.format_exc()
-                logger.debug(tb)
-
-            # ZIP everything and return
+            # ZIP everything and return, or return the archive built by a previous download
             target_file_name = "".join([instance.name, ".zip"])
-            target_file = os.path.join(dirpath, target_file_name)
-            zip_dir(target_folder, target_file)
+            archive_path = get_download_archive_path(instance, upload_session, layer_files)
+            if is_download_archive_cached(archive_path):
+                response = FileResponse(
+                    open(archive_path, 'rb'),
+                    status=200,
+                    content_type="application/zip")
+            else:
+                errors = []
+                entries = _get_layer_archive_entries(request, instance, layer_files, errors)
+                response = StreamingHttpResponse(
+                    cache_download_archive(stream_zip(entries), archive_path, is_complete=lambda: not errors),
+                    status=200,
+                    content_type="application/zip")
             register_event(request, 'download', instance)
-            response = HttpResponse(
-                content=open(target_file),
-                status=200,
-                content_type="application/zip")
             response['Content-Disposition'] = 'attachment; filename="%s"' % target_file_name
             return response
         except NotImplementedError:
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2019 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+from django.core.management.base import BaseCommand, CommandError
+
+from geonode.layers.models import Layer
+from geonode.qgis_server.models import QGISServerLayer
+from geonode.qgis_server.tile_cache import seed_tiles
+
+
+class Command(BaseCommand):
+    help = ("Fill the QGIS Server tile cache of layers for a range of zoom levels.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('layers', nargs='+', help='Names of the layers to seed')
+        parser.add_argument(
+            '--min-zoom',
+            dest='min_zoom',
+            type=int,
+            default=0,
+            help='First zoom level to seed')
+        parser.add_argument(
+            '--max-zoom',
+            dest='max_zoom',
+            type=int,
+            default=10,
+            help='Last zoom level to seed')
+        parser.add_argument(
+            '--style',
+            dest='style',
+            default=None,
+            help='Style of the tiles, the default style of each layer if not set')
+        parser.add_argument(
+            '--overwrite',
+            action='store_true',
+            dest='overwrite',
+            default=False,
+            help='Fetch again the tiles already cached')
+
+    def handle(self, *args, **options):
+        if options['min_zoom'] > options['max_zoom']:
+            raise CommandError('--min-zoom must not be greater than --max-zoom')
+
+        for name in options['layers']:
+            try:
+                layer = Layer.objects.get(name=name)
+                layer.qgis_layer
+            except (Layer.DoesNotExist, QGISServerLayer.DoesNotExist):
+                raise CommandError('Layer %s has no associated qgis_layer' % name)
+
+            count = seed_tiles(
+                layer,
+                options['min_zoom'],
+                options['max_zoom'],
+                style=options['style'],
+                overwrite=options['overwrite'])
+            self.stdout.write('Fetched %d tile(s) for layer %s' % (count, name))
@@ -19,12 +19,9 @@
 #########################################################################
 
 import logging
-import shutil
 import socket
 
-import requests
 from geonode.celery_app import app
-from requests.exceptions import HTTPError
 
 
 from geonode.layers.models import Layer
@@ -32,6 +29,7 @@ from geonode.layers.utils import create_thumbnail
 from geonode.maps.models import Map
 from geonode.qgis_server.helpers import map_thumbnail_url, layer_thumbnail_url
 from geonode.qgis_server.models import QGISServerLayer
+from geonode.qgis_server import tile_cache
 
 from geonode import qgis_server
 from geonode.decorators import on_ogc_backend
@@ -124,7 +122,8 @@ def cache_request(url, cache_file):
 
     For this kind of request, it is better to register the request as celery
     task. This will make the task to keep running, even if connection is
-    reset.
+    reset. Concurrent requests for the same file are coalesced, see
+    geonode.qgis_server.tile_cache.fetch.
 
     :param url: The target url to request
     :type url: str
@@ -135,24 +134,4 @@ def cache_request(url, cache_file):
     :return: True if succeeded
     :rtype: bool
     """
-    logger.debug('Requesting url: {url}'.format(url=url))
-    response = requests.get(url, stream=True)
-
-    if not response.status_code == 200:
-        # Failed to fetch request. Abort with error message
-        msg = (
-            'Failed to fetch requested url: {url}\n'
-            'With HTTP status code: {status_code}\n'
-            'Content: {content}')
-        msg = msg.format(
-            url=url,
-            status_code=response.status_code,
-            content=response.content)
-        raise HTTPError(msg)
-
-    with open(cache_file, 'wb') as out_file:
-        shutil.copyfileobj(response.raw, out_file)
-
-    del response
-
-    return True
+    return tile_cache.fetch(url, cache_file)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2019 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from geonode import qgis_server
+from geonode.decorators import on_ogc_backend
+from geonode.qgis_server import tile_cache
+
+PNG = (
+    '\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00'
+    '\x1f\x15\xc4\x89\x00\x00\x00\rIDATx\x9cc\xf8\x0f\x00\x00\x01\x01\x00\x05\x18\xd8N\x00\x00'
+    '\x00\x00IEND\xaeB`\x82')
+
+
+class SlowTileHandler(BaseHTTPRequestHandler):
+    """Answers /tile.png with a PNG after a delay, anything else with XML"""
+
+    requests = []
+
+    def do_GET(self):
+        SlowTileHandler.requests.append(self.path)
+        time.sleep(0.2)
+        self.send_response(200)
+        if self.path == '/tile.png':
+            self.send_header('Content-Type', 'image/png')
+            self.end_headers()
+            self.wfile.write(PNG)
+        else:
+            self.send_header('Content-Type', 'text/xml')
+            self.end_headers()
+            self.wfile.write('<ServiceExceptionReport/>')
+
+    def log_message(self, *args):
+        pass
+
+
+class TileCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.tiles_directory = tempfile.mkdtemp()
+        self.server = HTTPServer(('localhost', 0), SlowTileHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://localhost:%s/tile.png' % self.server.server_port
+        self.path = os.path.join(self.tiles_directory, 'layer', 'default', '1', '0', '0.png')
+        SlowTileHandler.requests = []
+
+        config = dict(getattr(settings, 'QGIS_SERVER_CONFIG', {}))
+        config['tiles_directory'] = self.tiles_directory
+        self.config = config
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tiles_directory)
+
+    @on_ogc_backend(qgis_server.BACKEND_PACKAGE)
+    def test_concurrent_requests_are_coalesced(self):
+        """Concurrent requests for a missing tile only fetch it once."""
+        with self.settings(QGIS_SERVER_CONFIG=self.config):
+            pool = ThreadPool(4)
+            try:
+                results = pool.map(lambda i: tile_cache.cache_file(self.url, self.path), range(4))
+            finally:
+                pool.close()
+            self.assertEqual(results, [True] * 4)
+            self.assertEqual(len(SlowTileHandler.requests), 1)
+            with open(self.path, 'rb') as f:
+                self.assertEqual(f.read(), PNG)
+            self.assertEqual(os.listdir(os.path.dirname(self.path)), ['0.png'])
+            self.assertEqual(len(os.listdir(os.path.join(self.tiles_directory, '.locks'))), 1)
+
+            # cached tiles are not fetched again
+            self.assertTrue(tile_cache.is_fresh(self.path))
+            self.assertTrue(tile_cache.cache_file(self.url, self.path))
+            self.assertEqual(len(SlowTileHandler.requests), 1)
+
+    @on_ogc_backend(qgis_server.BACKEND_PACKAGE)
+    def test_invalid_tiles_are_not_cached(self):
+        """Service exceptions are not written to the cache."""
+        with self.settings(QGIS_SERVER_CONFIG=self.config):
+            self.assertFalse(tile_cache.cache_file(self.url + '?error', self.path))
+            self.assertFalse(os.path.exists(self.path))
+
+    @on_ogc_backend(qgis_server.BACKEND_PACKAGE)
+    def test_stale_tiles_are_served_while_refreshing(self):
+        """Stale tiles are served and refreshed in the background."""
+        self.config['tile_cache_ttl'] = 60
+        with self.settings(QGIS_SERVER_CONFIG=self.config):
+            self.assertTrue(tile_cache.fetch(self.url, self.path))
+            stale = time.time() - 120
+            os.utime(self.path, (stale, stale))
+            self.assertFalse(tile_cache.is_fresh(self.path))
+
+            self.assertTrue(tile_cache.cache_file(self.url, self.path))
+            for i in range(50):
+                if tile_cache.is_fresh(self.path):
+                    break
+                time.sleep(0.1)
+            self.assertTrue(tile_cache.is_fresh(self.path))
+            self.assertEqual(len(SlowTileHandler.requests), 2)
+
+    @on_ogc_backend(qgis_server.BACKEND_PACKAGE)
+    def test_file_response(self):
+        """Cached tiles can be sent by the web server."""
+        with self.settings(QGIS_SERVER_CONFIG=self.config):
+            self.assertTrue(tile_cache.fetch(self.url, self.path))
+            response = tile_cache.file_response(self.path)
+            self.assertEqual(response['Content-Type'], 'image/png')
+            self.assertEqual(response.content, PNG)
+
+        self.config['sendfile'] = 'nginx'
+        with self.settings(QGIS_SERVER_CONFIG=self.config):
+            response = tile_cache.file_response(self.path)
+            self.assertEqual(response['X-Accel-Redirect'], '/qgis_tiles/layer/default/1/0/0.png')
+            self.assertEqual(response.content, '')
+
+        self.config['sendfile'] = 'apache'
+        with self.settings(QGIS_SERVER_CONFIG=self.config):
+            response = tile_cache.file_response(self.path)
+            self.assertEqual(response['X-Sendfile'], self.path)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2019 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+"""QGIS Server tile cache.
+
+Tiles are stored on disk under QGIS_SERVER_CONFIG['tiles_directory'].
+Missing tiles are fetched inline through a pooled HTTP session, concurrent
+requests for the same tile (in any process) wait for the first one instead
+of requesting QGIS Server again. Files are written atomically, so a tile on
+disk is always complete. Lock files are shared by tiles in a fixed number of
+buckets under tiles_directory/.locks, so they don't pile up next to tiles.
+
+The following optional QGIS_SERVER_CONFIG keys are used:
+
+* tile_cache_ttl: age in seconds after which a tile is refreshed in the
+  background while the stale one is still served (default: never).
+* tile_timeout: timeout in seconds of QGIS Server requests (default: 60).
+* tile_workers: concurrent requests when seeding (default: 4).
+* sendfile: 'nginx' or 'apache' to let the web server send cached files
+  through X-Accel-Redirect or X-Sendfile (default: sent by Django).
+* sendfile_url: internal nginx location mapped to tiles_directory.
+"""
+
+import os
+import time
+import hashlib
+import errno
+import fcntl
+import logging
+import tempfile
+import threading
+from imghdr import what as image_format
+from multiprocessing.pool import ThreadPool
+
+import mercantile
+import requests
+from django.conf import settings
+from django.http import HttpResponse
+from requests.adapters import HTTPAdapter
+
+from geonode.qgis_server.helpers import tile_url, transform_layer_bbox
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_lock = threading.Lock()
+
+# number of lock files shared by the tiles
+LOCK_BUCKETS = 64
+
+
+def get_config(key, default=None):
+    return getattr(settings, 'QGIS_SERVER_CONFIG', {}).get(key, default)
+
+
+def get_session():
+    """Return the HTTP session shared by the QGIS Server requests."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            workers = get_config('tile_workers', 4)
+            adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=max(workers, 10))
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+def _get_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def is_fresh(path):
+    """Whether path is cached and does not need to be refreshed."""
+    mtime = _get_mtime(path)
+    if mtime is None:
+        return False
+    ttl = get_config('tile_cache_ttl')
+    return not ttl or time.time() - mtime < ttl
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _get_lock_path(path):
+    if isinstance(path, unicode):
+        path = path.encode('utf-8')
+    bucket = int(hashlib.sha1(path).hexdigest(), 16) % LOCK_BUCKETS
+    return os.path.join(get_config('tiles_directory') or tempfile.gettempdir(), '.locks', '%02x' % bucket)
+
+
+def fetch(url, path):
+    """Request url and store the PNG it returns in path.
+
+    Only one request per path is made at a time: callers arriving while it
+    is in flight wait for it and reuse its result.
+
+    :return: True if path holds a tile fetched at or after the call
+    :rtype: bool
+    """
+    mtime = _get_mtime(path)
+    lock_path = _get_lock_path(path)
+    _makedirs(os.path.dirname(path))
+    _makedirs(os.path.dirname(lock_path))
+    with open(lock_path, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if _get_mtime(path) != mtime:
+                # fetched by the request we were waiting for
+                return True
+
+            logger.debug('Requesting url: {url}'.format(url=url))
+            try:
+                response = get_session().get(url, timeout=get_config('tile_timeout', 60))
+            except requests.exceptions.RequestException as e:
+                logger.error('Failed to fetch requested url: {url}\n{error}'.format(url=url, error=e))
+                return False
+            if response.status_code != 200 or image_format('', h=response.content) != 'png':
+                logger.error(
+                    'Failed to fetch requested url: {url}\n'
+                    'With HTTP status code: {status_code}\n'
+                    'Content: {content}'.format(
+                        url=url,
+                        status_code=response.status_code,
+                        content=response.content[:1024]))
+                return False
+
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(response.content)
+            os.chmod(tmp_path, 0o644)
+            os.rename(tmp_path, path)
+            return True
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def refresh(url, path):
+    """Fetch path again in the background, unless a request sharing its lock is in flight."""
+    lock_path = _get_lock_path(path)
+    _makedirs(os.path.dirname(lock_path))
+    try:
+        with open(lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    except IOError:
+        return
+    thread = threading.Thread(target=fetch, args=(url, path))
+    thread.daemon = True
+    thread.start()
+
+
+def cache_file(url, path):
+    """Make sure path holds a tile, serving a stale one while refreshing.
+
+    :return: True if path can be served
+    :rtype: bool
+    """
+    if is_fresh(path):
+        return True
+    if os.path.exists(path):
+        refresh(url, path)
+        return True
+    return fetch(url, path)
+
+
+def file_response(path, content_type='image/png'):
+    """Return a response sending a cached file."""
+    sendfile = get_config('sendfile')
+    if sendfile == 'nginx':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = get_config('sendfile_url', '/qgis_tiles/').rstrip('/') + '/' + \
+            os.path.relpath(path, get_config('tiles_directory'))
+    elif sendfile == 'apache':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+    else:
+        with open(path, 'rb') as f:
+            response = HttpResponse(f.read(), content_type=content_type)
+    return response
+
+
+def get_tile_path(qgis_layer, style, z, x, y):
+    return get_config('tile_path') % (qgis_layer.qgis_layer_name, style, z, x, y)
+
+
+def seed_tiles(layer, min_zoom, max_zoom, style=None, overwrite=False):
+    """Fetch the tiles of layer extent between min_zoom and max_zoom.
+
+    :return: number of tiles fetched
+    :rtype: int
+    """
+    qgis_layer = layer.qgis_layer
+    if not style and qgis_layer.default_style:
+        style = qgis_layer.default_style.name
+
+    west, south, east, north = transform_layer_bbox(layer, 4326)
+    jobs = []
+    for tile in mercantile.tiles(west, south, east, north, range(min_zoom, max_zoom + 1)):
+        path = get_tile_path(qgis_layer, style, tile.z, tile.x, tile.y)
+        if overwrite or not is_fresh(path):
+            jobs.append((tile_url(layer, tile.z, tile.x, tile.y, style=style, internal=True), path))
+    if not jobs:
+        return 0
+
+    def _fetch(job):
+        return fetch(*job)
+
+    pool = ThreadPool(min(get_config('tile_workers', 4), len(jobs)))
+    try:
+        return len([result for result in pool.map(_fetch, jobs) if result])
+    finally:
+        pool.close()
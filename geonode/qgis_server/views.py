@@ -52,6 +52,7 @@ from geonode.qgis_server.helpers import (
     qlr_url,
     qgis_server_endpoint, style_get_url, style_list, style_add_url,
     style_remove_url, style_set_default_url)
+from geonode.qgis_server import tile_cache
 from geonode.qgis_server.models import QGISServerLayer
 from geonode.qgis_server.tasks.update import (
     create_qgis_server_thumbnail,
@@ -314,33 +315,17 @@ def tile(request, layername, z, x, y, style=None):
         if qgis_layer.default_style:
             style = qgis_layer.default_style.name
 
-    tile_path = QGIS_SERVER_CONFIG['tile_path']
-    tile_filename = tile_path % (qgis_layer.qgis_layer_name, style, z, x, y)
-
-    if not os.path.exists(tile_filename):
-
-        if not os.path.exists(os.path.dirname(tile_filename)):
-            os.makedirs(os.path.dirname(tile_filename))
+    tile_filename = tile_cache.get_tile_path(qgis_layer, style, z, x, y)
 
+    if not tile_cache.is_fresh(tile_filename):
         # Use internal url
         url = tile_url(layer, z, x, y, style=style, internal=True)
 
-        result = cache_request.delay(url, tile_filename)
-
-        # Attempt to run task synchronously
-        if not result.get():
+        if not tile_cache.cache_file(url, tile_filename):
             # If not succeded, provides error message.
             return HttpResponseServerError('Failed to fetch tile.')
 
-    if image_format(tile_filename) != 'png':
-        logger.error('%s is not valid PNG.' % tile_filename)
-        os.remove(tile_filename)
-
-    if not os.path.exists(tile_filename):
-        return HttpResponse('The tile could not be found.', status=409)
-
-    with open(tile_filename, 'rb') as f:
-        return HttpResponse(f.read(), content_type='image/png')
+    return tile_cache.file_response(tile_filename)
 
 
 def layer_ogc_request(request, layername):
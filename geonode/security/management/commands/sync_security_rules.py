@@ -27,6 +27,19 @@ class Command(BaseCommand):
     Sync resources with Guardian and clear their dirty state
     """
 
+    def add_arguments(self, parser):
+
+        # Named (optional) arguments
+        parser.add_argument(
+            '--batch-size',
+            dest='batch_size',
+            type=int,
+            default=None,
+            help='Number of dirty resources synced in each transaction.')
+
     def handle(self, *args, **options):
-        sync_resources_with_guardian()
+        stats = sync_resources_with_guardian(batch_size=options.get('batch_size'))
+        self.stdout.write(
+            "Synced {synced} resources ({failed} failures) in {elapsed:.1f}s, "
+            "{remaining} left".format(**stats))
 
@@ -28,8 +28,8 @@ from guardian.shortcuts import assign_perm, get_groups_with_perms
 from .utils import (get_users_with_perms,
                     set_owner_permissions,
                     set_geofence_all,
-                    purge_geofence_layer_rules,
-                    sync_geofence_with_guardian,
+                    get_layer_geofence_rules,
+                    sync_layer_geofence_rules,
                     remove_object_permissions)
 
 logger = logging.getLogger("geonode.security.models")
@@ -170,13 +170,8 @@ class PermissionLevelMixin(object):
                 ]
         }
         """
-        remove_object_permissions(self)
-        if self.__class__.__name__ == 'Layer':
-            if settings.OGC_SERVER['default'].get("GEOFENCE_SECURITY_ENABLED", False):
-                if not getattr(settings, 'DELAYED_SECURITY_SIGNALS', False):
-                    purge_geofence_layer_rules(self.get_self_resource())
-                else:
-                    self.get_self_resource().set_dirty_state()
+        # the GeoFence rules are diffed against the new perm_spec below
+        remove_object_permissions(self, purge_rules=False)
 
         # default permissions for resource owner
         set_owner_permissions(self)
@@ -202,15 +197,6 @@ class PermissionLevelMixin(object):
                         assign_perm(perm, user, self.layer)
                     else:
                         assign_perm(perm, user, self.get_self_resource())
-                # Set the GeoFence Rules
-                geofence_user = str(user)
-                if "AnonymousUser" in geofence_user:
-                    geofence_user = None
-                if settings.OGC_SERVER['default'].get("GEOFENCE_SECURITY_ENABLED", False):
-                    if self.polymorphic_ctype.name == 'layer':
-                        if getattr(settings, 'DELAYED_SECURITY_SIGNALS', False):
-                            self.layer.set_dirty_state()
-                        sync_geofence_with_guardian(self.layer, perms, user=geofence_user)
 
         # All the other groups
         if 'groups' in perm_spec:
@@ -223,11 +209,12 @@ class PermissionLevelMixin(object):
                         assign_perm(perm, group, self.layer)
                     else:
                         assign_perm(perm, group, self.get_self_resource())
-                # Set the GeoFence Rules
-                if group.name == 'anonymous':
-                    group = None
-                if settings.OGC_SERVER['default'].get("GEOFENCE_SECURITY_ENABLED", False):
-                    if self.polymorphic_ctype.name == 'layer':
-                        if getattr(settings, 'DELAYED_SECURITY_SIGNALS', False):
-                            self.layer.set_dirty_state()
-                        sync_geofence_with_guardian(self.layer, perms, group=group)
+
+        # Set the GeoFence Rules
+        if settings.OGC_SERVER['default'].get("GEOFENCE_SECURITY_ENABLED", False):
+            if self.polymorphic_ctype.name == 'layer':
+                if getattr(settings, 'DELAYED_SECURITY_SIGNALS', False):
+                    # the rules are synced later by sync_resources_with_guardian
+                    self.layer.set_dirty_state()
+                else:
+                    sync_layer_geofence_rules(self.layer, get_layer_geofence_rules(self.layer, perm_spec))
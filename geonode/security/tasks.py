@@ -23,10 +23,13 @@ from django.conf import settings
 from .utils import sync_resources_with_guardian
 
 
-@shared_task
-def synch_guardian():
+@shared_task(bind=True)
+def synch_guardian(self):
     """
     Sync resources with Guardian and clear their dirty state
     """
     if getattr(settings, 'DELAYED_SECURITY_SIGNALS', False):
-        sync_resources_with_guardian()
+        def _progress(stats):
+            if self.request.id:
+                self.update_state(state='PROGRESS', meta=stats)
+        return sync_resources_with_guardian(progress=_progress)
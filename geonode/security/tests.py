@@ -28,6 +28,7 @@ import logging
 import gisdata
 import contextlib
 
+from mock import MagicMock, patch
 from django.conf import settings
 from django.http import HttpRequest
 from django.core.urlresolvers import reverse
@@ -54,7 +55,12 @@ from .utils import (purge_geofence_all,
                     set_geofence_all,
                     set_geowebcache_invalidate_cache,
                     sync_geofence_with_guardian,
-                    sync_resources_with_guardian)
+                    sync_resources_with_guardian,
+                    get_visible_resources,
+                    get_layer_geofence_rules,
+                    sync_layer_geofence_rules,
+                    GeofenceClient,
+                    GeofenceRule)
 
 
 logger = logging.getLogger(__name__)
@@ -1187,6 +1193,163 @@ class PermissionsTest(GeoNodeBaseTestSupport):
             self.assertTrue(response.status_code in (302, 403))
 
 
+class VisibilityIndexTest(GeoNodeBaseTestSupport):
+    """
+    Tests the ResourceVisibility index backing get_visible_resources
+    """
+
+    type = 'layer'
+
+    def _is_visible(self, layer, user, **kwargs):
+        return get_visible_resources(
+            Layer.objects.all(), user, **kwargs).filter(id=layer.id).exists()
+
+    def test_visibility_index_follows_resources(self):
+        from geonode.base.models import ResourceBase, ResourceVisibility
+        from geonode.groups.models import GroupProfile
+
+        self.assertEqual(
+            ResourceVisibility.objects.count(),
+            ResourceBase.objects.count())
+
+        anonymous = get_anonymous_user()
+        norman = get_user_model().objects.get(username='norman')
+        layer = Layer.objects.exclude(owner=norman)[0]
+        self.assertTrue(self._is_visible(layer, None, unpublished_not_visible=True))
+
+        # Unpublished resources are visible to their owners only
+        layer.is_published = False
+        layer.save()
+        self.assertFalse(self._is_visible(layer, None, unpublished_not_visible=True))
+        self.assertFalse(self._is_visible(layer, anonymous, unpublished_not_visible=True))
+        self.assertTrue(self._is_visible(layer, layer.owner, unpublished_not_visible=True))
+        self.assertTrue(self._is_visible(layer, None))
+
+        # Dirty resources are hidden to everybody but owners
+        layer.is_published = True
+        layer.save()
+        layer.set_dirty_state()
+        self.assertFalse(self._is_visible(layer, norman))
+        self.assertTrue(self._is_visible(layer, layer.owner))
+        layer.clear_dirty_state()
+        self.assertTrue(self._is_visible(layer, norman))
+
+        # Private groups resources are visible to their members only
+        group = GroupProfile.objects.create(
+            title='Private Visibility', slug='private-visibility', access='private')
+        layer.group = group.group
+        layer.save()
+        self.assertFalse(self._is_visible(layer, norman, private_groups_not_visibile=True))
+        group.join(norman)
+        self.assertTrue(self._is_visible(layer, norman, private_groups_not_visibile=True))
+        group.leave(norman)
+        group.access = 'public'
+        group.save()
+        self.assertTrue(self._is_visible(layer, norman, private_groups_not_visibile=True))
+
+
+class GeofenceSyncTest(GeoNodeBaseTestSupport):
+    """
+    Tests that only the difference with the GeoFence rules of a layer is applied
+    """
+
+    type = 'layer'
+
+    @on_ogc_backend(geoserver.BACKEND_PACKAGE)
+    def test_sync_layer_geofence_rules(self):
+        layer = Layer.objects.all()[0]
+        rules = get_layer_geofence_rules(layer, {
+            'users': {
+                'AnonymousUser': ['view_resourcebase'],
+                'bobby': ['view_resourcebase', 'download_resourcebase']
+            },
+            'groups': {'anonymous': ['view_resourcebase']}
+        })
+        self.assertEqual(len(rules), 7)
+        self.assertIn(GeofenceRule(None, None, 'WMS'), rules)
+        self.assertIn(GeofenceRule('bobby', None, None), rules)
+
+        existing = [
+            # already in place
+            {'id': 1, 'userName': None, 'roleName': None, 'service': 'WMS', 'access': 'ALLOW'},
+            # stale, duplicated or not managed by GeoNode
+            {'id': 2, 'userName': 'norman', 'roleName': None, 'service': 'WMS', 'access': 'ALLOW'},
+            {'id': 3, 'userName': None, 'roleName': None, 'service': 'WMS', 'access': 'ALLOW'},
+            {'id': 4, 'userName': None, 'roleName': None, 'service': 'WMS', 'access': 'LIMIT'},
+        ]
+        for rule in existing:
+            rule['layer'] = layer.name
+        existing.append({'id': 5, 'userName': None, 'service': 'WMS', 'layer': 'other', 'access': 'ALLOW'})
+
+        def _request(method, url, **kwargs):
+            response = MagicMock(status_code=200, text='')
+            if url.endswith('rules.json') and 'layer' in kwargs['params']:
+                response.json.return_value = {'rules': existing}
+            elif url.endswith('count.json'):
+                response.json.return_value = {'count': 10}
+            else:
+                response.json.return_value = {'rules': [{'priority': 9}]}
+            return response
+
+        client = GeofenceClient(workers=2)
+        client.session = MagicMock()
+        client.session.request.side_effect = _request
+        with self.settings(DELAYED_SECURITY_SIGNALS=False):
+            stats = sync_layer_geofence_rules(layer, rules, client=client)
+
+        self.assertEqual(stats['added'], 6)
+        self.assertEqual(stats['deleted'], 3)
+        self.assertEqual(stats['unchanged'], 1)
+        calls = client.session.request.call_args_list
+        deleted = sorted(c[0][1].split('/')[-1] for c in calls if c[0][0] == 'DELETE')
+        self.assertEqual(deleted, ['2', '3', '4'])
+        self.assertEqual(len([c for c in calls if c[0][0] == 'POST']), 6)
+        self.assertTrue(all('<priority>9</priority>' in c[1]['data'] for c in calls if c[0][0] == 'POST'))
+        self.assertEqual(stats['timings']['fetch']['count'], 1)
+        self.assertEqual(stats['timings']['priority']['count'], 2)
+        self.assertEqual(stats['timings']['invalidate']['count'], 1)
+
+        # nothing to add when the rules are in place
+        client.session.request.reset_mock()
+        existing[:] = [dict(rule, id=i, layer=layer.name, access='ALLOW') for i, rule in enumerate(
+            [{'userName': r.user, 'roleName': r.role, 'service': r.service} for r in rules])]
+        stats = sync_layer_geofence_rules(layer, rules, client=client)
+        self.assertEqual((stats['added'], stats['deleted']), (0, 0))
+
+    def test_sync_resources_with_guardian_in_batches(self):
+        from geonode.base.models import ResourceBase, ResourceVisibility
+
+        layers = list(Layer.objects.order_by('id')[:5])
+        layer_ids = [layer.id for layer in layers]
+        ResourceBase.objects.filter(id__in=layer_ids).update(dirty_state=True)
+        ResourceVisibility.objects.filter(resource_id__in=layer_ids).update(dirty_state=True)
+        failing = layers[2]
+
+        def _sync_layer(layer, rules, **kwargs):
+            self.assertFalse(kwargs['invalidate'])
+            if layer.id == failing.id:
+                raise RuntimeError("GeoFence is down")
+
+        progress = []
+        with patch('geonode.security.utils.sync_layer_geofence_rules', side_effect=_sync_layer), \
+                patch('geonode.security.utils.GeofenceClient') as client:
+            stats = sync_resources_with_guardian(batch_size=2, progress=progress.append)
+
+        self.assertEqual(stats['synced'], 4)
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(stats['batches'], 3)
+        self.assertEqual(stats['remaining'], 1)
+        self.assertEqual([p['synced'] for p in progress], [2, 3, 4])
+        if check_ogc_backend(geoserver.BACKEND_PACKAGE):
+            self.assertEqual(client.return_value.invalidate_cache.call_count, 3)
+        self.assertEqual(
+            list(ResourceBase.objects.filter(dirty_state=True).values_list('id', flat=True)),
+            [failing.id])
+        self.assertEqual(
+            list(ResourceVisibility.objects.filter(dirty_state=True).values_list('resource_id', flat=True)),
+            [failing.id])
+
+
 class GisBackendSignalsTests(ResourceTestCaseMixin, GeoNodeBaseTestSupport):
 
     def setUp(self):
@@ -25,13 +25,19 @@ try:
     import json
 except ImportError:
     from django.utils import simplejson as json
+import time
 import logging
+import threading
 import traceback
 import requests
 import models
 
+from collections import namedtuple
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 from requests.auth import HTTPBasicAuth
 from django.conf import settings
+from django.db import connection, transaction
 from django.db.models import Q
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
@@ -39,8 +45,9 @@ from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth.models import Group, Permission
 from django.core.exceptions import ObjectDoesNotExist
 from guardian.utils import get_user_obj_perms_model
-from guardian.shortcuts import assign_perm
+from guardian.shortcuts import assign_perm, get_anonymous_user
 from geonode.groups.models import GroupProfile
+from geonode.utils import check_ogc_backend, http_sessions
 from ..services.enumerations import CASCADED
 
 logger = logging.getLogger("geonode.security.utils")
@@ -51,90 +58,117 @@ def get_visible_resources(queryset,
                           admin_approval_required=False,
                           unpublished_not_visible=False,
                           private_groups_not_visibile=False):
-    is_admin = False
-    is_manager = False
-    if user:
-        is_admin = user.is_superuser if user else False
-        try:
-            is_manager = user.groupmember_set.all().filter(role='manager').exists()
-        except BaseException:
-            is_manager = False
-
-    # Get the list of objects the user has access to
-    anonymous_group = None
-    public_groups = GroupProfile.objects.exclude(access="private").values('group')
-    groups = []
-    group_list_all = []
-    manager_groups = []
-    try:
-        group_list_all = user.group_list_all().values('group')
-    except BaseException:
-        pass
-    try:
-        manager_groups = Group.objects.filter(
-            name__in=user.groupmember_set.filter(role="manager").values_list("group__slug", flat=True))
-    except BaseException:
-        pass
-    try:
-        anonymous_group = Group.objects.get(name='anonymous')
-        if anonymous_group and anonymous_group not in groups:
-            groups.append(anonymous_group)
-    except BaseException:
-        pass
+    """
+    Filters the queryset against the ResourceVisibility index.
 
-    filter_set = queryset
+    Owners and members of the resource group always see the resource,
+    everybody else only if it passes the publishing / private group
+    policies requested by the caller and it is not in a dirty state.
+    """
+    from geonode.base.models import ResourceVisibility
 
-    if admin_approval_required:
-        if not is_admin:
-            if is_manager:
-                filter_set = filter_set.filter(
-                    Q(is_published=True) |
-                    Q(group__in=groups) |
-                    Q(group__in=manager_groups) |
-                    Q(group__in=group_list_all) |
-                    Q(group__in=public_groups) |
-                    Q(owner__username__iexact=str(user)))
-            elif user:
-                filter_set = filter_set.filter(
-                    Q(is_published=True) |
-                    Q(group__in=groups) |
-                    Q(group__in=group_list_all) |
-                    Q(group__in=public_groups) |
-                    Q(owner__username__iexact=str(user)))
-            else:
-                filter_set = filter_set.filter(
-                    Q(is_published=True) |
-                    Q(group__in=public_groups) |
-                    Q(group__in=groups))
+    is_admin = user.is_superuser if user else False
+    if is_admin:
+        return queryset
 
+    public_filter = Q(dirty_state=False)
+    if admin_approval_required:
+        public_filter &= Q(is_published=True) | Q(public_group=True)
     if unpublished_not_visible:
-        if not is_admin:
-            if user:
-                filter_set = filter_set.exclude(
-                    Q(is_published=False) & ~(
-                        Q(owner__username__iexact=str(user)) | Q(group__in=group_list_all)))
-            else:
-                filter_set = filter_set.exclude(Q(is_published=False))
-
+        public_filter &= Q(is_published=True)
     if private_groups_not_visibile:
-        if not is_admin:
-            private_groups = GroupProfile.objects.filter(access="private").values('group')
-            if user:
-                filter_set = filter_set.exclude(
-                    Q(group__in=private_groups) & ~(
-                        Q(owner__username__iexact=str(user)) | Q(group__in=group_list_all)))
-            else:
-                filter_set = filter_set.exclude(group__in=private_groups)
-
-    # Hide Dirty State Resources
-    if not is_admin:
-        if user:
-            filter_set = filter_set.exclude(
-                Q(dirty_state=True) & ~(
-                    Q(owner__username__iexact=str(user)) | Q(group__in=group_list_all)))
-        else:
-            filter_set = filter_set.exclude(Q(dirty_state=True))
-    return filter_set
+        public_filter &= Q(private_group=False)
+
+    visibility_filter = public_filter
+    user_id = getattr(user, 'id', None)
+    if user_id:
+        group_list_all = list(GroupProfile.objects.filter(
+            groupmember__user_id=user_id).values_list('group_id', flat=True))
+        visibility_filter |= Q(owner_id=user_id)
+        if group_list_all:
+            visibility_filter |= Q(group_id__in=group_list_all)
+
+    visible_resources = ResourceVisibility.objects.filter(
+        visibility_filter).values('resource_id')
+    return queryset.filter(id__in=visible_resources)
+
+
+def _get_group_visibility_flags(group_ids):
+    """
+    Returns a dict mapping each group id to its
+    (public_group, private_group) visibility flags.
+    """
+    flags = {}
+    if not group_ids:
+        return flags
+    for group_id, access in GroupProfile.objects.filter(
+            group_id__in=group_ids).values_list('group_id', 'access'):
+        flags[group_id] = (access != "private", access == "private")
+    for group_id in Group.objects.filter(
+            id__in=group_ids, name='anonymous').values_list('id', flat=True):
+        flags[group_id] = (True, False)
+    return flags
+
+
+def update_visibility_index(resources):
+    """
+    Refresh the ResourceVisibility rows of the given resources.
+    """
+    from geonode.base.models import ResourceVisibility
+
+    resources = list(resources)
+    if not resources:
+        return
+    group_flags = _get_group_visibility_flags(
+        set([r.group_id for r in resources if r.group_id]))
+    rows = []
+    for resource in resources:
+        public_group, private_group = group_flags.get(resource.group_id, (False, False))
+        rows.append(ResourceVisibility(
+            resource_id=resource.id,
+            owner_id=resource.owner_id,
+            group_id=resource.group_id,
+            is_published=resource.is_published,
+            dirty_state=resource.dirty_state,
+            public_group=public_group,
+            private_group=private_group))
+    with transaction.atomic():
+        ResourceVisibility.objects.filter(
+            resource_id__in=[row.resource_id for row in rows]).delete()
+        ResourceVisibility.objects.bulk_create(rows)
+
+
+def update_group_visibility_index(group_id):
+    """
+    Refresh the group flags of the ResourceVisibility rows
+    belonging to the given group.
+    """
+    from geonode.base.models import ResourceVisibility
+
+    public_group, private_group = _get_group_visibility_flags(
+        [group_id]).get(group_id, (False, False))
+    ResourceVisibility.objects.filter(group_id=group_id).update(
+        public_group=public_group,
+        private_group=private_group)
+
+
+def rebuild_visibility_index(chunk_size=1000):
+    """
+    Rebuild the whole ResourceVisibility index in chunks.
+    """
+    from geonode.base.models import ResourceBase, ResourceVisibility
+
+    ResourceVisibility.objects.exclude(
+        resource_id__in=ResourceBase.objects.values('id')).delete()
+    resources = ResourceBase.objects.only(
+        'id', 'owner', 'group', 'is_published', 'dirty_state').order_by('id')
+    last_id = 0
+    while True:
+        chunk = list(resources.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        update_visibility_index(chunk)
+        last_id = chunk[-1].id
 
 
 def get_users_with_perms(obj):
@@ -167,6 +201,45 @@ def get_users_with_perms(obj):
     return profiles
 
 
+def get_resources_with_perm(user, perm, resources):
+    """
+    Returns the set of ids of the given resources on which the user has
+    the ``perm`` object permission.
+
+    The guardian user and group object permissions of the whole batch
+    are loaded with two queries, instead of one ``has_perm`` per resource.
+    """
+    from geonode.base.models import ResourceBase
+    from guardian.models import UserObjectPermission, GroupObjectPermission
+
+    resource_ids = set([r.id for r in resources])
+    if not resource_ids or not user:
+        return set()
+    if user.is_anonymous():
+        user = get_anonymous_user()
+    if not user.is_active:
+        return set()
+    if user.is_superuser:
+        return resource_ids
+
+    ctype = ContentType.objects.get_for_model(ResourceBase)
+    codename = perm.split('.')[-1]
+    object_pks = [str(_id) for _id in resource_ids]
+    permitted = set(UserObjectPermission.objects.filter(
+        user=user,
+        content_type=ctype,
+        permission__codename=codename,
+        object_pk__in=object_pks).values_list('object_pk', flat=True))
+    permitted.update(GroupObjectPermission.objects.filter(
+        group__user=user,
+        content_type=ctype,
+        permission__codename=codename,
+        object_pk__in=object_pks).values_list('object_pk', flat=True))
+    logger.debug("Resolved '{}' on {} resources for user {}".format(
+        codename, len(resource_ids), user))
+    return set([int(pk) for pk in permitted])
+
+
 @on_ogc_backend(geoserver.BACKEND_PACKAGE)
 def get_geofence_rules_count():
     """Get the number of available GeoFence Cache Rules"""
@@ -437,8 +510,22 @@ def set_geofence_all(instance):
 def sync_geofence_with_guardian(layer, perms, user=None, group=None):
     """
     Sync Guardian permissions to GeoFence.
+
+    Only the rules missing from GeoFence are added, see ``sync_layer_geofence_rules``.
+    """
+    rules = get_geofence_rules(layer, perms, user=user, group=group)
+    return sync_layer_geofence_rules(layer, rules, purge=False)
+
+
+# A GeoFence ALLOW rule on a layer; a None user and role means any user.
+GeofenceRule = namedtuple('GeofenceRule', ['user', 'role', 'service'])
+
+
+def get_geofence_rules(layer, perms, user=None, group=None):
+    """
+    Returns the set of GeoFence rules granting the guardian ``perms``
+    on the layer to the given user and/or group (either instances or names).
     """
-    # Create new rule-set
     gf_services = {}
     gf_services["*"] = 'download_resourcebase' in perms and \
         ('view_resourcebase' in perms or 'change_layer_style' in perms)
@@ -456,22 +543,217 @@ def sync_geofence_with_guardian(layer, perms, user=None, group=None):
     _group = None
     if group:
         _group = group if isinstance(group, basestring) else group.name
+    rules = set()
     for service, allowed in gf_services.iteritems():
         if allowed:
+            service = service if service != "*" else None
             if _user:
-                logger.debug("Adding 'user' to geofence the rule: %s %s %s" % (layer, service, _user))
-                _update_geofence_rule(layer.name, layer.workspace, service, user=_user)
+                rules.add(GeofenceRule(_user, None, service))
             elif not _group:
-                logger.debug("Adding to geofence the rule: %s %s *" % (layer, service))
-                _update_geofence_rule(layer.name, layer.workspace, service)
+                rules.add(GeofenceRule(None, None, service))
 
             if _group:
-                logger.debug("Adding 'group' to geofence the rule: %s %s %s" % (layer, service, _group))
-                _update_geofence_rule(layer.name, layer.workspace, service, group=_group)
-    if not getattr(settings, 'DELAYED_SECURITY_SIGNALS', False):
-        set_geofence_invalidate_cache()
-    else:
-        layer.set_dirty_state()
+                rules.add(GeofenceRule(None, "ROLE_{}".format(_group.upper()), service))
+    return rules
+
+
+def get_layer_geofence_rules(layer, perm_spec):
+    """
+    Returns the whole set of GeoFence rules of the layer from a
+    {'users': {<user>: [perms]}, 'groups': {<group>: [perms]}} spec.
+
+    The AnonymousUser and the anonymous group get the rules for any user.
+    """
+    rules = set()
+    for user, perms in (perm_spec.get('users') or {}).items():
+        username = user if isinstance(user, basestring) else user.username
+        if "AnonymousUser" in username:
+            username = None
+        rules.update(get_geofence_rules(layer, perms, user=username))
+    for group, perms in (perm_spec.get('groups') or {}).items():
+        group_name = group if isinstance(group, basestring) else group.name
+        if group_name == 'anonymous':
+            group_name = None
+        rules.update(get_geofence_rules(layer, perms, group=group_name))
+    return rules
+
+
+class GeofenceClient(object):
+    """
+    GeoFence REST client sharing the pooled keep-alive session of the
+    OGC server. Rules are added and deleted by at most ``workers``
+    concurrent requests, and the number of calls and the time spent by
+    each operation are recorded in ``timings``.
+    """
+
+    def __init__(self, workers=None):
+        ogc_server = settings.OGC_SERVER['default']
+        self.url = ogc_server['LOCATION']
+        self.auth = HTTPBasicAuth(ogc_server['USER'], ogc_server['PASSWORD'])
+        self.workers = max(1, workers or getattr(settings, 'GEOFENCE_SYNC_WORKERS', 4))
+        self.session = http_sessions.get_session(self.url, pool_maxsize=max(self.workers, 10))
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def timed(self, operation):
+        start = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - start
+            with self._lock:
+                timing = self.timings.setdefault(operation, {'count': 0, 'time': 0.0})
+                timing['count'] += 1
+                timing['time'] += elapsed
+
+    def request(self, operation, method, path, **kwargs):
+        kwargs.setdefault('timeout', 10)
+        with self.timed(operation):
+            return self.session.request(method, self.url + path, auth=self.auth, verify=False, **kwargs)
+
+    def _map(self, func, items):
+        if self.workers == 1 or len(items) < 2:
+            return [func(item) for item in items]
+        pool = ThreadPool(min(self.workers, len(items)))
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    def get_layer_rules(self, workspace, layer):
+        """Returns the GeoFence rules of the layer"""
+        r = self.request('fetch', 'GET', 'rest/geofence/rules.json',
+                         params={'workspace': workspace, 'layer': layer},
+                         headers={'Content-type': 'application/json'})
+        if r.status_code < 200 or r.status_code >= 300:
+            logger.debug("Response [{}] : {}".format(r.status_code, r.text))
+            raise RuntimeError("Could not retrieve GeoFence Rules for Layer {}".format(layer))
+        rules = r.json().get('rules') or []
+        return [rule for rule in rules if rule.get('layer') == layer]
+
+    def get_highest_priority(self):
+        """Get the highest Rules priority"""
+        try:
+            headers = {'Content-type': 'application/json'}
+            r = self.request('priority', 'GET', 'rest/geofence/rules/count.json', headers=headers)
+            rules_count = int(r.json()['count'])
+            r = self.request('priority', 'GET', 'rest/geofence/rules.json',
+                             params={'page': rules_count - 1, 'entries': 1},
+                             headers=headers)
+            rules = r.json()['rules']
+            return int(rules[0]['priority']) if rules else 0
+        except BaseException:
+            tb = traceback.format_exc()
+            logger.debug(tb)
+            return 0
+
+    def add_rules(self, workspace, layer, rules):
+        """Adds the GeoFence ALLOW rules to the layer, with the same priority"""
+        priority = self.get_highest_priority() if rules else 0
+
+        def _add(rule):
+            payload = _get_geofence_payload(
+                layer=layer,
+                workspace=workspace,
+                access="ALLOW",
+                user=rule.user,
+                role=rule.role,
+                service=rule.service,
+                priority=priority
+            )
+            response = self.request('add', 'POST', 'rest/geofence/rules',
+                                    data=payload, headers={'Content-type': 'application/xml'})
+            if response.status_code not in (200, 201):
+                msg = ("Could not ADD GeoServer Rule {!r} for "
+                       "Layer {!r}: '{!r}'".format(rule, layer, response.text))
+                if 'Duplicate Rule' in response.text:
+                    logger.warning(msg)
+                else:
+                    raise RuntimeError(msg)
+
+        self._map(_add, list(rules))
+
+    def delete_rules(self, rule_ids):
+        """Deletes the GeoFence rules by id"""
+        def _delete(rule_id):
+            r = self.request('delete', 'DELETE', 'rest/geofence/rules/id/{}'.format(rule_id))
+            if r.status_code < 200 or r.status_code > 201:
+                logger.debug("Response [{}] : {}".format(r.status_code, r.text))
+                raise RuntimeError("Could not DELETE GeoServer Rule id[{}]".format(rule_id))
+
+        self._map(_delete, list(rule_ids))
+
+    def invalidate_cache(self):
+        """invalidate GeoFence Cache Rules"""
+        r = self.request('invalidate', 'PUT', 'rest/ruleCache/invalidate')
+        if r.status_code < 200 or r.status_code > 201:
+            logger.warning("Could not Invalidate GeoFence Rules.")
+            return False
+        return True
+
+
+def _get_geofence_rule_key(rule):
+    """
+    Returns the GeofenceRule of a GeoFence JSON rule, or None
+    if the rule is not a plain ALLOW rule managed by GeoNode.
+    """
+    if rule.get('access') != 'ALLOW' or rule.get('request') or rule.get('addressRange'):
+        return None
+    return GeofenceRule(rule.get('userName') or None,
+                        rule.get('roleName') or None,
+                        rule.get('service') or None)
+
+
+@on_ogc_backend(geoserver.BACKEND_PACKAGE)
+def sync_layer_geofence_rules(layer, rules, purge=True, client=None, invalidate=True):
+    """
+    Applies to GeoFence the difference between the ``rules`` of the layer and
+    the ones GeoFence already holds: only the missing rules are added and,
+    if ``purge``, the other rules of the layer are deleted.
+
+    Unless ``invalidate`` is False, the GeoFence cache is invalidated once at
+    the end (or the layer is marked dirty with DELAYED_SECURITY_SIGNALS).
+    Returns the number of added, deleted and unchanged rules along with the
+    per-operation timings.
+    """
+    try:
+        workspace = _get_layer_workspace(layer)
+    except (ObjectDoesNotExist, AttributeError, RuntimeError):
+        # This layer is not manageable by geofence
+        return None
+    client = client or GeofenceClient()
+    rules = set(rules)
+    try:
+        existing = {}
+        unmanaged = []
+        for rule in client.get_layer_rules(workspace, layer.name):
+            key = _get_geofence_rule_key(rule)
+            if key is not None and key not in existing:
+                existing[key] = rule['id']
+            else:
+                unmanaged.append(rule['id'])
+        to_add = [rule for rule in rules if rule not in existing]
+        to_delete = []
+        if purge:
+            to_delete = [_id for _key, _id in existing.items() if _key not in rules] + unmanaged
+        client.add_rules(workspace, layer.name, to_add)
+        client.delete_rules(to_delete)
+    finally:
+        if invalidate:
+            if not getattr(settings, 'DELAYED_SECURITY_SIGNALS', False):
+                client.invalidate_cache()
+            else:
+                layer.set_dirty_state()
+    stats = {
+        'added': len(to_add),
+        'deleted': len(to_delete),
+        'unchanged': len(rules) - len(to_add),
+        'timings': client.timings
+    }
+    logger.debug("Synced GeoFence Rules for Layer {}: {}".format(layer.name, stats))
+    return stats
 
 
 def set_owner_permissions(resource):
@@ -485,11 +767,12 @@ def set_owner_permissions(resource):
             assign_perm(perm, resource.owner, resource.get_self_resource())
 
 
-def remove_object_permissions(instance):
+def remove_object_permissions(instance, purge_rules=True):
     """Remove object permissions on given resource.
 
     If is a layer removes the layer specific permissions then the
-    resourcebase permissions
+    resourcebase permissions, and purges its GeoFence rules unless
+    ``purge_rules`` is False
 
     """
 
@@ -505,7 +788,7 @@ def remove_object_permissions(instance):
                 content_type=ContentType.objects.get_for_model(resource.layer),
                 object_pk=instance.id
             ).delete()
-            if settings.OGC_SERVER['default']['GEOFENCE_SECURITY_ENABLED']:
+            if purge_rules and settings.OGC_SERVER['default']['GEOFENCE_SECURITY_ENABLED']:
                 purge_geofence_layer_rules(resource)
         except (ObjectDoesNotExist, RuntimeError):
             pass  # This layer is not manageable by geofence
@@ -513,10 +796,11 @@ def remove_object_permissions(instance):
             tb = traceback.format_exc()
             logger.debug(tb)
         finally:
-            if not getattr(settings, 'DELAYED_SECURITY_SIGNALS', False):
-                set_geofence_invalidate_cache()
-            else:
-                resource.set_dirty_state()
+            if purge_rules:
+                if not getattr(settings, 'DELAYED_SECURITY_SIGNALS', False):
+                    set_geofence_invalidate_cache()
+                else:
+                    resource.set_dirty_state()
 
     UserObjectPermission.objects.filter(content_type=ContentType.objects.get_for_model(resource),
                                         object_pk=instance.id).delete()
@@ -556,8 +840,8 @@ def _get_layer_workspace(layer):
 
 
 def _get_geofence_payload(layer, workspace, access, user=None, group=None,
-                          service=None):
-    highest_priority = get_highest_priority()
+                          service=None, role=None, priority=None):
+    highest_priority = get_highest_priority() if priority is None else priority
     root_el = etree.Element("Rule")
     username_el = etree.SubElement(root_el, "userName")
     if user is not None:
@@ -567,8 +851,10 @@ def _get_geofence_payload(layer, workspace, access, user=None, group=None,
     priority_el = etree.SubElement(root_el, "priority")
     priority_el.text = str(highest_priority if highest_priority >= 0 else 0)
     if group is not None:
+        role = "ROLE_{}".format(group.upper())
+    if role is not None:
         role_el = etree.SubElement(root_el, "roleName")
-        role_el.text = "ROLE_{}".format(group.upper())
+        role_el.text = role
     workspace_el = etree.SubElement(root_el, "workspace")
     workspace_el.text = workspace
     layer_el = etree.SubElement(root_el, "layer")
@@ -581,76 +867,82 @@ def _get_geofence_payload(layer, workspace, access, user=None, group=None,
     return etree.tostring(root_el)
 
 
-def _update_geofence_rule(layer, workspace, service, user=None, group=None):
-    payload = _get_geofence_payload(
-        layer=layer,
-        workspace=workspace,
-        access="ALLOW",
-        user=user,
-        group=group,
-        service=service
-    )
-    logger.debug("request data: {}".format(payload))
-    response = requests.post(
-        "{base_url}rest/geofence/rules".format(
-            base_url=settings.OGC_SERVER['default']['LOCATION']),
-        data=payload,
-        headers={
-            'Content-type': 'application/xml'
-        },
-        auth=HTTPBasicAuth(
-            username=settings.OGC_SERVER['default']['USER'],
-            password=settings.OGC_SERVER['default']['PASSWORD']
-        )
-    )
-    logger.debug("response status_code: {}".format(response.status_code))
-    if response.status_code not in (200, 201):
-        msg = ("Could not ADD GeoServer User {!r} Rule for "
-               "Layer {!r}: '{!r}'".format(user, layer, response.text))
-        if 'Duplicate Rule' in response.text:
-            logger.warning(msg)
-        else:
-            raise RuntimeError(msg)
-
-
-def sync_resources_with_guardian(resource=None):
+def sync_resources_with_guardian(resource=None, batch_size=None, progress=None):
     """
     Sync resources with Guardian and clear their dirty state
+
+    The dirty resources (or the given one) are claimed in batches of
+    ``batch_size``, whose rows stay locked until their rules are synced, so
+    that several workers can share the backlog; locked rows are skipped
+    where the database allows it. The dirty state of a batch is cleared in
+    the same transaction, once the GeoFence cache has been invalidated.
+    Resources failing to sync stay dirty for the next run.
+
+    ``progress`` is called with the stats after each batch; the final stats
+    are returned.
     """
 
-    from geonode.base.models import ResourceBase
+    from geonode.base.models import ResourceBase, ResourceVisibility
     from geonode.layers.models import Layer
 
+    batch_size = batch_size or getattr(settings, 'SECURITY_SYNC_BATCH_SIZE', 100)
+    layer_ctype = ContentType.objects.get_for_model(Layer)
+    client = GeofenceClient() if check_ogc_backend(geoserver.BACKEND_PACKAGE) else None
     if resource:
-        dirty_resources = ResourceBase.objects.filter(id=resource.id)
+        resources = ResourceBase.objects.filter(id=resource.id).select_for_update()
     else:
-        dirty_resources = ResourceBase.objects.filter(dirty_state=True)
-    if dirty_resources and dirty_resources.count() > 0:
-        logger.debug(" --------------------------- synching with guardian!")
-        for r in dirty_resources:
-            if r.polymorphic_ctype.name == 'layer':
-                layer = None
+        resources = ResourceBase.objects.filter(dirty_state=True).select_for_update(
+            skip_locked=connection.features.has_select_for_update_skip_locked)
+
+    stats = {
+        'synced': 0,
+        'failed': 0,
+        'batches': 0,
+        'remaining': 0,
+        'elapsed': 0.0,
+        'rate': 0.0,
+        'timings': client.timings if client else {}
+    }
+    started = time.time()
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            batch = list(resources.filter(id__gt=last_id).order_by('id').values_list(
+                'id', 'polymorphic_ctype_id')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            logger.debug(" --------------------------- synching with guardian!")
+            layer_ids = [_id for _id, ctype_id in batch if ctype_id == layer_ctype.id]
+            failed = set()
+            for layer in Layer.objects.filter(id__in=layer_ids):
                 try:
-                    purge_geofence_layer_rules(r)
-                    layer = Layer.objects.get(id=r.id)
-                    perm_spec = layer.get_all_level_info()
-                    logger.debug(" %s --------------------------- %s " % (layer, perm_spec))
-                    # All the other users
-                    if 'users' in perm_spec:
-                        for user, perms in perm_spec['users'].items():
-                            user = get_user_model().objects.get(username=user)
-                            # Set the GeoFence User Rules
-                            geofence_user = str(user)
-                            if "AnonymousUser" in geofence_user:
-                                geofence_user = None
-                            sync_geofence_with_guardian(layer, perms, user=geofence_user)
-                    # All the other groups
-                    if 'groups' in perm_spec:
-                        for group, perms in perm_spec['groups'].items():
-                            group = Group.objects.get(name=group)
-                            # Set the GeoFence Group Rules
-                            sync_geofence_with_guardian(layer, perms, group=group)
-                    r.clear_dirty_state()
+                    with transaction.atomic():
+                        perm_spec = layer.get_all_level_info()
+                        logger.debug(" %s --------------------------- %s " % (layer, perm_spec))
+                        # Set the GeoFence User and Group Rules
+                        sync_layer_geofence_rules(
+                            layer, get_layer_geofence_rules(layer, perm_spec),
+                            client=client, invalidate=False)
                 except BaseException as e:
                     logger.exception(e)
-                    logger.warn("!WARNING! - Failure Synching-up Security Rules for Resource [%s]" % (r))
+                    logger.warn("!WARNING! - Failure Synching-up Security Rules for Resource [%s]" % (layer))
+                    failed.add(layer.id)
+            if client and len(layer_ids) > len(failed):
+                client.invalidate_cache()
+            synced_ids = [_id for _id, ctype_id in batch if _id not in failed]
+            ResourceBase.objects.filter(id__in=synced_ids).update(dirty_state=False)
+            ResourceVisibility.objects.filter(resource_id__in=synced_ids).update(dirty_state=False)
+
+        stats['batches'] += 1
+        stats['synced'] += len(synced_ids)
+        stats['failed'] += len(failed)
+        stats['elapsed'] = time.time() - started
+        stats['rate'] = stats['synced'] / stats['elapsed'] if stats['elapsed'] else 0.0
+        if not resource:
+            stats['remaining'] = ResourceBase.objects.filter(dirty_state=True).count()
+        logger.info("Synced {synced} resources ({failed} failures) in {elapsed:.1f}s, "
+                    "{rate:.1f} resources/s, {remaining} left".format(**stats))
+        if progress:
+            progress(dict(stats))
+    return stats
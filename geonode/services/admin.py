@@ -38,7 +38,7 @@ class ServiceAdminForm(ResourceBaseAdminForm):
 
 
 class ServiceAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'base_url', 'type', 'method')
+    list_display = ('id', 'name', 'base_url', 'type', 'method', 'probe_status', 'probe_latency', 'probe_checked')
     list_display_links = ('id', 'name', )
     list_filter = ('type', 'method')
     form = ServiceAdminForm
@@ -26,5 +26,5 @@ class ServicesAppConfig(NotificationsAppConfigBase):
 
     def ready(self):
         """Connect relevant signals to their corresponding handlers"""
-        from .signals import (remove_harvest_job, post_save_service)  # noqa
+        from .signals import (remove_harvest_job, post_save_service, invalidate_proxy_allowed_hosts)  # noqa
         super(ServicesAppConfig, self).ready()
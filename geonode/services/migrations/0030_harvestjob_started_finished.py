@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0029_remove_service_created'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='harvestjob',
+            name='finished',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='harvestjob',
+            name='started',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0030_harvestjob_started_finished'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='probe_checked',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='probe_latency',
+            field=models.FloatField(blank=True, help_text='Response time in seconds', null=True),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='probe_status',
+            field=models.IntegerField(blank=True,
+                                      help_text='HTTP status code, empty when the service did not answer',
+                                      null=True),
+        ),
+    ]
@@ -22,7 +22,7 @@ import logging
 from django.db import models
 from django.conf import settings
 from django.core.urlresolvers import reverse
-from django.utils.functional import cached_property
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from geonode.base.models import ResourceBase
 from geonode.people.enumerations import ROLE_VALUES
@@ -145,6 +145,21 @@ class Service(ResourceBase):
         blank=True,
         related_name='service_set'
     )
+    # last check of the probe_services task
+    probe_status = models.IntegerField(
+        null=True,
+        blank=True,
+        help_text=_('HTTP status code, empty when the service did not answer')
+    )
+    probe_latency = models.FloatField(
+        null=True,
+        blank=True,
+        help_text=_('Response time in seconds')
+    )
+    probe_checked = models.DateTimeField(
+        null=True,
+        blank=True
+    )
 
     # Supported Capabilities
 
@@ -170,16 +185,49 @@ class Service(ResourceBase):
     def get_absolute_url(self):
         return '/services/%i' % self.id
 
-    @cached_property
+    def get_harvest_stats(self):
+        """Return harvesting progress, throughput and failures of the service
+
+        Throughput is the number of resources harvested per minute between
+        the start of the first job and the end of the last one.
+
+        """
+        jobs = HarvestJob.objects.filter(service=self)
+        counts = dict(jobs.values_list('status').annotate(count=models.Count('id')).order_by())
+        timing = jobs.filter(finished__isnull=False).aggregate(
+            started=models.Min('started'), finished=models.Max('finished'))
+        processed = counts.get(enumerations.PROCESSED, 0)
+        failed = counts.get(enumerations.FAILED, 0)
+        throughput = None
+        if timing['started'] and timing['finished'] and timing['finished'] > timing['started']:
+            elapsed = (timing['finished'] - timing['started']).total_seconds()
+            throughput = round(processed * 60.0 / elapsed, 2)
+        return {
+            'queued': counts.get(enumerations.QUEUED, 0),
+            'in_process': counts.get(enumerations.IN_PROCESS, 0),
+            'processed': processed,
+            'failed': failed,
+            'failure_rate': round(float(failed) / (processed + failed), 4) if processed + failed else None,
+            'started': timing['started'],
+            'finished': timing['finished'],
+            'throughput': throughput,
+            'last_failures': list(jobs.filter(status=enumerations.FAILED).order_by(
+                '-finished').values('resource_id', 'details', 'finished')[:10]),
+        }
+
+    @property
     def probe(self):
-        # AF: this must be handled asynchronously
-        # from geonode.utils import http_client
-        # try:
-        #     resp, content = http_client.request(self.service_url)
-        #     return resp.status
-        # except:
-        #     return 404
-        return 200
+        """HTTP status of the service as last checked by the probe_services task
+
+        Services not probed yet are assumed to be available.
+
+        """
+        return 200 if self.probe_checked is None else self.probe_status
+
+    @property
+    def is_online(self):
+        status = self.probe
+        return status is not None and 0 < status < 500
 
 
 class ServiceProfileRole(models.Model):
@@ -208,8 +256,15 @@ class HarvestJob(models.Model):
         max_length=15,
     )
     details = models.TextField(null=True, blank=True, default=_("Resource is queued"))
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
 
     def update_status(self, status, details=""):
         self.status = status
         self.details = details
+        if status == enumerations.IN_PROCESS:
+            self.started = timezone.now()
+            self.finished = None
+        elif status in (enumerations.PROCESSED, enumerations.FAILED):
+            self.finished = timezone.now()
         self.save()
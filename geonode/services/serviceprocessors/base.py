@@ -19,12 +19,19 @@
 
 """Remote service handling base classes and helpers."""
 
+import os
+import json
+import time
+import errno
+import hashlib
 import logging
+import tempfile
+import requests
 
 from django.conf import settings
 from django.core.urlresolvers import reverse
 from geoserver.catalog import Catalog
-from six.moves.urllib.parse import urlencode, urlparse, urljoin, parse_qs, urlunparse
+from six.moves.urllib.parse import urlencode, urlparse, urljoin, parse_qs, parse_qsl, urlunparse
 from urllib import quote
 
 from .. import enumerations
@@ -78,6 +85,112 @@ def get_proxified_ows_url(url, version=None, proxy_base=None):
     return (version, proxified_url, base_ows_url)
 
 
+def get_capabilities_url(url, service="WMS", version=None):
+    """Return the GetCapabilities request for an OWS base URL
+
+    Vendor parameters of the base URL are kept.
+
+    """
+
+    parsed = urlparse(url)
+    params = [(key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+              if key.lower() not in ('service', 'version', 'request')]
+    params.extend([('service', service), ('request', 'GetCapabilities')])
+    if version:
+        params.append(('version', version))
+    return urlunparse([
+        parsed.scheme,
+        parsed.netloc,
+        parsed.path,
+        parsed.params,
+        urlencode(params),
+        parsed.fragment
+    ])
+
+
+def _get_capabilities_cache_path(key):
+    cache_dir = getattr(settings, "SERVICES_CAPABILITIES_CACHE_DIR", None) or os.path.join(
+        tempfile.gettempdir(), "geonode-capabilities")
+    try:
+        os.makedirs(cache_dir)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    return os.path.join(cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+
+def _write_atomic(path, content):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+    os.rename(tmp_path, path)
+
+
+def get_cached_capabilities(key, url, version=None, username=None, password=None,
+                            timeout=30, headers=None):
+    """Return the capabilities document of a remote service, cached on disk
+
+    The document is stored once per service ``key`` (usually its base URL),
+    so the many tasks harvesting a service don't fetch and transfer it again.
+    A cached document younger than ``SERVICES_CAPABILITIES_CACHE_TTL`` seconds
+    is returned as is, an older one is revalidated with a conditional request
+    using the ETag or Last-Modified header of the response it came from.
+
+    """
+
+    path = _get_capabilities_cache_path(key)
+    try:
+        with open(path + '.json') as f:
+            meta = json.load(f)
+        cached = meta.get('url') == url and os.path.exists(path + '.xml')
+    except (IOError, ValueError):
+        meta = {}
+        cached = False
+
+    ttl = getattr(settings, "SERVICES_CAPABILITIES_CACHE_TTL", 600)
+    if cached and time.time() - meta.get('checked', 0) < ttl:
+        with open(path + '.xml', 'rb') as f:
+            return f.read()
+
+    request_headers = dict(headers or {})
+    if cached and meta.get('etag'):
+        request_headers['If-None-Match'] = meta['etag']
+    if cached and meta.get('last_modified'):
+        request_headers['If-Modified-Since'] = meta['last_modified']
+    response = requests.get(
+        url,
+        headers=request_headers,
+        auth=(username, password) if username else None,
+        timeout=timeout,
+        verify=False)
+    if cached and response.status_code == 304:
+        logger.debug("Capabilities of {} not modified".format(key))
+        with open(path + '.xml', 'rb') as f:
+            content = f.read()
+    else:
+        response.raise_for_status()
+        content = response.content
+        _write_atomic(path + '.xml', content)
+    _write_atomic(path + '.json', json.dumps({
+        'url': url,
+        'version': version,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'checked': time.time(),
+    }))
+    return content
+
+
+def clear_cached_capabilities(key):
+    """Remove the cached capabilities document of a remote service"""
+    path = _get_capabilities_cache_path(key)
+    for ext in ('.json', '.xml'):
+        try:
+            os.remove(path + ext)
+        except OSError:
+            pass
+
+
 def get_geoserver_cascading_workspace(create=True):
     """Return the geoserver workspace used for cascaded services
 
@@ -163,10 +276,10 @@ class ServiceHandlerBase(object):
         raise NotImplementedError
 
     def has_unharvested_resources(self, geonode_service):
-        already_done = list(models.HarvestJob.objects.values_list(
+        already_done = set(models.HarvestJob.objects.values_list(
             "resource_id", flat=True).filter(service=geonode_service))
-        for resource in self.get_resources():
-            if resource.id not in already_done:
+        for resource in self.get_resources() or []:
+            if str(resource.id) not in already_done:
                 result = True
                 break
         else:
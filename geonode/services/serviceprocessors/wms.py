@@ -25,6 +25,7 @@ import requests
 import traceback
 
 from uuid import uuid4
+from urllib import quote
 from urlparse import urlsplit, urljoin
 
 from django.conf import settings
@@ -75,6 +76,9 @@ def WebMapService(url,
     @param parse_remote_metadata: whether to fully process MetadataURL elements
     @param timeout: time (in seconds) after which requests should timeout
     @return: initialized WebFeatureService_2_0_0 object
+
+    When xml is not given the capabilities document is read from the
+    on-disk cache, see base.get_cached_capabilities
     '''
 
     if not proxy_base:
@@ -86,6 +90,16 @@ def WebMapService(url,
         version = clean_version
         clean_url = proxified_url
 
+    if xml is None:
+        capabilities_url = base.get_capabilities_url(base_ows_url, version=version)
+        if proxy_base:
+            capabilities_url = "{proxy_base}?url={url}".format(
+                proxy_base=proxy_base, url=quote(capabilities_url, safe=''))
+        xml = base.get_cached_capabilities(
+            base_ows_url, capabilities_url, version=version,
+            username=username, password=password,
+            timeout=timeout, headers=headers)
+
     if version in ['1.1.1']:
         return (base_ows_url, wms111.WebMapService_1_1_1(clean_url, version=version, xml=xml,
                                                          parse_remote_metadata=parse_remote_metadata,
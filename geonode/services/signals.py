@@ -27,6 +27,7 @@ from django.dispatch import receiver
 from django.db.models import signals
 
 from ..layers.models import Layer
+from ..proxy.utils import invalidate_allowed_hosts
 
 from .models import Service
 from .models import HarvestJob
@@ -53,3 +54,10 @@ def remove_harvest_job(sender, **kwargs):
 def post_save_service(instance, sender, created, **kwargs):
     if created:
         instance.set_default_permissions()
+
+
+@receiver(signals.post_save, sender=Service)
+@receiver(signals.post_delete, sender=Service)
+def invalidate_proxy_allowed_hosts(instance, sender, **kwargs):
+    """Remote services hosts are part of the proxy allow-list."""
+    invalidate_allowed_hosts()
@@ -21,9 +21,19 @@
 
 from __future__ import absolute_import
 
+import time
 import logging
+import requests
 
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from urlparse import urlsplit
+
+from django.conf import settings
 from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 from . import enumerations
 from . import models
@@ -36,21 +46,27 @@ from geonode.catalogue.models import catalogue_post_save
 logger = logging.getLogger(__name__)
 
 
-@app.task(bind=True,
-          name='geonode.services.tasks.update.harvest_resource',
-          queue='update',)
-def harvest_resource(self, harvest_job_id):
-    harvest_job = models.HarvestJob.objects.get(pk=harvest_job_id)
+def _get_handler(service):
+    return get_service_handler(
+        base_url=service.base_url,
+        proxy_base=service.proxy_base,
+        service_type=service.type
+    )
+
+
+def _harvest_job(harvest_job, handler=None):
+    """Harvest the resource of a job, updating its status.
+
+    The service handler may be shared by the jobs of the same service, so the
+    remote capabilities are parsed only once. Returns the handler used.
+    """
     harvest_job.update_status(
         status=enumerations.IN_PROCESS, details="Harvesting resource...")
     result = False
     details = ""
     try:
-        handler = get_service_handler(
-            base_url=harvest_job.service.base_url,
-            proxy_base=harvest_job.service.proxy_base,
-            service_type=harvest_job.service.type
-        )
+        if handler is None:
+            handler = _get_handler(harvest_job.service)
         with transaction.atomic():
             logger.debug("harvesting resource...")
             handler.harvest_resource(
@@ -73,3 +89,105 @@ def harvest_resource(self, harvest_job_id):
             status=enumerations.PROCESSED if result else enumerations.FAILED,
             details=details
         )
+    return handler
+
+
+@app.task(bind=True,
+          name='geonode.services.tasks.update.harvest_resource',
+          queue='update',)
+def harvest_resource(self, harvest_job_id):
+    harvest_job = models.HarvestJob.objects.get(pk=harvest_job_id)
+    _harvest_job(harvest_job)
+
+
+@app.task(bind=True,
+          name='geonode.services.tasks.update.harvest_resources',
+          queue='update',)
+def harvest_resources(self, harvest_job_ids):
+    """Harvest a batch of resources, sharing one handler per service."""
+    handlers = {}
+    harvest_jobs = models.HarvestJob.objects.filter(
+        pk__in=harvest_job_ids).select_related('service').order_by('pk')
+    for harvest_job in harvest_jobs:
+        if harvest_job.status == enumerations.PROCESSED:
+            continue
+        handlers[harvest_job.service_id] = _harvest_job(
+            harvest_job, handlers.get(harvest_job.service_id))
+
+
+def harvest_in_batches(harvest_job_ids):
+    """Queue the harvest of many resources as concurrent batched tasks.
+
+    Each task harvests ``SERVICES_HARVEST_BATCH_SIZE`` resources, so the
+    remote capabilities are read once per batch instead of once per resource.
+    """
+    batch_size = max(1, getattr(settings, "SERVICES_HARVEST_BATCH_SIZE", 50))
+    harvest_job_ids = list(harvest_job_ids)
+    for i in range(0, len(harvest_job_ids), batch_size):
+        harvest_resources.apply_async((harvest_job_ids[i:i + batch_size],))
+
+
+def _probe_host(services, timeout):
+    """Probe the services of a host one after the other.
+
+    Once the host doesn't answer within timeout, its remaining services are
+    reported unreachable without being tried. Returns a list of
+    (service id, HTTP status or None, latency or None).
+    """
+    results = []
+    for service_id, url in services:
+        start = time.time()
+        try:
+            # only headers are read, the body of the response is not fetched
+            response = requests.get(url, timeout=timeout, stream=True, verify=False)
+            response.close()
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            logger.warning("Remote service {} is unreachable".format(url))
+            results.extend((_id, None, None) for _id, _url in services[len(results):])
+            break
+        except requests.exceptions.RequestException:
+            logger.exception("Could not probe remote service {}".format(url))
+            results.append((service_id, None, None))
+        else:
+            results.append((service_id, response.status_code, time.time() - start))
+    return results
+
+
+@app.task(bind=True,
+          name='geonode.services.tasks.probe_services',
+          queue='update',)
+def probe_services(self):
+    """Check the availability of all the registered services.
+
+    Hosts are probed concurrently and results are stored on the services,
+    so serializers read them along with the service rows.
+    """
+    hosts = OrderedDict()
+    for service_id, url in models.Service.objects.order_by('id').values_list('id', 'base_url'):
+        hosts.setdefault(urlsplit(url).netloc, []).append((service_id, url))
+    if not hosts:
+        return
+
+    timeout = getattr(settings, "SERVICES_PROBE_TIMEOUT", 5)
+    workers = getattr(settings, "SERVICES_PROBE_WORKERS", 8)
+
+    def _probe(services):
+        return _probe_host(services, timeout)
+
+    pool = ThreadPool(max(1, min(workers, len(hosts))))
+    try:
+        results = pool.map(_probe, hosts.values())
+    finally:
+        pool.close()
+
+    now = timezone.now()
+    for host_results in results:
+        for service_id, status, latency in host_results:
+            services = models.Service.objects.filter(id=service_id)
+            if status is not None and status < 500:
+                services.update(probe_status=status, probe_latency=latency, probe_checked=now,
+                                first_noanswer=None, noanswer_retries=0)
+            else:
+                services.filter(first_noanswer__isnull=True).update(first_noanswer=now)
+                services.update(probe_status=status, probe_latency=latency, probe_checked=now,
+                                noanswer_retries=Coalesce(F('noanswer_retries'), 0) + 1)
@@ -18,11 +18,16 @@
 #
 #########################################################################
 
+import shutil
+import requests
+import tempfile
+
 from django.contrib.staticfiles.testing import StaticLiveServerTestCase
 from django.test import Client
 from selenium import webdriver
 from unittest import TestCase as StandardTestCase
 
+from django.conf import settings
 from django.core.urlresolvers import reverse
 from django.contrib.auth import get_user_model
 from django.template.defaultfilters import slugify
@@ -31,8 +36,8 @@ from owslib.map.wms111 import ContentMetadata
 
 from geonode.services.utils import test_resource_table_status
 from geonode.tests.base import GeoNodeBaseTestSupport
-from . import enumerations, forms
-from .models import Service
+from . import enumerations, forms, tasks
+from .models import HarvestJob, Service
 from .serviceprocessors import (base,
                                 handler,
                                 wms,
@@ -115,6 +120,50 @@ class ModuleFunctionsTestCase(StandardTestCase):
         handler.get_service_handler(phony_url, service_type=enumerations.WMS)
         mock_wms_handler.assert_called_with(phony_url)
 
+    @mock.patch("geonode.services.serviceprocessors.base.requests",
+                autospec=True)
+    @mock.patch("geonode.services.serviceprocessors.base.settings",
+                autospec=True)
+    def test_get_cached_capabilities(self, mock_settings, mock_requests):
+        mock_settings.SERVICES_CAPABILITIES_CACHE_DIR = tempfile.mkdtemp()
+        mock_settings.SERVICES_CAPABILITIES_CACHE_TTL = 600
+        phony_url = "http://fake/ows?map=foo"
+        capabilities_url = base.get_capabilities_url(phony_url, version="1.1.1")
+        self.assertIn("map=foo", capabilities_url)
+        self.assertIn("request=GetCapabilities", capabilities_url)
+        response = mock_requests.get.return_value
+        response.status_code = 200
+        response.content = b"<WMT_MS_Capabilities/>"
+        response.headers = {"ETag": "abc"}
+        try:
+            for _ in range(3):
+                self.assertEqual(
+                    base.get_cached_capabilities(phony_url, capabilities_url),
+                    response.content)
+            self.assertEqual(mock_requests.get.call_count, 1)
+
+            # expired documents are revalidated
+            mock_settings.SERVICES_CAPABILITIES_CACHE_TTL = 0
+            response.status_code = 304
+            response.content = b""
+            self.assertEqual(
+                base.get_cached_capabilities(phony_url, capabilities_url),
+                b"<WMT_MS_Capabilities/>")
+            self.assertEqual(mock_requests.get.call_count, 2)
+            self.assertEqual(
+                mock_requests.get.call_args[1]["headers"]["If-None-Match"], "abc")
+
+            base.clear_cached_capabilities(phony_url)
+            response.status_code = 200
+            response.content = b"<WMS_Capabilities/>"
+            self.assertEqual(
+                base.get_cached_capabilities(phony_url, capabilities_url),
+                response.content)
+            self.assertNotIn(
+                "If-None-Match", mock_requests.get.call_args[1]["headers"])
+        finally:
+            shutil.rmtree(mock_settings.SERVICES_CAPABILITIES_CACHE_DIR)
+
     @mock.patch("arcrest.MapService",
                 autospec=True)
     def test_get_service_handler_arcgis(self, mock_map_service):
@@ -557,6 +606,71 @@ class WmsServiceHandlerTestCase(GeoNodeBaseTestSupport):
             password=mock_catalog.password
         )
 
+    @mock.patch("geonode.services.tasks.harvest_resources",
+                autospec=True)
+    def test_harvest_in_batches(self, mock_harvest_resources):
+        with self.settings(SERVICES_HARVEST_BATCH_SIZE=2):
+            tasks.harvest_in_batches([1, 2, 3, 4, 5])
+        self.assertEqual(
+            [c[0][0] for c in mock_harvest_resources.apply_async.call_args_list],
+            [([1, 2],), ([3, 4],), ([5],)])
+
+    def test_get_harvest_stats(self):
+        service = Service.objects.create(
+            base_url="http://fake/ows", name="fake", type=enumerations.WMS,
+            owner=self.test_user)
+        for resource_id, status in (("a", enumerations.PROCESSED),
+                                    ("b", enumerations.PROCESSED),
+                                    ("c", enumerations.FAILED),
+                                    ("d", enumerations.QUEUED)):
+            job = HarvestJob.objects.create(service=service, resource_id=resource_id)
+            if status != enumerations.QUEUED:
+                job.update_status(enumerations.IN_PROCESS)
+                job.update_status(status, details=resource_id)
+        stats = service.get_harvest_stats()
+        self.assertEqual(stats["processed"], 2)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(stats["queued"], 1)
+        self.assertEqual(stats["in_process"], 0)
+        self.assertEqual(stats["failure_rate"], round(1 / 3.0, 4))
+        self.assertEqual([f["resource_id"] for f in stats["last_failures"]], ["c"])
+        self.assertIsNotNone(stats["started"])
+        self.assertIsNotNone(stats["finished"])
+
+    @mock.patch("geonode.services.tasks.requests.get")
+    def test_probe_services(self, mock_get):
+        services = [
+            Service.objects.create(base_url=url, name=slugify(url), type=enumerations.WMS,
+                                   owner=self.test_user)
+            for url in ("http://up/ows", "http://down/ows", "http://down/other/ows")]
+        self.assertTrue(all(service.is_online for service in services))
+
+        def _get(url, **kwargs):
+            if url.startswith("http://down"):
+                raise requests.exceptions.ConnectionError(url)
+            return mock.MagicMock(status_code=200)
+        mock_get.side_effect = _get
+        tasks.probe_services()
+        # the second service of an unreachable host is not tried
+        self.assertEqual(mock_get.call_count, 2)
+
+        up, down, other = [Service.objects.get(id=service.id) for service in services]
+        self.assertTrue(up.is_online)
+        self.assertEqual(up.probe, 200)
+        self.assertIsNotNone(up.probe_latency)
+        self.assertEqual(up.noanswer_retries, 0)
+        for service in (down, other):
+            self.assertFalse(service.is_online)
+            self.assertIsNone(service.probe)
+            self.assertIsNotNone(service.first_noanswer)
+            self.assertEqual(service.noanswer_retries, 1)
+
+        response = self.client.get(reverse('service_proxy', args=(down.id,)))
+        self.assertEqual(response.status_code, 503)
+        # the answer is cached until the next probe, not as long as proxied ones
+        self.assertIn('max-age=%s' % settings.SERVICES_PROBE_INTERVAL, response['Cache-Control'])
+        self.assertNotIn('max-age=604800', response['Cache-Control'])
+
     def test_local_user_cant_delete_service(self):
         self.client.logout()
         response = self.client.get(reverse('register_service'))
@@ -35,6 +35,8 @@ urlpatterns = [
         name='remove_service'),
     url(r'^(?P<service_id>\d+)/harvest$', views.harvest_resources,
         name='harvest_resources'),
+    url(r'^(?P<service_id>\d+)/stats$', views.harvest_stats,
+        name='harvest_stats'),
     url(r'^(?P<service_id>\d+)/harvest/(?P<resource_id>\S+)',
         views.harvest_single_resource, name='harvest_single_resource'),
 ]
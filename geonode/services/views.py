@@ -19,17 +19,20 @@
 #########################################################################
 
 import logging
+from datetime import timedelta
 
 from django.conf import settings
 from django.contrib import messages
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
 from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.shortcuts import redirect
 from django.shortcuts import render
 from django.template import loader
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
 from django.utils.translation import ugettext as _
 from django.views.decorators.csrf import requires_csrf_token
 from django.views.decorators.cache import cache_control
@@ -40,6 +43,7 @@ from geonode.proxy.views import proxy
 from urlparse import urljoin
 from urllib import quote
 from .serviceprocessors import get_service_handler
+from .serviceprocessors.base import clear_cached_capabilities
 from . import enumerations
 from . import forms
 from .models import HarvestJob
@@ -50,9 +54,21 @@ logger = logging.getLogger("geonode.core.layers.views")
 
 
 @requires_csrf_token
-@cache_control(public=True, must_revalidate=True, max_age=604800)
 def service_proxy(request, service_id):
     service = get_object_or_404(Service, pk=service_id)
+    # don't let clients wait for a service the last probe found unreachable,
+    # the answer is cached until the next probe only
+    probe_interval = getattr(settings, "SERVICES_PROBE_INTERVAL", 300)
+    if not service.is_online and service.probe_checked > timezone.now() - timedelta(seconds=2 * probe_interval):
+        response = HttpResponse(
+            _("Remote service is not available"), status=503)
+        patch_cache_control(response, public=True, must_revalidate=True, max_age=probe_interval)
+        return response
+    return _service_proxy(request, service)
+
+
+@cache_control(public=True, must_revalidate=True, max_age=604800)
+def _service_proxy(request, service):
     if not service.proxy_base:
         service_url = service.base_url
     else:
@@ -88,8 +104,6 @@ def register_service(request):
             service.set_default_permissions()
             if service_handler.indexing_method == enumerations.CASCADED:
                 service_handler.create_cascaded_store()
-            request.session[service_handler.url] = service_handler
-            logger.debug("Added handler to the session")
             messages.add_message(
                 request,
                 messages.SUCCESS,
@@ -108,39 +122,38 @@ def register_service(request):
     return result
 
 
-def _get_service_handler(request, service):
-    """Add the service handler to the HttpSession.
+def _get_service_handler(service):
+    """Return the service handler of a registered service.
 
-    We use the django session object to store the service handler's
-    representation of the remote service between sequentially logic steps.
-    This is done in order to improve user experience, as we avoid making
-    multiple Capabilities requests (this is a time saver on servers that
-    feature many layers.
+    Handlers are not kept in the HttpSession anymore: the capabilities
+    document they parse is cached on disk and shared with the harvesting
+    tasks, so recreating a handler doesn't hit the remote service again.
 
     """
 
-    service_handler = get_service_handler(
+    return get_service_handler(
         service.base_url, service.proxy_base, service.type)
-    request.session[service.base_url] = service_handler
-    logger.debug("Added handler to the session")
-    return service_handler
 
 
 @login_required
 def harvest_resources(request, service_id):
     service = get_object_or_404(Service, pk=service_id)
     try:
-        handler = request.session[service.base_url]
-    except KeyError:  # handler is not saved on the session, recreate it
-        return redirect(
-            reverse("rescan_service", kwargs={"service_id": service.id})
+        handler = _get_service_handler(service)
+    except Exception:
+        return render(
+            request,
+            "services/remote_service_unavailable.html",
+            {"service": service}
         )
     available_resources = handler.get_resources()
+    if available_resources is not None:
+        available_resources = list(available_resources)
     is_sync = getattr(settings, "CELERY_TASK_ALWAYS_EAGER", False)
     errored_state = False
     if request.method == "GET":
-        already_harvested = HarvestJob.objects.values_list(
-            "resource_id", flat=True).filter(service=service, status=enumerations.PROCESSED)
+        already_harvested = set(HarvestJob.objects.values_list(
+            "resource_id", flat=True).filter(service=service, status=enumerations.PROCESSED))
         if available_resources:
             not_yet_harvested = [
                 r for r in available_resources if str(r.id) not in already_harvested]
@@ -180,19 +193,24 @@ def harvest_resources(request, service_id):
         requested.extend(request.GET.getlist("resource_list"))
         # Let's remove duplicates
         requested = list(set(requested))
-        resources_to_harvest = []
-        for id in _gen_harvestable_ids(requested, available_resources):
-            logger.debug("id: {}".format(id))
-            harvest_job, created = HarvestJob.objects.get_or_create(
-                service=service,
-                resource_id=id
-            )
-            if created or harvest_job.status != enumerations.PROCESSED:
-                resources_to_harvest.append(id)
-                tasks.harvest_resource.apply_async((harvest_job.id,))
-            else:
-                logger.warning(
-                    "resource {} already has a harvest job".format(id))
+        resources_to_harvest = list(_gen_harvestable_ids(requested, available_resources or []))
+        existing = set(HarvestJob.objects.filter(
+            service=service,
+            resource_id__in=resources_to_harvest
+        ).values_list("resource_id", flat=True))
+        HarvestJob.objects.bulk_create(
+            HarvestJob(service=service, resource_id=id)
+            for id in resources_to_harvest if id not in existing
+        )
+        harvest_jobs = HarvestJob.objects.filter(
+            service=service,
+            resource_id__in=resources_to_harvest
+        )
+        for id in harvest_jobs.filter(status=enumerations.PROCESSED).values_list("resource_id", flat=True):
+            logger.warning(
+                "resource {} already has a harvest job".format(id))
+        tasks.harvest_in_batches(harvest_jobs.exclude(
+            status=enumerations.PROCESSED).order_by("id").values_list("id", flat=True))
         msg_async = _("The selected resources are being imported")
         msg_sync = _("The selected resources have been imported")
         messages.add_message(
@@ -213,7 +231,7 @@ def harvest_resources(request, service_id):
 @login_required
 def harvest_single_resource(request, service_id, resource_id):
     service = get_object_or_404(Service, pk=service_id)
-    handler = _get_service_handler(request, service)
+    handler = _get_service_handler(service)
     try:  # check that resource_id is valid for this handler
         handler.get_resource(resource_id)
     except KeyError:
@@ -238,8 +256,15 @@ def harvest_single_resource(request, service_id, resource_id):
     )
 
 
+@login_required
+def harvest_stats(request, service_id):
+    """Return the harvesting throughput and failures of a service as JSON"""
+    service = get_object_or_404(Service, pk=service_id)
+    return JsonResponse(service.get_harvest_stats())
+
+
 def _gen_harvestable_ids(requested_ids, available_resources):
-    available_resource_ids = [str(r.id) for r in available_resources]
+    available_resource_ids = set(str(r.id) for r in available_resources)
     for id in requested_ids:
         identifier = str(id)
         if identifier in available_resource_ids:
@@ -249,8 +274,9 @@ def _gen_harvestable_ids(requested_ids, available_resources):
 @login_required
 def rescan_service(request, service_id):
     service = get_object_or_404(Service, pk=service_id)
+    clear_cached_capabilities(service.base_url)
     try:
-        _get_service_handler(request, service)
+        _get_service_handler(service)
     except Exception:
         return render(
             request,
@@ -292,16 +318,6 @@ def service_detail(request, service_id):
     except EmptyPage:
         resources = paginator.page(paginator.num_pages)
 
-    # pop the handler out of the session in order to free resources
-    # - we had stored the service handler on the session in order to
-    # speed up the register/harvest resources flow. However, for services
-    # with many resources, keeping the handler in the session leads to degraded
-    # performance
-    try:
-        request.session.pop(service.base_url)
-    except KeyError:
-        pass
-
     return render(
         request,
         template_name="services/service_detail.html",
@@ -314,6 +330,7 @@ def service_detail(request, service_id):
             "permissions_json": _perms_info_json(service),
             "resources": resources,
             "total_resources": len(all_resources),
+            "harvest_stats": service.get_harvest_stats(),
         }
     )
 
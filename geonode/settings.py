@@ -759,6 +759,19 @@ ACCOUNT_LOGOUT_REDIRECT_URL = os.getenv('LOGOUT_REDIRECT_URL', SITEURL)
 DEFAULT_WORKSPACE = os.getenv('DEFAULT_WORKSPACE', 'geonode')
 CASCADE_WORKSPACE = os.getenv('CASCADE_WORKSPACE', 'geonode')
 
+# Remote services capabilities documents are cached on disk (defaults to a
+# temporary directory) and revalidated after the TTL in seconds. Resources
+# are harvested in concurrent tasks of SERVICES_HARVEST_BATCH_SIZE each.
+SERVICES_CAPABILITIES_CACHE_DIR = os.getenv('SERVICES_CAPABILITIES_CACHE_DIR', None)
+SERVICES_CAPABILITIES_CACHE_TTL = int(os.getenv('SERVICES_CAPABILITIES_CACHE_TTL', 600))
+SERVICES_HARVEST_BATCH_SIZE = int(os.getenv('SERVICES_HARVEST_BATCH_SIZE', 50))
+
+# Registered services are probed every SERVICES_PROBE_INTERVAL seconds, with
+# SERVICES_PROBE_WORKERS hosts checked concurrently
+SERVICES_PROBE_INTERVAL = int(os.getenv('SERVICES_PROBE_INTERVAL', 300))
+SERVICES_PROBE_TIMEOUT = int(os.getenv('SERVICES_PROBE_TIMEOUT', 5))
+SERVICES_PROBE_WORKERS = int(os.getenv('SERVICES_PROBE_WORKERS', 8))
+
 OGP_URL = os.getenv('OGP_URL', "http://geodata.tufts.edu/solr/select")
 
 # Topic Categories list should not be modified (they are ISO). In case you
@@ -1071,10 +1084,29 @@ except ValueError:
     # fallback to regular list of values separated with misc chars
     PROXY_ALLOWED_HOSTS = [HOSTNAME, 'localhost', 'django', 'geonode', 'spatialreference.org', 'nominatim.openstreetmap.org'] if os.getenv('PROXY_ALLOWED_HOSTS') is None \
         else re.split(r' *[,|:|;] *', os.getenv('PROXY_ALLOWED_HOSTS'))
+# Remote Services are checked for changes at most every PROXY_ALLOWED_HOSTS_CHECK_INTERVAL
+# seconds when the allowed hosts are compiled in another process.
+PROXY_ALLOWED_HOSTS_CHECK_INTERVAL = int(os.getenv('PROXY_ALLOWED_HOSTS_CHECK_INTERVAL', 5))
 
 # The proxy to use when making cross origin requests.
 PROXY_URL = os.environ.get('PROXY_URL', '/proxy/?url=')
 
+# Stream large proxied responses to the client instead of reading them in memory.
+PROXY_STREAMING = ast.literal_eval(os.getenv('PROXY_STREAMING', 'True'))
+# Responses up to this size (in bytes) are still read in memory.
+PROXY_MAX_BUFFERED_SIZE = int(os.getenv('PROXY_MAX_BUFFERED_SIZE', 1024 * 1024))
+# Max size (in bytes) of chunks read from upstream and sent to the client.
+PROXY_STREAMING_CHUNK_SIZE = int(os.getenv('PROXY_STREAMING_CHUNK_SIZE', 64 * 1024))
+# Decode compressed upstream content while streaming.
+PROXY_STREAMING_DECOMPRESS = ast.literal_eval(os.getenv('PROXY_STREAMING_DECOMPRESS', 'True'))
+
+# Layer download archives are cached here (defaults to a temporary directory), until the
+# layer changes or they are older than DOWNLOAD_ARCHIVE_CACHE_TTL seconds (set to '' to disable caching).
+DOWNLOAD_ARCHIVE_CACHE_DIR = os.getenv('DOWNLOAD_ARCHIVE_CACHE_DIR', None)
+DOWNLOAD_ARCHIVE_CACHE_TTL = int(os.getenv('DOWNLOAD_ARCHIVE_CACHE_TTL', 24 * 3600))
+# Max number of remote styles and metadata fetched concurrently for a download archive
+DOWNLOAD_ARCHIVE_WORKERS = int(os.getenv('DOWNLOAD_ARCHIVE_WORKERS', 4))
+
 # Haystack Search Backend Configuration. To enable,
 # first install the following:
 # - pip install django-haystack
@@ -1096,7 +1128,11 @@ if HAYSTACK_SEARCH:
             'INDEX_NAME': os.getenv('HAYSTACK_ENGINE_INDEX_NAME', 'haystack'),
         },
     }
-    HAYSTACK_SIGNAL_PROCESSOR = 'haystack.signals.RealtimeSignalProcessor'
+    # Saves and deletes are queued and indexed in batches by a celery task
+    HAYSTACK_SIGNAL_PROCESSOR = 'geonode.base.search.QueuedSignalProcessor'
+    # Seconds to wait for further changes before flushing the queue
+    HAYSTACK_QUEUE_DEBOUNCE = int(os.getenv('HAYSTACK_QUEUE_DEBOUNCE', '10'))
+    HAYSTACK_QUEUE_BATCH_SIZE = int(os.getenv('HAYSTACK_QUEUE_BATCH_SIZE', '200'))
     HAYSTACK_SEARCH_RESULTS_PER_PAGE = int(os.getenv('HAYSTACK_SEARCH_RESULTS_PER_PAGE', '200'))
 
 # Available download formats
@@ -1131,6 +1167,9 @@ DOWNLOAD_FORMATS_RASTER = [
 DISPLAY_ORIGINAL_DATASET_LINK = ast.literal_eval(
     os.getenv('DISPLAY_ORIGINAL_DATASET_LINK', 'True'))
 
+# Max number of resources whose computed default links are kept in memory
+RESOURCE_LINKS_CACHE_SIZE = int(os.getenv('RESOURCE_LINKS_CACHE_SIZE', '1000'))
+
 ACCOUNT_NOTIFY_ON_PASSWORD_CHANGE = ast.literal_eval(
     os.getenv('ACCOUNT_NOTIFY_ON_PASSWORD_CHANGE', 'False'))
 
@@ -1205,6 +1244,21 @@ MONITORING_DATA_TTL = timedelta(days=int(os.getenv("MONITORING_DATA_TTL", 7)))
 # use with caution - for dev purpose only
 MONITORING_DISABLE_CSRF = ast.literal_eval(os.environ.get('MONITORING_DISABLE_CSRF', 'False'))
 
+# write request events from a background thread, in batches, instead of
+# inside the request/response cycle (tests write synchronously)
+MONITORING_ASYNC_WRITES = ast.literal_eval(os.getenv('MONITORING_ASYNC_WRITES', str(not TEST)))
+# max number of events waiting to be written; new events are dropped when full
+MONITORING_QUEUE_SIZE = int(os.getenv('MONITORING_QUEUE_SIZE', 10000))
+# pending events are flushed every MONITORING_FLUSH_SIZE events
+# or every MONITORING_FLUSH_INTERVAL milliseconds
+MONITORING_FLUSH_SIZE = int(os.getenv('MONITORING_FLUSH_SIZE', 100))
+MONITORING_FLUSH_INTERVAL = int(os.getenv('MONITORING_FLUSH_INTERVAL', 500))
+# days of partitions created in advance for monitoring tables converted
+# with the partition_monitoring_data command (PostgreSQL 11+)
+MONITORING_PARTITIONS_AHEAD = int(os.getenv('MONITORING_PARTITIONS_AHEAD', 3))
+# max number of monitored resource ids cached in process by the ingest path
+MONITORING_RESOURCES_CACHE_SIZE = int(os.getenv('MONITORING_RESOURCES_CACHE_SIZE', 1000))
+
 if MONITORING_ENABLED:
     if 'geonode.monitoring' not in INSTALLED_APPS:
         INSTALLED_APPS += ('geonode.monitoring',)
@@ -1234,10 +1288,21 @@ if MONITORING_ENABLED:
         (timedelta(days=14), timedelta(days=1),),
     )
 
+    # resolutions of pre-aggregated metric rollups maintained by the collector,
+    # dashboard queries read from the coarsest one matching requested interval
+    MONITORING_DATA_ROLLUPS = (
+        timedelta(minutes=1),
+        timedelta(hours=1),
+        timedelta(days=1),
+    )
+
 USER_ANALYTICS_ENABLED = ast.literal_eval(os.getenv('USER_ANALYTICS_ENABLED', 'False'))
 GEOIP_PATH = os.getenv('GEOIP_PATH', os.path.join(PROJECT_ROOT, 'GeoIPCities.dat'))
 # -- END Settings for MONITORING plugin
 
+# Seconds search facets counts are cached for, 0 disables caching
+FACETS_CACHE_TTL = int(os.getenv('FACETS_CACHE_TTL', 60))
+
 CACHES = {
     # DUMMY CACHE FOR DEVELOPMENT
     'default': {
@@ -1720,8 +1785,18 @@ if USE_GEOSERVER:
 #          'schedule': crontab(hour=16, day_of_week=5),
 #     },
 # }
+CELERY_BEAT_SCHEDULE = {
+    'probe_services': {
+        'task': 'geonode.services.tasks.probe_services',
+        'schedule': float(SERVICES_PROBE_INTERVAL),
+    },
+}
 
 DELAYED_SECURITY_SIGNALS = ast.literal_eval(os.environ.get('DELAYED_SECURITY_SIGNALS', 'False'))
+# Max number of concurrent GeoFence REST calls issued while synchronizing layer rules
+GEOFENCE_SYNC_WORKERS = int(os.environ.get('GEOFENCE_SYNC_WORKERS', '4'))
+# Number of dirty resources claimed at once by sync_resources_with_guardian
+SECURITY_SYNC_BATCH_SIZE = int(os.environ.get('SECURITY_SYNC_BATCH_SIZE', '100'))
 CELERY_ENABLE_UTC = True
 CELERY_TIMEZONE = TIME_ZONE
 
@@ -1886,6 +1961,11 @@ INVITATIONS_ADAPTER = ACCOUNT_ADAPTER
 THUMBNAIL_GENERATOR = "geonode.layers.utils.create_gs_thumbnail_geonode"
 #THUMBNAIL_GENERATOR_DEFAULT_BG = r"http://a.tile.openstreetmap.org/{z}/{x}/{y}.png"
 THUMBNAIL_GENERATOR_DEFAULT_BG = r"https://maps.wikimedia.org/osm-intl/{z}/{x}/{y}.png"
+# Thumbnail tiles are fetched by THUMBNAIL_TILE_WORKERS concurrent requests,
+# background tiles are cached on disk (defaults to a temporary directory)
+THUMBNAIL_TILE_CACHE_DIR = os.getenv('THUMBNAIL_TILE_CACHE_DIR', None)
+THUMBNAIL_TILE_WORKERS = int(os.getenv('THUMBNAIL_TILE_WORKERS', 8))
+THUMBNAIL_TILE_TIMEOUT = int(os.getenv('THUMBNAIL_TILE_TIMEOUT', 10))
 
 # define the urls after the settings are overridden
 if USE_GEOSERVER:
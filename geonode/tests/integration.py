@@ -255,7 +255,7 @@ class GeoNodeMapTest(GeoNodeLiveTestSupport):
         uploaded = file_upload(filename)
         try:
             wcs_link = False
-            for link in uploaded.link_set.all():
+            for link in uploaded.get_links().all():
                 if link.mime == 'image/tiff':
                     wcs_link = True
             self.assertTrue(wcs_link)
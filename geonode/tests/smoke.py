@@ -276,6 +276,22 @@ class GeoNodeUtilsTests(GeoNodeBaseTestSupport):
         self.assertEqual(keywords[1], "beta gamma")
         self.assertEqual(keywords[2], "delta")
 
+    def test_http_session_registry(self):
+        from geonode.utils import HttpSessionRegistry
+        registry = HttpSessionRegistry()
+        session = registry.get_session('http://Localhost:8080/geoserver/rest/layers.json')
+        # one session (and connection pool) per scheme+host
+        self.assertIs(registry.get_session('http://localhost:8080/geoserver/wms'), session)
+        self.assertIsNot(registry.get_session('https://localhost:8080/geoserver/wms'), session)
+        self.assertIsNot(registry.get_session('http://localhost:8000/'), session)
+        adapter = session.get_adapter('http://localhost:8080/geoserver/wms')
+        self.assertEqual(adapter._pool_maxsize, 10)
+        self.assertEqual(
+            registry.stats()['http://localhost:8080'],
+            {'requests': 0, 'connections': 0, 'reused': 0, 'waits': 0})
+        registry.clear()
+        self.assertEqual(registry.stats(), {})
+
 
 class PermissionViewTests(GeoNodeBaseTestSupport):
 
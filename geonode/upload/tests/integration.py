@@ -465,13 +465,9 @@ class TestUpload(UploaderBase):
                 "No 'original' and 'metadata' links have been found"
             )
             # Check original links in csw_anytext
-            _post_migrate_links_orig = Link.objects.filter(
-                resource=test_layer.resourcebase_ptr,
-                resource_id=test_layer.resourcebase_ptr.id,
-                link_type='original'
-            )
+            _post_migrate_links_orig = test_layer.get_links().original()
             self.assertTrue(
-                _post_migrate_links_orig.count() > 0,
+                len(_post_migrate_links_orig) > 0,
                 "No 'original' links has been found for the layer '{}'".format(
                     test_layer.alternate
                 )
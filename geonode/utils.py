@@ -21,6 +21,8 @@ import os
 import gc
 import re
 import six
+import zlib
+import struct
 import ast
 import copy
 import time
@@ -36,16 +38,21 @@ import datetime
 import requests
 import tempfile
 import urlparse
+import cookielib
+import threading
 import traceback
 import subprocess
 
 from osgeo import ogr
 from slugify import slugify
 from StringIO import StringIO
+from binascii import crc32
 from contextlib import closing
 from math import atan, exp, log, pi, sin, tan, floor
-from zipfile import ZipFile, is_zipfile, ZIP_DEFLATED
+from zipfile import ZipFile, ZipInfo, is_zipfile, ZIP_DEFLATED
 from requests.packages.urllib3.util.retry import Retry
+from requests.packages.urllib3.poolmanager import PoolManager
+from requests.packages.urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 
 from django.conf import settings
 from django.core.cache import cache
@@ -469,6 +476,23 @@ def layer_from_viewer_config(map_id, model, layer, source, ordering, save_map=Tr
     return _model
 
 
+def disable_hidden_layers(layers_config, resources, user):
+    """
+    Disable the layers of a viewer configuration whose resource cannot be
+    viewed by user, checking the permissions of all layers at once.
+    """
+    resource_ids = set(resource for resource in resources if resource)
+    if user is None or not resource_ids:
+        return
+    from guardian.shortcuts import get_objects_for_user
+    viewable = set(get_objects_for_user(user, 'base.view_resourcebase').filter(
+        id__in=resource_ids).values_list('id', flat=True))
+    for cfg, resource in zip(layers_config, resources):
+        if resource and resource not in viewable:
+            cfg['disabled'] = True
+            cfg['visibility'] = False
+
+
 class GXPMapBase(object):
 
     def viewer_json(self, request, *added_layers):
@@ -487,14 +511,49 @@ class GXPMapBase(object):
         if access_token and not access_token.is_expired():
             access_token = access_token.token
 
+        # The configuration does not depend on the user, apart from the
+        # layers it cannot see which are disabled on each request
+        cache_key = None
+        compiled = None
         if self.id and len(added_layers) == 0:
-            cfg = cache.get("viewer_json_" +
-                            str(self.id) +
-                            "_" +
-                            str(0 if user is None else user.id))
-            if cfg is not None:
-                return cfg
+            cache_key = self.viewer_json_cache_key()
+            if cache_key:
+                compiled = cache.get(cache_key)
+        if compiled is None:
+            compiled = self.compile_viewer_json(access_token, *added_layers)
+            if cache_key:
+                cache.set(cache_key, compiled, None)
+
+        config, resources = copy.deepcopy(compiled)
+        disable_hidden_layers(config["map"]["layers"], resources, user)
+
+        # Client conversion if needed
+        from geonode.client.hooks import hookset
+        config = hookset.viewer_json(config, context={'request': request})
+        return config
+
+    def viewer_json_cache_key(self):
+        """
+        Return the key caching the compiled configuration, or None if it is
+        not cached.
+        """
+        return None
 
+    def layers_config(self, layers):
+        """
+        Return the configuration of each layer, and the id of the resource
+        a user must be allowed to view for the layer to be enabled, if any.
+        """
+        return [(layer.layer_config(), None) for layer in layers]
+
+    def compile_viewer_json(self, access_token, *added_layers):
+        """
+        Build the configuration returned by ``viewer_json``, before the
+        layers hidden to the user are disabled.
+
+        Returns a (config, resources) tuple, resources being the ids of
+        the resources of the layers in config.
+        """
         layers = list(self.layers)
         layers.extend(added_layers)
 
@@ -530,13 +589,11 @@ class GXPMapBase(object):
                     return k
             return None
 
-        def layer_config(l, user=None):
-            cfg = l.layer_config(user=user)
-            src_cfg = l.source_config(access_token)
-            source = source_lookup(src_cfg)
-            if source:
-                cfg["source"] = source
-            return cfg
+        layers_config = self.layers_config(layers)
+        for (cfg, resource), src_cfg in zip(layers_config, configs):
+            source_id = source_lookup(src_cfg)
+            if source_id:
+                cfg["source"] = source_id
 
         source_urls = [source['url']
                        for source in sources.values() if source and 'url' in source]
@@ -594,34 +651,25 @@ class GXPMapBase(object):
             'defaultSourceType': "gxp_wmscsource",
             'sources': sources,
             'map': {
-                'layers': [layer_config(l, user=user) for l in layers],
+                'layers': [cfg for cfg, resource in layers_config],
                 'center': [self.center_x, self.center_y],
                 'projection': self.projection,
                 'zoom': self.zoom
             }
         }
 
+        resources = [resource for cfg, resource in layers_config]
         if any(layers):
             # Mark the last added layer as selected - important for data page
             config["map"]["layers"][len(layers) - 1]["selected"] = True
         else:
             (def_map_config, def_map_layers) = default_map_config(None)
             config = def_map_config
-            layers = def_map_layers
+            resources = [None] * len(config["map"]["layers"])
 
         config["map"].update(_get_viewer_projection_info(self.projection))
 
-        # Create user-specific cache of maplayer config
-        if self is not None:
-            cache.set("viewer_json_" +
-                      str(self.id) +
-                      "_" +
-                      str(0 if user is None else user.id), config)
-
-        # Client conversion if needed
-        from geonode.client.hooks import hookset
-        config = hookset.viewer_json(config, context={'request': request})
-        return config
+        return config, resources
 
 
 class GXPMap(GXPMapBase):
@@ -1350,6 +1398,166 @@ def check_ogc_backend(backend_package):
     return False
 
 
+class _NoCookiesPolicy(cookielib.DefaultCookiePolicy):
+    """
+    Shared sessions must not carry cookies between unrelated requests
+    """
+
+    def set_ok(self, cookie, request):
+        return False
+
+
+class HttpPoolStats(object):
+    """
+    Thread-safe connection pool counters for one scheme+host
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.waits = 0
+
+    def incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def as_dict(self):
+        with self._lock:
+            return {'requests': self.requests,
+                    'connections': self.connections,
+                    'reused': max(self.requests - self.connections, 0),
+                    'waits': self.waits}
+
+
+class _StatsPoolMixin(object):
+    stats = None
+
+    def _new_conn(self):
+        if self.stats:
+            self.stats.incr('connections')
+        return super(_StatsPoolMixin, self)._new_conn()
+
+    def _get_conn(self, timeout=None):
+        if self.stats:
+            self.stats.incr('requests')
+            # all connections are checked out: either wait for one (when
+            # the pool blocks) or open one over the per-host limit
+            if self.pool is not None and self.pool.empty():
+                self.stats.incr('waits')
+        return super(_StatsPoolMixin, self)._get_conn(timeout=timeout)
+
+
+class _StatsHTTPConnectionPool(_StatsPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _StatsHTTPSConnectionPool(_StatsPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class _StatsPoolManager(PoolManager):
+
+    def __init__(self, stats, *args, **kwargs):
+        super(_StatsPoolManager, self).__init__(*args, **kwargs)
+        self.stats = stats
+        self.pool_classes_by_scheme = {'http': _StatsHTTPConnectionPool,
+                                       'https': _StatsHTTPSConnectionPool}
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool = super(_StatsPoolManager, self)._new_pool(scheme, host, port, request_context=request_context)
+        pool.stats = self.stats
+        return pool
+
+
+class PooledHTTPAdapter(requests.adapters.HTTPAdapter):
+    """
+    HTTPAdapter which reports its connection pool usage to HttpPoolStats
+    """
+
+    def __init__(self, stats, *args, **kwargs):
+        self.stats = stats
+        super(PooledHTTPAdapter, self).__init__(*args, **kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = _StatsPoolManager(self.stats, num_pools=connections, maxsize=maxsize,
+                                             block=block, strict=True, **pool_kwargs)
+
+
+class HttpSessionRegistry(object):
+    """
+    Process-wide registry of keep-alive HTTP sessions, one per scheme+host
+    (and retries policy), shared by all threads.
+
+    Each session keeps at most ``pool_maxsize`` connections open to its host,
+    and records pool usage which can be read with ``stats()``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._stats = {}
+
+    @staticmethod
+    def get_base_url(url):
+        parts = urlparse.urlsplit(url)
+        return '{}://{}'.format(parts.scheme.lower(), parts.netloc.lower())
+
+    def get_session(self, url, retries=5, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504),
+                    pool_maxsize=10, pool_block=False):
+        base_url = self.get_base_url(url)
+        key = (base_url, retries,)
+        session = self._sessions.get(key)
+        if session is not None:
+            return session
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                stats = self._stats.setdefault(base_url, HttpPoolStats())
+                retry = Retry(
+                    total=retries,
+                    read=retries,
+                    connect=retries,
+                    backoff_factor=backoff_factor,
+                    status_forcelist=status_forcelist,
+                )
+                adapter = PooledHTTPAdapter(
+                    stats,
+                    max_retries=retry,
+                    pool_maxsize=pool_maxsize,
+                    pool_connections=1,
+                    pool_block=pool_block
+                )
+                session = requests.Session()
+                session.cookies.set_policy(_NoCookiesPolicy())
+                session.mount(base_url, adapter)
+                session.verify = False
+                self._sessions[key] = session
+        return session
+
+    def stats(self):
+        """
+        Returns pool counters (requests, connections, reused, waits) per scheme+host
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        return dict((base_url, s.as_dict()) for base_url, s in stats.items())
+
+    def clear(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions = {}
+            self._stats = {}
+        for session in sessions:
+            session.close()
+
+
+http_sessions = HttpSessionRegistry()
+
+
 class HttpClient(object):
 
     def __init__(self):
@@ -1358,6 +1566,7 @@ class HttpClient(object):
         self.pool_maxsize = 10
         self.backoff_factor = 0.3
         self.pool_connections = 10
+        self.pool_block = False
         self.status_forcelist = (500, 502, 503, 504)
         self.username = 'admin'
         self.password = 'admin'
@@ -1370,6 +1579,7 @@ class HttpClient(object):
             self.pool_maxsize = ogc_server_settings['POOL_MAXSIZE'] if 'POOL_MAXSIZE' in ogc_server_settings else 10
             self.pool_connections = ogc_server_settings['POOL_CONNECTIONS'] if \
             'POOL_CONNECTIONS' in ogc_server_settings else 10
+            self.pool_block = ogc_server_settings['POOL_BLOCK'] if 'POOL_BLOCK' in ogc_server_settings else False
             self.username = ogc_server_settings['USER'] if 'USER' in ogc_server_settings else 'admin'
             self.password = ogc_server_settings['PASSWORD'] if 'PASSWORD' in ogc_server_settings else 'geoserver'
 
@@ -1395,21 +1605,13 @@ class HttpClient(object):
 
         response = None
         content = None
-        session = requests.Session()
-        retry = Retry(
-            total=retries or self.retries,
-            read=retries or self.retries,
-            connect=retries or self.retries,
+        session = http_sessions.get_session(
+            url,
+            retries=retries or self.retries,
             backoff_factor=self.backoff_factor,
             status_forcelist=self.status_forcelist,
-        )
-        adapter = requests.adapters.HTTPAdapter(
-            max_retries=retry,
             pool_maxsize=self.pool_maxsize,
-            pool_connections=self.pool_connections
-        )
-        session.mount("{scheme}://".format(scheme=urlparse.urlsplit(url).scheme), adapter)
-        session.verify = False
+            pool_block=self.pool_block)
         action = getattr(session, method.lower(), None)
         if action:
             response = action(
@@ -1428,6 +1630,9 @@ class HttpClient(object):
 
         return (response, content)
 
+    def get_pool_stats(self):
+        return http_sessions.stats()
+
     def get(self, url, data=None, headers={}, stream=False, timeout=None, user=None):
         return self.request(url,
                             method='GET',
@@ -1470,6 +1675,82 @@ def zip_dir(basedir, archivename):
                 z.write(absfn, zfn)
 
 
+class _ZipStreamBuffer(object):
+    """
+    Write-only file-like object, collecting data written by ZipFile
+    and keeping track of the position in the archive
+    """
+
+    def __init__(self):
+        self.data = []
+        self.position = 0
+
+    def write(self, data):
+        self.data.append(data)
+        self.position += len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = ''.join(self.data)
+        self.data = []
+        return data
+
+
+def stream_zip(entries, chunk_size=64 * 1024):
+    """
+    Yields a ZIP archive in chunks, while it's being built, without
+    a temporary file. ``entries`` is an iterable of (archive name, content)
+    pairs, where content is a string or a file-like object which is read
+    (and closed) chunk by chunk.
+    """
+    buf = _ZipStreamBuffer()
+    with closing(ZipFile(buf, "w", ZIP_DEFLATED, allowZip64=True)) as z:
+        for arcname, content in entries:
+            if not hasattr(content, 'read'):
+                if isinstance(content, unicode):
+                    content = content.encode('utf-8')
+                z.writestr(arcname, content)
+                yield buf.pop()
+                continue
+
+            # file sizes and CRC are not known before the content is read,
+            # so they are written after data, in data descriptor
+            zinfo = ZipInfo(arcname, date_time=time.localtime(time.time())[:6])
+            zinfo.compress_type = ZIP_DEFLATED
+            zinfo.external_attr = 0o644 << 16
+            zinfo.flag_bits |= 0x08
+            zinfo.file_size = zinfo.compress_size = zinfo.CRC = 0
+            zinfo.header_offset = buf.tell()
+            buf.write(zinfo.FileHeader(zip64=True))
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+            try:
+                while True:
+                    data = content.read(chunk_size)
+                    if not data:
+                        break
+                    zinfo.file_size += len(data)
+                    zinfo.CRC = crc32(data, zinfo.CRC) & 0xffffffff
+                    data = compressor.compress(data)
+                    zinfo.compress_size += len(data)
+                    buf.write(data)
+                    yield buf.pop()
+            finally:
+                content.close()
+            data = compressor.flush()
+            zinfo.compress_size += len(data)
+            buf.write(data)
+            buf.write(struct.pack('<LLQQ', 0x08074b50, zinfo.CRC, zinfo.compress_size, zinfo.file_size))
+            z.filelist.append(zinfo)
+            z.NameToInfo[zinfo.filename] = zinfo
+            yield buf.pop()
+    yield buf.pop()
+
+
 def copy_tree(src, dst, symlinks=False, ignore=None):
     try:
         for item in os.listdir(src):
@@ -1559,7 +1840,6 @@ def set_resource_default_links(instance, layer, prune=False, **kwargs):
     from geonode.base.models import Link
     from urlparse import urljoin
     from django.core.urlresolvers import reverse
-    from django.utils.translation import ugettext
 
     # Prune old links
     if prune:
@@ -1570,172 +1850,19 @@ def set_resource_default_links(instance, layer, prune=False, **kwargs):
         logger.info(" -- Resource Links[Prune old links]...done!")
 
     if check_ogc_backend(geoserver.BACKEND_PACKAGE):
-        from geonode.geoserver.ows import wcs_links, wfs_links, wms_links
-        from geonode.geoserver.helpers import ogc_server_settings, gs_catalog
-
-        # Compute parameters for the new links
-        logger.info(" -- Resource Links[Compute parameters for the new links]...")
-        height = 550
-        width = 550
-
-        # Parse Layer BBOX and SRID
-        bbox = None
-        srid = instance.srid if instance.srid else getattr(settings, 'DEFAULT_MAP_CRS', 'EPSG:4326')
-        if instance.srid and instance.bbox_x0:
-            bbox = ','.join(str(x) for x in [instance.bbox_x0, instance.bbox_y0,
-                                             instance.bbox_x1, instance.bbox_y1])
-        else:
-            try:
-                gs_resource = gs_catalog.get_resource(
-                    name=instance.name,
-                    workspace=instance.workspace)
-                if not gs_resource:
-                    gs_resource = gs_catalog.get_resource(name=instance.name)
-                bbox = gs_resource.native_bbox
-
-                dx = float(bbox[1]) - float(bbox[0])
-                dy = float(bbox[3]) - float(bbox[2])
-                dataAspect = 1 if dy == 0 else dx / dy
-                width = int(height * dataAspect)
-
-                srid = bbox[4]
-                bbox = ','.join(str(x) for x in [bbox[0], bbox[2], bbox[1], bbox[3]])
-            except BaseException as e:
-                logger.exception(e)
-
-        # Create Raw Data download link
-        if settings.DISPLAY_ORIGINAL_DATASET_LINK:
-            logger.info(" -- Resource Links[Create Raw Data download link]...")
-            download_url = urljoin(settings.SITEURL,
-                                   reverse('download', args=[instance.id]))
-            Link.objects.update_or_create(
-                resource=instance.resourcebase_ptr,
-                url=download_url,
-                defaults=dict(
-                    extension='zip',
-                    name='Original Dataset',
-                    mime='application/octet-stream',
-                    link_type='original',
-                )
-            )
-            logger.info(" -- Resource Links[Create Raw Data download link]...done!")
-        else:
-            Link.objects.filter(resource=instance.resourcebase_ptr,
-                                name='Original Dataset').delete()
-
-        # Set download links for WMS, WCS or WFS and KML
-        logger.info(" -- Resource Links[Set download links for WMS, WCS or WFS and KML]...")
-        links = wms_links(ogc_server_settings.public_url + 'ows?',
-                          instance.alternate.encode('utf-8'),
-                          bbox,
-                          srid,
-                          height,
-                          width)
-
-        for ext, name, mime, wms_url in links:
-            try:
-                Link.objects.update_or_create(
-                    resource=instance.resourcebase_ptr,
-                    name=ugettext(name),
-                    defaults=dict(
-                        extension=ext,
-                        url=wms_url,
-                        mime=mime,
-                        link_type='image',
-                    )
-                )
-            except Link.MultipleObjectsReturned:
-                _d = dict(extension=ext,
-                          url=wms_url,
-                          mime=mime,
-                          link_type='image')
-                Link.objects.filter(resource=instance.resourcebase_ptr,
-                                    name=ugettext(name),
-                                    link_type='image').update(**_d)
-
-        if instance.storeType == "dataStore":
-            links = wfs_links(ogc_server_settings.public_url + 'ows?',
-                              instance.alternate.encode('utf-8'),
-                              bbox=None,  # bbox filter should be set at runtime otherwise conflicting with CQL
-                              srid=srid)
-            for ext, name, mime, wfs_url in links:
-                if mime == 'SHAPE-ZIP':
-                    name = 'Zipped Shapefile'
-                if (Link.objects.filter(resource=instance.resourcebase_ptr,
-                                        url=wfs_url,
-                                        name=name).count() < 2):
-                    Link.objects.update_or_create(
-                        resource=instance.resourcebase_ptr,
-                        url=wfs_url,
-                        name=name,
-                        link_type='data',
-                        defaults=dict(
-                            extension=ext,
-                            mime=mime,
-                        )
-                    )
-
-        elif instance.storeType == 'coverageStore':
-            links = wcs_links(ogc_server_settings.public_url + 'wcs?',
-                              instance.alternate.encode('utf-8'),
-                              bbox,
-                              srid)
-
-        for ext, name, mime, wcs_url in links:
-            if (Link.objects.filter(resource=instance.resourcebase_ptr,
-                                    url=wcs_url,
-                                    name=name).count() < 2):
-                Link.objects.update_or_create(
-                    resource=instance.resourcebase_ptr,
-                    url=wcs_url,
-                    name=name,
-                    link_type='data',
-                    defaults=dict(
-                        extension=ext,
-                        mime=mime,
-                    )
-                )
-
-        site_url = settings.SITEURL.rstrip('/') if settings.SITEURL.startswith('http') else settings.SITEURL
-        html_link_url = '%s%s' % (
-            site_url, instance.get_absolute_url())
-
-        if (Link.objects.filter(resource=instance.resourcebase_ptr,
-                                url=html_link_url,
-                                name=instance.alternate).count() < 2):
-            Link.objects.update_or_create(
-                resource=instance.resourcebase_ptr,
-                url=html_link_url,
-                name=instance.alternate,
-                link_type='html',
-                defaults=dict(
-                    extension='html',
-                    mime='text/html',
-                )
-            )
-        logger.info(" -- Resource Links[Set download links for WMS, WCS or WFS and KML]...done!")
-
-        # Legend link
-        logger.info(" -- Resource Links[Legend link]...")
-        for style in instance.styles.all():
-            legend_url = ogc_server_settings.PUBLIC_LOCATION + \
-                'ows?service=WMS&request=GetLegendGraphic&format=image/png&WIDTH=20&HEIGHT=20&LAYER=' + \
-                instance.alternate + '&STYLE=' + style.name + \
-                '&legend_options=fontAntiAliasing:true;fontSize:12;forceLabels:on'
-
-            if Link.objects.filter(resource=instance.resourcebase_ptr, url=legend_url).count() < 2:
-                Link.objects.update_or_create(
-                    resource=instance.resourcebase_ptr,
-                    name='Legend',
-                    url=legend_url,
-                    defaults=dict(
-                        extension='png',
-                        url=legend_url,
-                        mime='image/png',
-                        link_type='image',
-                    )
-                )
-        logger.info(" -- Resource Links[Legend link]...done!")
+        from geonode.base.links import get_default_links
+        from geonode.geoserver.links import GEOSERVER_LINK_TYPES
+
+        # Default links are computed on demand by the GeoServer link provider,
+        # drop the persisted rows they replace.
+        logger.info(" -- Resource Links[Drop persisted default links]...")
+        _computed = set((link.link_type, link.name) for link in get_default_links(instance))
+        for link in Link.objects.filter(resource=instance.resourcebase_ptr,
+                                        link_type__in=GEOSERVER_LINK_TYPES):
+            if (link.link_type, link.name) in _computed or \
+                    (link.name == 'Original Dataset' and not settings.DISPLAY_ORIGINAL_DATASET_LINK):
+                link.delete()
+        logger.info(" -- Resource Links[Drop persisted default links]...done!")
 
         # Thumbnail link
         logger.info(" -- Resource Links[Thumbnail link]...")
@@ -1755,61 +1882,6 @@ def set_resource_default_links(instance, layer, prune=False, **kwargs):
                 )
             )
         logger.info(" -- Resource Links[Thumbnail link]...done!")
-
-        logger.info(" -- Resource Links[OWS Links]...")
-        # ogc_wms_path = '%s/ows' % instance.workspace
-        ogc_wms_path = 'ows'
-        ogc_wms_url = urljoin(ogc_server_settings.public_url, ogc_wms_path)
-        ogc_wms_name = 'OGC WMS: %s Service' % instance.workspace
-        if Link.objects.filter(resource=instance.resourcebase_ptr, name=ogc_wms_name, url=ogc_wms_url).count() < 2:
-            Link.objects.get_or_create(
-                resource=instance.resourcebase_ptr,
-                url=ogc_wms_url,
-                name=ogc_wms_name,
-                defaults=dict(
-                    extension='html',
-                    url=ogc_wms_url,
-                    mime='text/html',
-                    link_type='OGC:WMS',
-                )
-            )
-
-        if instance.storeType == "dataStore":
-            # ogc_wfs_path = '%s/wfs' % instance.workspace
-            ogc_wfs_path = 'ows'
-            ogc_wfs_url = urljoin(ogc_server_settings.public_url, ogc_wfs_path)
-            ogc_wfs_name = 'OGC WFS: %s Service' % instance.workspace
-            if Link.objects.filter(resource=instance.resourcebase_ptr, name=ogc_wfs_name, url=ogc_wfs_url).count() < 2:
-                Link.objects.get_or_create(
-                    resource=instance.resourcebase_ptr,
-                    url=ogc_wfs_url,
-                    name=ogc_wfs_name,
-                    defaults=dict(
-                        extension='html',
-                        url=ogc_wfs_url,
-                        mime='text/html',
-                        link_type='OGC:WFS',
-                    )
-                )
-
-        if instance.storeType == "coverageStore":
-            # ogc_wcs_path = '%s/wcs' % instance.workspace
-            ogc_wcs_path = 'ows'
-            ogc_wcs_url = urljoin(ogc_server_settings.public_url, ogc_wcs_path)
-            ogc_wcs_name = 'OGC WCS: %s Service' % instance.workspace
-            if Link.objects.filter(resource=instance.resourcebase_ptr, name=ogc_wcs_name, url=ogc_wcs_url).count() < 2:
-                Link.objects.get_or_create(
-                    resource=instance.resourcebase_ptr,
-                    url=ogc_wcs_url,
-                    name=ogc_wcs_name,
-                    defaults=dict(
-                        extension='html',
-                        url=ogc_wcs_url,
-                        mime='text/html',
-                        link_type='OGC:WCS',
-                    )
-                )
-        logger.info(" -- Resource Links[OWS Links]...done!")
     elif check_ogc_backend(qgis_server.BACKEND_PACKAGE):
         from geonode.layers.models import LayerFile
         from geonode.qgis_server.helpers import (